@@ -9,6 +9,7 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
+import time
 
 class Base(DeclarativeBase):
     pass
@@ -25,6 +26,7 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 def create_app():
+    started = time.monotonic()
     app = Flask(__name__)
     app.secret_key = os.environ.get("FLASK_SECRET_KEY") or os.urandom(24)
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
@@ -46,10 +48,87 @@ def create_app():
     app.config['UPLOAD_CHUNK_SIZE'] = 1024 * 1024  # 1MB chunks
     app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
     app.config['TEMP_FOLDER'] = os.path.join(os.getcwd(), 'uploads', 'temp')
+    # Decoded mono 16kHz WAVs shared by the audio stages, evicted least recently used first
+    app.config['AUDIO_CACHE_FOLDER'] = os.environ.get('AUDIO_CACHE_FOLDER', os.path.join(os.getcwd(), 'uploads', 'cache', 'audio'))
+    app.config['AUDIO_CACHE_MAX_BYTES'] = int(os.environ.get('AUDIO_CACHE_MAX_BYTES', 5 * 1024 * 1024 * 1024))
+    # Diarization clustering backend: sample (default), segment, minibatch or dbscan.
+    # A larger sample size is more accurate but slower
+    app.config['DIARIZATION_METHOD'] = os.environ.get('DIARIZATION_METHOD', 'sample')
+    app.config['DIARIZATION_MAX_SPEAKERS'] = int(os.environ.get('DIARIZATION_MAX_SPEAKERS', 8))
+    app.config['DIARIZATION_SAMPLE_SIZE'] = int(os.environ.get('DIARIZATION_SAMPLE_SIZE', 2000))
+    # Long audio is transcribed in silence-delimited segments recognized in parallel
+    app.config['TRANSCRIPTION_SEGMENT_SECONDS'] = float(os.environ.get('TRANSCRIPTION_SEGMENT_SECONDS', 30))
+    app.config['TRANSCRIPTION_CONCURRENCY'] = int(os.environ.get('TRANSCRIPTION_CONCURRENCY', 4))
+    app.config['TRANSCRIPTION_RETRIES'] = int(os.environ.get('TRANSCRIPTION_RETRIES', 3))
+    # Speech recognizer: google (network), local (offline PocketSphinx) or fake (deterministic, for load tests)
+    app.config['ASR_BACKEND'] = os.environ.get('ASR_BACKEND', 'google')
+    app.config['ASR_BACKEND_OPTIONS'] = {'language': os.environ.get('ASR_LANGUAGE', 'en-US')}
+    if app.config['ASR_BACKEND'] == 'fake':
+        app.config['ASR_BACKEND_OPTIONS']['latency'] = float(os.environ.get('ASR_FAKE_LATENCY', 0))
+    # Transcription pool processes; defaults to what the backend declares
+    app.config['ASR_WORKER_PROCESSES'] = int(os.environ['ASR_WORKER_PROCESSES']) if os.environ.get('ASR_WORKER_PROCESSES') else None
+    # Entity extraction from concurrently running jobs is batched through nlp.pipe
+    app.config['NER_BATCH_SIZE'] = int(os.environ.get('NER_BATCH_SIZE', 64))
+    app.config['NER_BATCH_WAIT_SECONDS'] = float(os.environ.get('NER_BATCH_WAIT_SECONDS', 0.05))
+    app.config['NER_PROCESSES'] = int(os.environ.get('NER_PROCESSES', 1))
+    # Models each processing pool process loads at startup (comma separated, empty for none);
+    # everything else is loaded lazily on first use
+    app.config['PROCESSING_WARM_MODELS'] = [name for name in os.environ.get('PROCESSING_WARM_MODELS', 'sentiment,ner').split(',') if name]
+    # Startup must stay fast and free of sklearn/spaCy/pydub; strict mode fails startup instead of warning
+    app.config['IMPORT_BUDGET_SECONDS'] = float(os.environ.get('IMPORT_BUDGET_SECONDS', 2.0))
+    app.config['IMPORT_BUDGET_STRICT'] = os.environ.get('IMPORT_BUDGET_STRICT', 'false').lower() == 'true'
+    # Stage results keyed by (content hash, stage, model/config version), shared by all processes;
+    # entries unused for RESULT_CACHE_MAX_AGE_DAYS or beyond the size limit are evicted
+    app.config['RESULT_CACHE_ENABLED'] = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['RESULT_CACHE_FOLDER'] = os.environ.get('RESULT_CACHE_FOLDER', os.path.join(os.getcwd(), 'uploads', 'cache', 'results'))
+    app.config['RESULT_CACHE_MAX_BYTES'] = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+    app.config['RESULT_CACHE_MAX_AGE_SECONDS'] = int(float(os.environ.get('RESULT_CACHE_MAX_AGE_DAYS', 30)) * 24 * 3600)
+    # Progress stream (/api/process/events): how often subscribers poll the event log,
+    # keepalive spacing, stream length before the client reconnects, and event retention
+    app.config['EVENTS_POLL_INTERVAL'] = float(os.environ.get('EVENTS_POLL_INTERVAL', 0.5))
+    app.config['EVENTS_HEARTBEAT_SECONDS'] = int(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15))
+    app.config['EVENTS_STREAM_SECONDS'] = int(os.environ.get('EVENTS_STREAM_SECONDS', 300))
+    app.config['EVENTS_RETRY_MS'] = int(os.environ.get('EVENTS_RETRY_MS', 3000))
+    app.config['EVENTS_RETENTION_SECONDS'] = int(os.environ.get('EVENTS_RETENTION_SECONDS', 3600))
+    # Full-text search backend: auto (postgres, else SQLite fts5, else in-process memory index)
+    app.config['SEARCH_BACKEND'] = os.environ.get('SEARCH_BACKEND', 'auto')
+    # File downloads (/api/files/<id>/content): served by this process with sendfile (direct),
+    # or handed to the front proxy with X-Sendfile (Apache/lighttpd) or X-Accel-Redirect (nginx).
+    # For x-accel, files under FILE_ACCEL_ROOT are mapped onto the internal FILE_ACCEL_PREFIX location
+    app.config['FILE_SERVE_MODE'] = os.environ.get('FILE_SERVE_MODE', 'direct')
+    app.config['USE_X_SENDFILE'] = app.config['FILE_SERVE_MODE'] == 'x-sendfile'
+    app.config['FILE_ACCEL_ROOT'] = os.environ.get('FILE_ACCEL_ROOT', os.path.join(os.getcwd(), 'uploads'))
+    app.config['FILE_ACCEL_PREFIX'] = os.environ.get('FILE_ACCEL_PREFIX', '/protected-files/')
+    app.config['FILE_CACHE_MAX_AGE'] = int(os.environ.get('FILE_CACHE_MAX_AGE', 3600))
+    # Upload temp dirs (chunks and outcome) untouched for this long are removed
+    app.config['UPLOAD_TEMP_MAX_AGE_SECONDS'] = int(float(os.environ.get('UPLOAD_TEMP_MAX_AGE_HOURS', 24)) * 3600)
+    # Let a client skip uploading content that another user already stored
+    app.config['UPLOAD_DEDUP_ACROSS_USERS'] = os.environ.get('UPLOAD_DEDUP_ACROSS_USERS', 'false').lower() == 'true'
+    # Processing queue (see utils/job_queue.py); set PROCESSING_INLINE_WORKERS=0 when
+    # running dedicated `python worker.py` processes instead
+    # PROCESSING_POOL_SIZE bounds concurrent CPU-bound stages per process (0 runs them inline);
+    # queue workers default to one per pool slot so the pool stays busy
+    app.config['PROCESSING_POOL_SIZE'] = int(os.environ.get('PROCESSING_POOL_SIZE', os.cpu_count() or 1))
+    app.config['PROCESSING_INLINE_WORKERS'] = int(os.environ.get('PROCESSING_INLINE_WORKERS',
+                                                                 max(app.config['PROCESSING_POOL_SIZE'], 1)))
+    app.config['PROCESSING_LEASE_SECONDS'] = int(os.environ.get('PROCESSING_LEASE_SECONDS', 300))
+    app.config['PROCESSING_MAX_ATTEMPTS'] = int(os.environ.get('PROCESSING_MAX_ATTEMPTS', 3))
+    app.config['PROCESSING_RETRY_BASE_SECONDS'] = int(os.environ.get('PROCESSING_RETRY_BASE_SECONDS', 30))
+    # Queue order is queued time + SCHEDULER_COST_WEIGHT * predicted seconds: shortest job first,
+    # with long jobs aging ahead of later work (0 is plain FIFO)
+    app.config['SCHEDULER_COST_WEIGHT'] = float(os.environ.get('SCHEDULER_COST_WEIGHT', 1.0))
+    # Fair multi-user scheduling: caps on running jobs in total and per user, and on queued jobs
+    # per user and in total, beyond which /api/process/batch answers 429 with Retry-After (0 = no limit)
+    app.config['SCHEDULER_MAX_RUNNING'] = int(os.environ.get('SCHEDULER_MAX_RUNNING', 0))
+    app.config['SCHEDULER_MAX_RUNNING_PER_USER'] = int(os.environ.get('SCHEDULER_MAX_RUNNING_PER_USER', 0))
+    app.config['SCHEDULER_MAX_QUEUED_PER_USER'] = int(os.environ.get('SCHEDULER_MAX_QUEUED_PER_USER', 10000))
+    app.config['SCHEDULER_MAX_QUEUED'] = int(os.environ.get('SCHEDULER_MAX_QUEUED', 0))
+    app.config['PROCESSING_POLL_INTERVAL'] = float(os.environ.get('PROCESSING_POLL_INTERVAL', 1))
     
     # Create upload and temp directories
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['TEMP_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['AUDIO_CACHE_FOLDER'], exist_ok=True)
     app.config["SESSION_COOKIE_SECURE"] = True
     app.config["SESSION_COOKIE_HTTPONLY"] = True
     app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)
@@ -75,15 +154,22 @@ def create_app():
 
         from routes.auth import auth_bp
         from routes.files import files_bp
-        from routes.processing import processing_bp
+        from routes.processing import processing_bp, init_websocket
+        from routes.search import search_bp
 
         app.register_blueprint(auth_bp)
         app.register_blueprint(files_bp)
         app.register_blueprint(processing_bp)
+        app.register_blueprint(search_bp)
+        # Optional WebSocket transport for the progress stream (requires flask-sock)
+        init_websocket(app)
 
         # Only register Google OAuth if credentials are configured
         if os.environ.get('GOOGLE_OAUTH_CLIENT_ID') and os.environ.get('GOOGLE_OAUTH_CLIENT_SECRET'):
             from routes.google_auth import google_bp
             app.register_blueprint(google_bp)
 
+    from utils.model_registry import check_import_budget
+    check_import_budget(app, started)
+
     return app
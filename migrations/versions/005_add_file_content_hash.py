@@ -0,0 +1,28 @@
+"""add file content hash
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Content hash of the blob a file points at, used for upload deduplication
+    try:
+        op.add_column('file', sa.Column('content_hash', sa.String(64), nullable=True))
+        op.create_index('ix_file_content_hash', 'file', ['content_hash'])
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+def downgrade():
+    op.drop_index('ix_file_content_hash')
+    op.drop_column('file', 'content_hash')
@@ -0,0 +1,57 @@
+"""add job queue fields
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Turn file_metadata rows into durable, leasable processing jobs
+    try:
+        for column in [
+            ('processing_progress', sa.Integer(), None),
+            ('attempts', sa.Integer(), '0'),
+            ('queued_at', sa.DateTime(), None),
+            ('run_after', sa.DateTime(), None),
+            ('locked_by', sa.String(64), None),
+            ('lease_expires_at', sa.DateTime(), None),
+            ('heartbeat_at', sa.DateTime(), None)
+        ]:
+            try:
+                op.add_column('file_metadata', sa.Column(
+                    column[0],
+                    column[1],
+                    nullable=column[2] is None,
+                    server_default=column[2]
+                ))
+            except Exception as e:
+                if "already exists" not in str(e):
+                    raise e
+
+        try:
+            op.create_index('ix_file_metadata_claim', 'file_metadata', ['processing_status', 'run_after'])
+        except Exception as e:
+            if "already exists" not in str(e):
+                raise e
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+def downgrade():
+    op.drop_index('ix_file_metadata_claim')
+    op.drop_column('file_metadata', 'heartbeat_at')
+    op.drop_column('file_metadata', 'lease_expires_at')
+    op.drop_column('file_metadata', 'locked_by')
+    op.drop_column('file_metadata', 'run_after')
+    op.drop_column('file_metadata', 'queued_at')
+    op.drop_column('file_metadata', 'attempts')
+    op.drop_column('file_metadata', 'processing_progress')
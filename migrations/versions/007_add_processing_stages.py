@@ -0,0 +1,26 @@
+"""add per-stage processing report
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Status and timing of each pipeline stage for the latest run
+    try:
+        op.add_column('file_metadata', sa.Column('processing_stages', sa.JSON, nullable=True))
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+def downgrade():
+    op.drop_column('file_metadata', 'processing_stages')
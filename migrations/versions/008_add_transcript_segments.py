@@ -0,0 +1,25 @@
+"""add timestamped transcript segments
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    try:
+        op.add_column('file_metadata', sa.Column('transcript_segments', sa.JSON, nullable=True))
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+def downgrade():
+    op.drop_column('file_metadata', 'transcript_segments')
@@ -0,0 +1,27 @@
+"""add sentence-level sentiment aggregates and series
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    for column in ('sentiment_summary', 'sentiment_series'):
+        try:
+            op.add_column('file_metadata', sa.Column(column, sa.JSON, nullable=True))
+        except Exception as e:
+            if "already exists" not in str(e):
+                raise e
+
+def downgrade():
+    op.drop_column('file_metadata', 'sentiment_series')
+    op.drop_column('file_metadata', 'sentiment_summary')
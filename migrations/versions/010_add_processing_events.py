@@ -0,0 +1,34 @@
+"""add processing event log for the progress stream
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    try:
+        op.create_table('processing_event',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('job_id', sa.Integer, nullable=False),
+            sa.Column('data', sa.JSON, nullable=False),
+            sa.Column('created_at', sa.DateTime, nullable=True)
+        )
+        op.create_index('ix_processing_event_job_id', 'processing_event', ['job_id'])
+        op.create_index('ix_processing_event_created_at', 'processing_event', ['created_at'])
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+def downgrade():
+    op.drop_index('ix_processing_event_created_at', table_name='processing_event')
+    op.drop_index('ix_processing_event_job_id', table_name='processing_event')
+    op.drop_table('processing_event')
@@ -0,0 +1,30 @@
+"""add indexes for paginated file listing
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    for name, table, columns in (
+        ('ix_file_user_created', 'file', ['user_id', 'created_at']),
+        ('ix_file_metadata_file_id', 'file_metadata', ['file_id']),
+    ):
+        try:
+            op.create_index(name, table, columns)
+        except Exception as e:
+            if "already exists" not in str(e):
+                raise e
+
+def downgrade():
+    op.drop_index('ix_file_metadata_file_id', table_name='file_metadata')
+    op.drop_index('ix_file_user_created', table_name='file')
@@ -0,0 +1,54 @@
+"""add full-text search index
+
+Postgres gets a search_document table with a GIN-indexed tsvector; SQLite
+gets an FTS5 virtual table. Run `flask search reindex` afterwards to index
+files processed before this migration.
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    try:
+        op.create_table('search_document',
+            sa.Column('file_id', sa.Integer, primary_key=True, autoincrement=False),
+            sa.Column('user_id', sa.Integer, nullable=False),
+            sa.Column('entity_labels', sa.String(512), nullable=True),
+            sa.Column('document', postgresql.TSVECTOR if dialect == 'postgresql' else sa.Text, nullable=True),
+            sa.Column('updated_at', sa.DateTime, nullable=True)
+        )
+        op.create_index('ix_search_document_user_id', 'search_document', ['user_id'])
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+    if dialect == 'postgresql':
+        op.execute("CREATE INDEX IF NOT EXISTS ix_search_document_document ON search_document USING GIN (document)")
+    elif dialect == 'sqlite':
+        op.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+                user_id UNINDEXED, labels, entities, transcript,
+                tokenize = 'porter unicode61'
+            )
+        """)
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_search_document_document")
+    elif dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS search_fts")
+    op.drop_index('ix_search_document_user_id', table_name='search_document')
+    op.drop_table('search_document')
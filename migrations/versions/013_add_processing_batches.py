@@ -0,0 +1,36 @@
+"""add processing batch counters
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    try:
+        op.create_table('processing_batch',
+            sa.Column('id', sa.String(36), primary_key=True),
+            sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), nullable=False),
+            sa.Column('total', sa.Integer, nullable=False, server_default='0'),
+            sa.Column('queued', sa.Integer, nullable=False, server_default='0'),
+            sa.Column('processing', sa.Integer, nullable=False, server_default='0'),
+            sa.Column('completed', sa.Integer, nullable=False, server_default='0'),
+            sa.Column('failed', sa.Integer, nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime, nullable=True)
+        )
+        op.create_index('ix_processing_batch_user_id', 'processing_batch', ['user_id'])
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+def downgrade():
+    op.drop_index('ix_processing_batch_user_id', table_name='processing_batch')
+    op.drop_table('processing_batch')
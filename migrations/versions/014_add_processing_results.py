@@ -0,0 +1,57 @@
+"""move heavy processing results into compressed tables
+
+Adds processing_result and transcript_page plus the file_metadata.result_summary
+column. Results of jobs completed earlier stay in the old inline columns and
+are still readable; run `flask processing migrate-results` to move them over.
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    try:
+        op.add_column('file_metadata', sa.Column('result_summary', sa.JSON(), nullable=True))
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+    try:
+        op.create_table('processing_result',
+            sa.Column('job_id', sa.Integer, primary_key=True, autoincrement=False),
+            sa.Column('codec', sa.String(8), nullable=False),
+            sa.Column('payload', sa.LargeBinary, nullable=False),
+            sa.Column('size', sa.Integer, nullable=False),
+            sa.Column('created_at', sa.DateTime, nullable=True)
+        )
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+    try:
+        op.create_table('transcript_page',
+            sa.Column('job_id', sa.Integer, primary_key=True, autoincrement=False),
+            sa.Column('page', sa.Integer, primary_key=True, autoincrement=False),
+            sa.Column('start_time', sa.Float, nullable=False),
+            sa.Column('end_time', sa.Float, nullable=False),
+            sa.Column('segment_count', sa.Integer, nullable=False),
+            sa.Column('codec', sa.String(8), nullable=False),
+            sa.Column('data', sa.LargeBinary, nullable=False)
+        )
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+def downgrade():
+    op.drop_table('transcript_page')
+    op.drop_table('processing_result')
+    op.drop_column('file_metadata', 'result_summary')
@@ -0,0 +1,50 @@
+"""add probed media columns and cost-based job scheduling
+
+Jobs already waiting get schedule key 0 so they run before anything queued
+after the upgrade.
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    for table, column in (
+        ('file', sa.Column('duration_seconds', sa.Float(), nullable=True)),
+        ('file', sa.Column('sample_rate', sa.Integer(), nullable=True)),
+        ('file', sa.Column('channels', sa.Integer(), nullable=True)),
+        ('file', sa.Column('codec', sa.String(32), nullable=True)),
+        ('file', sa.Column('bit_rate', sa.Integer(), nullable=True)),
+        ('file_metadata', sa.Column('estimated_cost', sa.Float(), nullable=True)),
+        ('file_metadata', sa.Column('schedule_key', sa.Float(), nullable=True)),
+    ):
+        try:
+            op.add_column(table, column)
+        except Exception as e:
+            if "already exists" not in str(e):
+                raise e
+
+    try:
+        op.create_index('ix_file_metadata_schedule', 'file_metadata', ['processing_status', 'schedule_key'])
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise e
+
+    op.execute("UPDATE file_metadata SET schedule_key = 0 "
+               "WHERE schedule_key IS NULL AND processing_status IN ('queued', 'processing')")
+
+def downgrade():
+    op.drop_index('ix_file_metadata_schedule', table_name='file_metadata')
+    op.drop_column('file_metadata', 'schedule_key')
+    op.drop_column('file_metadata', 'estimated_cost')
+    for column in ('bit_rate', 'codec', 'channels', 'sample_rate', 'duration_seconds'):
+        op.drop_column('file', column)
@@ -0,0 +1,54 @@
+"""add per-user fair scheduling and batch priorities
+
+Copies each job's owner onto file_metadata so the scheduler can pick a
+tenant without joining file.
+
+Revision ID: 016
+Revises: 015
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '016'
+down_revision = '015'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    for table, column in (
+        ('user', sa.Column('scheduler_weight', sa.Float(), nullable=False, server_default='1')),
+        ('user', sa.Column('scheduler_vtime', sa.Float(), nullable=False, server_default='0')),
+        ('file_metadata', sa.Column('user_id', sa.Integer(), nullable=True)),
+        ('file_metadata', sa.Column('priority', sa.Integer(), nullable=False, server_default='1')),
+        ('processing_batch', sa.Column('priority', sa.Integer(), nullable=False, server_default='1')),
+    ):
+        try:
+            op.add_column(table, column)
+        except Exception as e:
+            if "already exists" not in str(e):
+                raise e
+
+    for name, table, columns in (
+        ('ix_user_scheduler_vtime', 'user', ['scheduler_vtime']),
+        ('ix_file_metadata_tenant', 'file_metadata', ['user_id', 'processing_status', 'priority', 'schedule_key']),
+    ):
+        try:
+            op.create_index(name, table, columns)
+        except Exception as e:
+            if "already exists" not in str(e):
+                raise e
+
+    op.execute("UPDATE file_metadata SET user_id = (SELECT file.user_id FROM file WHERE file.id = file_metadata.file_id) "
+               "WHERE user_id IS NULL")
+
+def downgrade():
+    op.drop_index('ix_file_metadata_tenant', table_name='file_metadata')
+    op.drop_index('ix_user_scheduler_vtime', table_name='user')
+    op.drop_column('processing_batch', 'priority')
+    op.drop_column('file_metadata', 'priority')
+    op.drop_column('file_metadata', 'user_id')
+    op.drop_column('user', 'scheduler_vtime')
+    op.drop_column('user', 'scheduler_weight')
@@ -0,0 +1,26 @@
+"""remove results, events and search documents of deleted files
+
+Deleting a file used to leave the rows keyed by its jobs behind; deletes now
+remove them, and this clears what earlier deletes left.
+
+Revision ID: 017
+Revises: 016
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '017'
+down_revision = '016'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    for table in ('processing_result', 'transcript_page', 'processing_event'):
+        op.execute(f"DELETE FROM {table} WHERE job_id NOT IN (SELECT id FROM file_metadata)")
+    op.execute("DELETE FROM search_document WHERE file_id NOT IN (SELECT id FROM file)")
+
+def downgrade():
+    # Deleted rows belonged to files that no longer exist
+    pass
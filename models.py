@@ -1,5 +1,6 @@
 from datetime import datetime
 from app import db
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from flask_login import UserMixin
 
 class User(UserMixin, db.Model):
@@ -14,6 +15,10 @@ class User(UserMixin, db.Model):
     token_expiry = db.Column(db.DateTime, nullable=True)
     replit_user_id = db.Column(db.String(256), unique=True, nullable=True)
     last_login = db.Column(db.DateTime, nullable=True)
+    # Fair share of processing (utils/job_queue.py): relative weight, and the virtual
+    # time advanced by each claimed job's estimated cost divided by the weight
+    scheduler_weight = db.Column(db.Float, nullable=False, default=1.0)
+    scheduler_vtime = db.Column(db.Float, nullable=False, default=0.0, index=True)
     files = db.relationship('File', backref='owner', lazy=True)
 
 class File(db.Model):
@@ -22,20 +27,112 @@ class File(db.Model):
     filepath = db.Column(db.String(512), nullable=False)
     filetype = db.Column(db.String(50))
     size = db.Column(db.Integer)
+    content_hash = db.Column(db.String(64), index=True)
+    # Media description probed at upload (utils/media_probe.py); None for text or unreadable files
+    duration_seconds = db.Column(db.Float, nullable=True)
+    sample_rate = db.Column(db.Integer, nullable=True)
+    channels = db.Column(db.Integer, nullable=True)
+    codec = db.Column(db.String(32), nullable=True)
+    bit_rate = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     file_metadata = db.relationship('FileMetadata', backref='file', lazy=True)
 
+    __table_args__ = (
+        # Per-user listing sorted by upload time (keyset pagination)
+        db.Index('ix_file_user_created', 'user_id', 'created_at'),
+    )
+
 class FileMetadata(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    file_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=False)
-    transcript = db.Column(db.Text)
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=False, index=True)
+    # Inline results of jobs completed before utils/result_store.py; new results are
+    # stored compressed in processing_result, so these are deferred and left empty
+    transcript = db.deferred(db.Column(db.Text))
+    transcript_segments = db.deferred(db.Column(db.JSON))
+    sentiment_series = db.deferred(db.Column(db.JSON, nullable=True))
+    entities = db.deferred(db.Column(db.JSON))
+    speakers = db.deferred(db.Column(db.JSON))
     sentiment_score = db.Column(db.Float)
-    entities = db.Column(db.JSON)
-    speakers = db.Column(db.JSON)
+    # Length-weighted sentence-level aggregates
+    sentiment_summary = db.Column(db.JSON, nullable=True)
+    # Sizes of the stored results (transcript length, segment/entity/speaker counts, duration)
+    result_summary = db.Column(db.JSON, nullable=True)
     processed_at = db.Column(db.DateTime, default=datetime.utcnow)
     batch_id = db.Column(db.String(36), nullable=True)
     processing_status = db.Column(db.String(20), nullable=True)
     processing_started_at = db.Column(db.DateTime, nullable=True)
     processing_completed_at = db.Column(db.DateTime, nullable=True)
     processing_error = db.Column(db.Text, nullable=True)
+    # Job queue bookkeeping, see utils/job_queue.py
+    processing_progress = db.Column(db.Integer, nullable=True)
+    processing_stages = db.Column(db.JSON, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    queued_at = db.Column(db.DateTime, nullable=True)
+    run_after = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(64), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    # Predicted processing seconds (utils/cost_model.py) and the claim order derived from it
+    estimated_cost = db.Column(db.Float, nullable=True)
+    schedule_key = db.Column(db.Float, nullable=True)
+    # Owner (copied from file.user_id) and priority class, for the fair scheduler
+    user_id = db.Column(db.Integer, nullable=True)
+    priority = db.Column(db.Integer, nullable=False, default=1)
+
+    __table_args__ = (
+        db.Index('ix_file_metadata_claim', 'processing_status', 'run_after'),
+        db.Index('ix_file_metadata_schedule', 'processing_status', 'schedule_key'),
+        db.Index('ix_file_metadata_tenant', 'user_id', 'processing_status', 'priority', 'schedule_key'),
+    )
+
+class ProcessingResult(db.Model):
+    """Compressed heavy results of a completed job, see utils/result_store.py"""
+    job_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    codec = db.Column(db.String(8), nullable=False)
+    # Compressed JSON of the transcript, entities, speakers and sentiment series
+    payload = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TranscriptPage(db.Model):
+    """Compressed transcript segments of one job starting within one time window"""
+    job_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    page = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    start_time = db.Column(db.Float, nullable=False)
+    end_time = db.Column(db.Float, nullable=False)
+    segment_count = db.Column(db.Integer, nullable=False)
+    codec = db.Column(db.String(8), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+class ProcessingEvent(db.Model):
+    """Append-only job state changes streamed to clients, see utils/events.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, nullable=False, index=True)
+    data = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class SearchDocument(db.Model):
+    """Postgres full-text index entry for a processed file, see utils/search_index.py"""
+    file_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    # Space-padded entity labels (' ORG PERSON ') for label filters
+    entity_labels = db.Column(db.String(512))
+    document = db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ProcessingBatch(db.Model):
+    """Aggregate job counters for one /api/process/batch submission.
+
+    Kept up to date by utils/job_queue.py in the same transaction as each job
+    transition, so batch progress is a primary-key lookup.
+    """
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    queued = db.Column(db.Integer, nullable=False, default=0)
+    processing = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    priority = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -1,8 +1,19 @@
 from flask import Blueprint, request, jsonify, render_template, current_app
+from werkzeug.utils import send_file
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from models import File, FileMetadata, db
+from utils.chunk_assembler import start_assembly, read_state, discard_upload, prune_uploads
+from utils.blob_store import store_blob, release_blob, is_valid_digest
+from utils import job_queue, search_index
+from utils.audio_cache import cached_wav
+from utils.media_probe import probe, PROBE_FIELDS
+from utils.upload_manifest import (ManifestError, open_manifest, receive_chunk, receive_chunk_at, chunk_extent,
+                                   received_chunks, claim_assembly, assembly_claimed, manifest_summary)
 from datetime import datetime
+from functools import partial
+import base64
+import json
 import os
 
 files_bp = Blueprint('files', __name__)
@@ -12,22 +23,182 @@ ALLOWED_EXTENSIONS = {'txt', 'pdf', 'wav', 'mp3', 'amr'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def upload_temp_dir(upload_id):
+    # Scope upload ids per user so clients can derive stable ids for resuming
+    return os.path.join(current_app.config['TEMP_FOLDER'], f'{current_user.id}_{upload_id}')
+
 @files_bp.route('/')
 @login_required
 def index():
     return render_template('file_manager.html')
 
+# Sortable columns for the file list; ties are broken by id so keyset cursors are stable
+SORT_COLUMNS = {
+    'created_at': File.created_at,
+    'filename': File.filename,
+    'size': db.func.coalesce(File.size, 0)
+}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+class ListingError(Exception):
+    """Invalid file list parameters"""
+    pass
+
+def encode_cursor(sort, value, file_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, file_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, sort):
+    try:
+        cursor_sort, value, file_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ListingError('Invalid cursor')
+    if cursor_sort != sort:
+        raise ListingError('Cursor does not match the requested sort')
+    if sort == 'created_at':
+        value = datetime.fromisoformat(value)
+    return value, int(file_id)
+
+def _parse_date(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ListingError(f'{name} must be an ISO 8601 date')
+
+def _parse_int(name, default=None):
+    value = request.args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ListingError(f'{name} must be an integer')
+
+def latest_statuses(file_ids):
+    """file_id -> latest processing status for a page of files, in one query"""
+    rows = (db.session.query(FileMetadata.file_id, FileMetadata.processing_status, FileMetadata.processing_progress)
+            .filter(FileMetadata.file_id.in_(file_ids))
+            .order_by(FileMetadata.id)
+            .all())
+    # Later rows overwrite earlier ones, leaving the newest per file
+    return {file_id: {'status': status, 'progress': progress or 0} for file_id, status, progress in rows}
+
 @files_bp.route('/api/files', methods=['GET'])
 @login_required
 def list_files():
-    files = File.query.filter_by(user_id=current_user.id).all()
-    return jsonify([{
-        'id': f.id,
-        'filename': f.filename,
-        'filetype': f.filetype,
-        'size': f.size,
-        'created_at': f.created_at.isoformat()
-    } for f in files])
+    """One page of the user's files.
+
+    Query parameters: limit, cursor (from next_cursor), sort (created_at,
+    filename or size), order (asc or desc), type (comma separated
+    extensions), min_size, max_size, created_after, created_before and
+    include_status. Pages are keyset paginated on (sort column, id) over the
+    file(user_id, created_at) index, selecting only the listed columns.
+    """
+    try:
+        sort = request.args.get('sort', 'created_at')
+        if sort not in SORT_COLUMNS:
+            raise ListingError(f'sort must be one of {sorted(SORT_COLUMNS)}')
+        descending = request.args.get('order', 'desc') != 'asc'
+        limit = min(max(_parse_int('limit', DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+        column = SORT_COLUMNS[sort]
+
+        query = (db.session.query(File.id, File.filename, File.filetype, File.size, File.duration_seconds,
+                                  File.created_at)
+                 .filter(File.user_id == current_user.id))
+        types = [t.strip().lower() for t in request.args.get('type', '').split(',') if t.strip()]
+        if types:
+            query = query.filter(File.filetype.in_(types))
+        min_size, max_size = _parse_int('min_size'), _parse_int('max_size')
+        if min_size is not None:
+            query = query.filter(File.size >= min_size)
+        if max_size is not None:
+            query = query.filter(File.size <= max_size)
+        created_after, created_before = _parse_date('created_after'), _parse_date('created_before')
+        if created_after:
+            query = query.filter(File.created_at >= created_after)
+        if created_before:
+            query = query.filter(File.created_at < created_before)
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            value, last_id = decode_cursor(cursor, sort)
+            if descending:
+                query = query.filter(db.or_(column < value, db.and_(column == value, File.id < last_id)))
+            else:
+                query = query.filter(db.or_(column > value, db.and_(column == value, File.id > last_id)))
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+
+    order = (column.desc(), File.id.desc()) if descending else (column.asc(), File.id.asc())
+    # One extra row tells whether another page exists
+    rows = query.order_by(*order).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    files = [{
+        'id': row.id,
+        'filename': row.filename,
+        'filetype': row.filetype,
+        'size': row.size,
+        'duration': row.duration_seconds,
+        'created_at': row.created_at.isoformat()
+    } for row in rows]
+    if request.args.get('include_status', 'false').lower() in ('1', 'true') and files:
+        statuses = latest_statuses([f['id'] for f in files])
+        for f in files:
+            f['processing'] = statuses.get(f['id'])
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        sort_value = (last.size or 0) if sort == 'size' else getattr(last, sort)
+        next_cursor = encode_cursor(sort, sort_value, last.id)
+    return jsonify({'files': files, 'next_cursor': next_cursor})
+
+def prune_stale_uploads():
+    prune_uploads(current_app.config['TEMP_FOLDER'], current_app.config['UPLOAD_TEMP_MAX_AGE_SECONDS'])
+
+def chunk_received(temp_dir, upload_id, filename, chunk_number, total_chunks, record, in_place=False):
+    """Progress response for a stored chunk; the request completing the set starts assembly"""
+    # Chunks may arrive in any order and in parallel, so progress is based on
+    # what the manifest holds rather than on this chunk's position
+    received = received_chunks(temp_dir)
+    progress = {
+        'uploadId': upload_id,
+        'filename': filename,
+        'chunkNumber': chunk_number,
+        'chunk': record,
+        'receivedChunks': len(received),
+        'totalChunks': total_chunks,
+        'progress': len(received) / total_chunks * 100
+    }
+    
+    # Once every chunk is present exactly one request hands assembly off to a background task
+    if len(received) == total_chunks and claim_assembly(temp_dir):
+        start_assembly(
+            current_app._get_current_object(),
+            temp_dir,
+            total_chunks,
+            on_complete=partial(register_upload, filename=filename, user_id=current_user.id),
+            in_place=in_place
+        )
+        
+        return jsonify({
+            'status': 'assembling',
+            'uploadId': upload_id,
+            'progress': progress
+        }), 202
+    
+    return jsonify({
+        'status': 'in_progress',
+        'progress': progress
+    })
 
 @files_bp.route('/api/files/upload-chunk', methods=['POST'])
 @login_required
@@ -43,66 +214,30 @@ def upload_chunk():
         if not all([chunk, chunk_number is not None, total_chunks, filename, upload_id]):
             return jsonify({'error': 'Missing required chunk upload data'}), 400
             
+        if secure_filename(upload_id) != upload_id:
+            return jsonify({'error': 'Invalid upload id'}), 400
+            
         # Validate total file size (10GB limit)
         if file_size > 10 * 1024 * 1024 * 1024:
             return jsonify({'error': 'File size exceeds 10GB limit'}), 400
             
-        temp_dir = os.path.join(current_app.config['TEMP_FOLDER'], upload_id)
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        chunk_file = os.path.join(temp_dir, f'chunk_{chunk_number}')
-        chunk.save(chunk_file)
-        
-        # Track upload progress
-        progress = {
-            'uploadId': upload_id,
-            'filename': filename,
-            'chunkNumber': chunk_number,
-            'totalChunks': total_chunks,
-            'progress': (chunk_number + 1) / total_chunks * 100
-        }
-        
-        # If this is the last chunk, combine all chunks
-        if chunk_number == total_chunks - 1:
-            final_filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], 
-                                        f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{secure_filename(filename)}")
+        if chunk_number < 0 or chunk_number >= total_chunks:
+            return jsonify({'error': 'Chunk number out of range'}), 400
             
-            with open(final_filepath, 'wb') as final_file:
-                for i in range(total_chunks):
-                    chunk_path = os.path.join(temp_dir, f'chunk_{i}')
-                    with open(chunk_path, 'rb') as chunk_file:
-                        final_file.write(chunk_file.read())
+        temp_dir = upload_temp_dir(upload_id)
+        if read_state(temp_dir) is not None or assembly_claimed(temp_dir):
+            return jsonify({'error': 'Upload is already being finalized', 'status': 'finalizing',
+                            'uploadId': upload_id}), 409
+        prune_stale_uploads()
             
-            # Cleanup temp files
-            import shutil
-            shutil.rmtree(temp_dir)
-            
-            # Create database entry
-            new_file = File(
-                filename=filename,
-                filepath=final_filepath,
-                filetype=filename.rsplit('.', 1)[1].lower() if '.' in filename else '',
-                size=os.path.getsize(final_filepath),
-                user_id=current_user.id
-            )
-            db.session.add(new_file)
-            db.session.commit()
-            
-            return jsonify({
-                'status': 'complete',
-                'file': {
-                    'id': new_file.id,
-                    'filename': new_file.filename,
-                    'size': formatFileSize(new_file.size),
-                    'type': new_file.filetype,
-                    'created_at': new_file.created_at.isoformat()
-                }
-            })
+        try:
+            manifest = open_manifest(temp_dir, filename, total_chunks, file_size, current_user.id)
+            record = receive_chunk(temp_dir, chunk_number, chunk.stream, manifest,
+                                   expected_checksum=request.form.get('chunkChecksum'))
+        except ManifestError as e:
+            return jsonify({'error': str(e)}), 409
         
-        return jsonify({
-            'status': 'in_progress',
-            'progress': progress
-        })
+        return chunk_received(temp_dir, upload_id, filename, chunk_number, total_chunks, record)
             
         if not file.filename or not allowed_file(file.filename):
             return jsonify({'error': f'File type not allowed. Supported types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
@@ -165,6 +300,264 @@ def upload_chunk():
         db.session.rollback()
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+def serialize_upload(new_file):
+    return {
+        'id': new_file.id,
+        'filename': new_file.filename,
+        'size': formatFileSize(new_file.size),
+        'type': new_file.filetype,
+        'created_at': new_file.created_at.isoformat()
+    }
+
+def register_upload(assembled_path, content_hash, filename, user_id):
+    """Move an assembled upload into the blob store and create its File row.
+
+    Runs on the assembler thread. Identical content is stored once; every File
+    row that shares it points at the same blob.
+    """
+    ext = file_extension(filename)
+    blob, created = store_blob(current_app.config['UPLOAD_FOLDER'], assembled_path, content_hash, ext)
+    try:
+        new_file = File(
+            filename=filename,
+            filepath=blob,
+            filetype=ext,
+            size=os.path.getsize(blob),
+            content_hash=content_hash,
+            user_id=user_id,
+            # Duration and format feed the processing cost estimate
+            **probe(blob, ext)
+        )
+        db.session.add(new_file)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    # A concurrent delete may have released the shared blob between store and commit
+    if not os.path.exists(blob):
+        db.session.delete(new_file)
+        db.session.commit()
+        raise FileNotFoundError('Stored blob disappeared, please retry the upload')
+    
+    if not created:
+        current_app.logger.info(f"Deduplicated upload {filename} onto existing blob {content_hash}")
+    return serialize_upload(new_file)
+
+@files_bp.route('/api/files/upload-check', methods=['POST'])
+@login_required
+def upload_check():
+    """Skip the upload entirely when the client's content hash is already stored"""
+    data = request.get_json() or {}
+    digest = str(data.get('sha256', '')).lower()
+    filename = data.get('filename')
+    try:
+        file_size = int(data.get('fileSize'))
+    except (ValueError, TypeError):
+        file_size = None
+    
+    if not is_valid_digest(digest) or not filename or file_size is None or file_size < 0:
+        return jsonify({'error': 'sha256, filename and fileSize are required'}), 400
+        
+    query = File.query.filter_by(content_hash=digest, size=file_size)
+    # Knowing a hash must not grant access to someone else's bytes unless explicitly allowed
+    if not current_app.config.get('UPLOAD_DEDUP_ACROSS_USERS'):
+        query = query.filter_by(user_id=current_user.id)
+    existing = query.first()
+    if not existing or not os.path.exists(existing.filepath):
+        return jsonify({'status': 'upload_required'})
+        
+    try:
+        new_file = File(
+            filename=filename,
+            filepath=existing.filepath,
+            filetype=file_extension(filename),
+            size=existing.size,
+            content_hash=digest,
+            user_id=current_user.id,
+            # Same bytes, so the probe result carries over
+            **{field: getattr(existing, field) for field in PROBE_FIELDS}
+        )
+        db.session.add(new_file)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+        
+    return jsonify({'status': 'complete', 'deduplicated': True, 'file': serialize_upload(new_file)})
+
+@files_bp.route('/api/files/upload/<upload_id>/<int:chunk_number>', methods=['PUT'])
+@login_required
+def upload_chunk_in_place(upload_id, chunk_number):
+    """Receive one chunk as the raw request body and write it at its offset in the file.
+
+    Unlike the multipart endpoint nothing is spooled or copied: the body is
+    streamed in fixed-size buffers into the preallocated upload file at
+    chunk_number * chunkSize and hashed on the way. The file description is
+    passed in the query string and must match on every chunk.
+    """
+    try:
+        filename = request.args.get('filename')
+        total_chunks = request.args.get('totalChunks', type=int)
+        file_size = request.args.get('fileSize', type=int)
+        chunk_size = request.args.get('chunkSize', type=int)
+        
+        if not filename or total_chunks is None or file_size is None or chunk_size is None:
+            return jsonify({'error': 'Missing required chunk upload data'}), 400
+        if secure_filename(upload_id) != upload_id:
+            return jsonify({'error': 'Invalid upload id'}), 400
+        if file_size > current_app.config['MAX_CONTENT_LENGTH']:
+            return jsonify({'error': 'File size exceeds 10GB limit'}), 400
+        if file_size < 0 or chunk_size <= 0 or total_chunks != max(1, -(-file_size // chunk_size)):
+            return jsonify({'error': 'Chunk size does not match file size and chunk count'}), 400
+        if chunk_number < 0 or chunk_number >= total_chunks:
+            return jsonify({'error': 'Chunk number out of range'}), 400
+        
+        temp_dir = upload_temp_dir(upload_id)
+        if read_state(temp_dir) is not None or assembly_claimed(temp_dir):
+            return jsonify({'error': 'Upload is already being finalized', 'status': 'finalizing',
+                            'uploadId': upload_id}), 409
+        prune_stale_uploads()
+        
+        try:
+            manifest = open_manifest(temp_dir, filename, total_chunks, file_size, current_user.id, chunk_size)
+            _, length = chunk_extent(manifest, chunk_number)
+            if request.content_length is not None and request.content_length != length:
+                return jsonify({'error': f'Chunk {chunk_number} must be {length} bytes'}), 400
+            record = receive_chunk_at(temp_dir, chunk_number, request.stream, manifest,
+                                      expected_checksum=request.headers.get('X-Chunk-Checksum'))
+        except ManifestError as e:
+            return jsonify({'error': str(e)}), 409
+        
+        return chunk_received(temp_dir, upload_id, filename, chunk_number, total_chunks, record, in_place=True)
+        
+    except Exception as e:
+        current_app.logger.error(f"Chunk upload failed: {str(e)}")
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+
+@files_bp.route('/api/files/upload-status/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    if secure_filename(upload_id) != upload_id:
+        return jsonify({'error': 'Invalid upload id'}), 400
+        
+    temp_dir = upload_temp_dir(upload_id)
+    state = read_state(temp_dir)
+    if state is not None:
+        return jsonify(dict(state, uploadId=upload_id))
+        
+    summary = manifest_summary(temp_dir)
+    if summary is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    status = 'assembling' if assembly_claimed(temp_dir) else 'in_progress'
+    return jsonify(dict(summary, status=status, uploadId=upload_id))
+
+@files_bp.route('/api/files/upload/<upload_id>', methods=['DELETE'])
+@login_required
+def discard_upload_route(upload_id):
+    """Forget an upload: clients call this once they have read its outcome, or to start it over"""
+    if secure_filename(upload_id) != upload_id:
+        return jsonify({'error': 'Invalid upload id'}), 400
+    if not discard_upload(upload_temp_dir(upload_id)):
+        return jsonify({'error': 'Upload is being assembled', 'uploadId': upload_id}), 409
+    return jsonify({'message': 'Upload discarded', 'uploadId': upload_id})
+
+# Served content types; browsers need the audio ones to play files inline
+CONTENT_TYPES = {
+    'txt': 'text/plain',
+    'pdf': 'application/pdf',
+    'wav': 'audio/wav',
+    'mp3': 'audio/mpeg',
+    'amr': 'audio/amr'
+}
+CONTENT_VARIANTS = ('original', 'wav')
+
+def content_source(file, variant):
+    """(path, etag, mimetype, download_name) for a file or its decoded WAV, or None if not available"""
+    if not os.path.exists(file.filepath):
+        return None
+    if variant == 'original':
+        # Blobs are content addressed, so their hash is a strong validator;
+        # older uploads fall back to an mtime/size based tag
+        return (file.filepath, file.content_hash or True,
+                CONTENT_TYPES.get(file.filetype, 'application/octet-stream'), file.filename)
+    if file.filetype not in ('wav', 'mp3', 'amr'):
+        return None
+    path = cached_wav(file.filepath, file.content_hash, current_app.config['AUDIO_CACHE_FOLDER'])
+    if path is None:
+        return None
+    return path, True, 'audio/wav', f"{os.path.splitext(file.filename)[0]}.wav"
+
+def accel_location(path):
+    """Internal nginx location for path, or None when it lies outside FILE_ACCEL_ROOT"""
+    root = os.path.realpath(current_app.config['FILE_ACCEL_ROOT'])
+    relative = os.path.relpath(os.path.realpath(path), root)
+    if relative.startswith(os.pardir):
+        return None
+    return current_app.config['FILE_ACCEL_PREFIX'].rstrip('/') + '/' + relative.replace(os.sep, '/')
+
+def serve_content(path, etag, mimetype, download_name, as_attachment):
+    """Conditional, range-capable file response, or a proxy hand-off in x-sendfile/x-accel mode.
+
+    In direct mode the body is a wsgi.file_wrapper, so servers that support it
+    (gunicorn, uWSGI) send whole-file responses with sendfile(). Proxy modes
+    return headers only: this process answers conditional requests (304/412)
+    and the proxy streams the file, including Range requests, itself.
+    """
+    config = current_app.config
+    mode = config['FILE_SERVE_MODE']
+    internal = accel_location(path) if mode == 'x-accel' else None
+    offload = mode == 'x-sendfile' or internal is not None
+    response = send_file(
+        path,
+        request.environ,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=not offload,
+        etag=etag,
+        max_age=config['FILE_CACHE_MAX_AGE'],
+        use_x_sendfile=offload,
+        response_class=current_app.response_class
+    )
+    # Files belong to one user, so only the browser may cache them
+    response.cache_control.public = False
+    response.cache_control.private = True
+    # Advertised up front so media elements seek with Range requests
+    response.headers['Accept-Ranges'] = 'bytes'
+    if offload:
+        response = response.make_conditional(request.environ)
+        sendfile_path = response.headers.pop('X-Sendfile')
+        if response.status_code != 304:
+            if internal is not None:
+                response.headers['X-Accel-Redirect'] = internal
+            else:
+                response.headers['X-Sendfile'] = sendfile_path
+    return response
+
+@files_bp.route('/api/files/<int:file_id>/content', methods=['GET', 'HEAD'])
+@login_required
+def file_content(file_id):
+    """Stream a stored file (or ?variant=wav, its decoded audio) with Range and ETag support"""
+    file = File.query.get_or_404(file_id)
+    if file.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    variant = request.args.get('variant', 'original')
+    if variant not in CONTENT_VARIANTS:
+        return jsonify({'error': f"Unknown variant '{variant}', expected one of {', '.join(CONTENT_VARIANTS)}"}), 400
+    
+    source = content_source(file, variant)
+    if source is None:
+        if variant == 'wav':
+            return jsonify({'error': 'Decoded audio is not available, process the file first'}), 404
+        return jsonify({'error': 'File content is missing'}), 404
+    path, etag, mimetype, download_name = source
+    as_attachment = request.args.get('download', 'false').lower() in ('1', 'true')
+    return serve_content(path, etag, mimetype, download_name, as_attachment)
+
 def formatFileSize(size):
     for unit in ['B', 'KB', 'MB', 'GB']:
         if size < 1024:
@@ -180,9 +573,20 @@ def delete_file(file_id):
         return jsonify({'error': 'Unauthorized'}), 403
         
     try:
-        os.remove(file.filepath)
+        filepath = file.filepath
+        # Jobs reference the file, so they go first, in the same transaction
+        # together with their stored results, events and search document
+        job_queue.remove_jobs(file_id)
+        search_index.discard_document(file_id)
         db.session.delete(file)
         db.session.commit()
+        # Blobs are shared between uploads of identical content
+        release_blob(filepath, File.query.filter_by(filepath=filepath).count())
+        search_index.remove_file(file_id, current_app.config['SEARCH_BACKEND'])
         return jsonify({'message': 'File deleted'})
+    except job_queue.JobRunningError:
+        db.session.rollback()
+        return jsonify({'error': 'File is being processed, try again once processing has finished'}), 409
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
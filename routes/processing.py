@@ -1,137 +1,471 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context, url_for
 from flask_login import login_required, current_user
-from models import File, FileMetadata, db
-from utils.audio_processor import transcribe_audio, diarize_speakers
-from utils.text_processor import analyze_sentiment, extract_entities
-from datetime import datetime
-import queue
+from models import File, FileMetadata, ProcessingBatch, db
+from utils.pipeline import Stage, run_pipeline
+from utils.asr_backends import ASRError, RecognizerBackend, backend_class, get_backend
+from utils.result_cache import ResultCache, package_version
+from utils.micro_batcher import MicroBatcher
+from utils import job_queue, executor, events, search_index, result_store, audio_cache
+from sqlalchemy.orm import load_only
+from functools import partial
+from contextlib import nullcontext
+import json
+import logging
+import os
+import socket
 import threading
 import time
-import uuid
 
 processing_bp = Blueprint('processing', __name__)
+logger = logging.getLogger(__name__)
 
-# Create a processing queue for each user
-processing_queues = {}
-processing_status = {}
+# Worker threads started by this process, see ensure_workers
+_workers_lock = threading.Lock()
+_worker_threads = []
+# Set once pools are configured, even when PROCESSING_INLINE_WORKERS=0 starts no threads
+_workers_started = False
+# Groups entity extraction from concurrent jobs into nlp.pipe batches, see configure_pools
+_ner_batcher = None
+_result_cache = None
+_result_cache_lock = threading.Lock()
 
-def get_user_queue():
-    user_id = current_user.id
-    if user_id not in processing_queues:
-        processing_queues[user_id] = queue.Queue()
-        processing_status[user_id] = {}
-    return processing_queues[user_id], processing_status[user_id]
+def make_worker_id(index):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+AUDIO_TYPES = ['wav', 'mp3', 'amr']
+ASR_POOL = 'asr'
 
-def process_file_task(file, status_dict, batch_id=None):
+def configure_pools(app):
+    """Size the process pools from config and the ASR backend's declared limits"""
+    executor.configure(app.config['PROCESSING_POOL_SIZE'], warm_up=app.config['PROCESSING_WARM_MODELS'])
+    asr_processes = app.config['ASR_WORKER_PROCESSES']
     try:
-        metadata = FileMetadata.query.filter_by(file_id=file.id).first()
-        if not metadata:
-            metadata = FileMetadata(file_id=file.id)
-            db.session.add(metadata)
-        
-        metadata.batch_id = batch_id
-        metadata.processing_status = 'processing'
-        metadata.processing_started_at = datetime.utcnow()
-        db.session.commit()
+        if asr_processes is None:
+            asr_processes = backend_class(app.config['ASR_BACKEND']).worker_processes
+        get_backend(app.config['ASR_BACKEND'], **app.config['ASR_BACKEND_OPTIONS'])
+    except ASRError as e:
+        # Reported at startup; audio jobs fail with the same message
+        logger.error(f"Audio transcription is unavailable: {e}")
+        if asr_processes is None:
+            asr_processes = RecognizerBackend.worker_processes
+    executor.configure(asr_processes, ASR_POOL)
 
-        status_dict[file.id] = {
-            'status': 'processing',
-            'progress': 0,
-            'started_at': metadata.processing_started_at.isoformat()
-        }
-
-        if file.filetype in ['wav', 'mp3', 'amr']:
-            status_dict[file.id]['progress'] = 25
-            transcript = transcribe_audio(file.filepath)
-            status_dict[file.id]['progress'] = 50
-            speakers = diarize_speakers(file.filepath)
-        else:
-            with open(file.filepath, 'r') as f:
-                transcript = f.read()
-            speakers = None
-            status_dict[file.id]['progress'] = 50
-
-        status_dict[file.id]['progress'] = 75
-        sentiment = analyze_sentiment(transcript)
-        entities = extract_entities(transcript)
-        
-        metadata.transcript = transcript
-        metadata.sentiment_score = sentiment['compound']
-        metadata.entities = entities
-        metadata.speakers = speakers
-        metadata.processing_status = 'completed'
-        metadata.processing_completed_at = datetime.utcnow()
-        db.session.commit()
+    from utils.text_processor import extract_entities_batch
+    global _ner_batcher
+    _ner_batcher = MicroBatcher(
+        extract_entities_batch, executor.submit,
+        max_batch=app.config['NER_BATCH_SIZE'],
+        max_wait=app.config['NER_BATCH_WAIT_SECONDS'],
+        batch_args=(app.config['NER_BATCH_SIZE'], app.config['NER_PROCESSES'])
+    )
+
+def get_result_cache(app):
+    """This process's handle on the shared stage result cache, or None when disabled"""
+    global _result_cache
+    if not app.config['RESULT_CACHE_ENABLED']:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache(app.config['RESULT_CACHE_FOLDER'],
+                                        app.config['RESULT_CACHE_MAX_BYTES'],
+                                        app.config['RESULT_CACHE_MAX_AGE_SECONDS'])
+        return _result_cache
+
+def _transcript_complete(result):
+    # A transcript with failed segments is returned, but not reused for later jobs
+    return not any('error' in segment for segment in result['segments'])
+
+def build_pipeline(file):
+    """Stage graph for one file; independent stages run concurrently"""
+    # Imported here so the web tier never loads the analysis stack
+    from utils.audio_processor import (prepare_wav, transcribe_segments, diarize_speakers,
+                                       TRANSCRIBE_VERSION, DIARIZE_VERSION)
+    from utils.text_processor import (read_text_file, extract_entities, sentiment_series_text,
+                                      sentiment_series_segments, SENTIMENT_VERSION, NER_VERSION)
+    config = current_app.config
+    # Cache versions: anything that changes a stage's output must appear here
+    sentiment_version = f"{SENTIMENT_VERSION}:nltk-{package_version('nltk')}"
+    ner_version = f"{NER_VERSION}:spacy-{package_version('spacy')}:{package_version('en_core_web_sm')}"
+    if file.filetype in AUDIO_TYPES:
+        asr_options = config['ASR_BACKEND_OPTIONS']
+        asr = get_backend(config['ASR_BACKEND'], **asr_options)
+        transcribe_version = (f"{TRANSCRIBE_VERSION}:{asr.version}:{sorted(asr_options.items())}:"
+                              f"{config['TRANSCRIPTION_SEGMENT_SECONDS']}")
+        diarize_version = (f"{DIARIZE_VERSION}:{config['DIARIZATION_METHOD']}:{config['DIARIZATION_MAX_SPEAKERS']}:"
+                           f"{config['DIARIZATION_SAMPLE_SIZE']}:sklearn-{package_version('scikit-learn')}")
+        source = [
+            # Decode once and share the WAV with every audio stage
+            Stage('decode', prepare_wav, weight=1, args=(
+                file.filepath,
+                file.content_hash,
+                config['AUDIO_CACHE_FOLDER'],
+                config['AUDIO_CACHE_MAX_BYTES']
+            )),
+            # Transcription runs on its own pool, sized for the configured ASR backend
+            Stage('transcribe', transcribe_segments, inputs=('decode',), weight=4,
+                  submit=executor.submitter(ASR_POOL), version=transcribe_version,
+                  cache_if=_transcript_complete, args=(
+                config['TRANSCRIPTION_SEGMENT_SECONDS'],
+                config['TRANSCRIPTION_CONCURRENCY'],
+                config['TRANSCRIPTION_RETRIES'],
+                config['ASR_BACKEND'],
+                config['ASR_BACKEND_OPTIONS']
+            )),
+            Stage('diarize', diarize_speakers, inputs=('decode',), weight=3, version=diarize_version, args=(
+                config['DIARIZATION_METHOD'],
+                config['DIARIZATION_MAX_SPEAKERS'],
+                config['DIARIZATION_SAMPLE_SIZE']
+            ))
+        ]
+        text_source = 'transcribe.text'
+        # Timed segments give the sentiment series a time axis
+        sentiment = Stage('sentiment', sentiment_series_segments, inputs=('transcribe.segments',), weight=1,
+                          version=sentiment_version)
+    else:
+        source = [Stage('read_text', read_text_file, args=(file.filepath,), weight=1)]
+        text_source = 'read_text'
+        sentiment = Stage('sentiment', sentiment_series_text, inputs=(text_source,), weight=1,
+                          version=sentiment_version)
+    return source + [
+        sentiment,
+        Stage('entities', extract_entities, inputs=(text_source,), weight=1, version=ner_version,
+              submit=_ner_batcher.submit if _ner_batcher else None)
+    ]
+
+def process_file_task(job, report_progress):
+    """Run the analysis pipeline for one claimed job; returns (results, summary columns).
+
+    Stages run on the shared process pool; this thread only schedules them and
+    waits, so the GIL stays free for request handling in the same process.
+    Stages already computed for the same content and versions come from the
+    result cache instead.
+    """
+    file = job.file
+    # The decoded WAV must outlive the decode stage until every audio stage has opened it
+    pin = (audio_cache.pinned(file.filepath, file.content_hash, current_app.config['AUDIO_CACHE_FOLDER'])
+           if file.filetype in AUDIO_TYPES else nullcontext())
+    with pin:
+        results = run_pipeline(build_pipeline(file), executor.submit, on_update=report_progress,
+                               cache=get_result_cache(current_app), content_hash=file.content_hash)
+    if 'transcribe' in results:
+        transcript = results['transcribe']['text']
+        segments = results['transcribe']['segments']
+    else:
+        transcript = results['read_text']
+        segments = None
+
+    sentiment = {key: value for key, value in results['sentiment'].items() if key != 'series'}
+    # Heavy results for the result store, and the summary columns kept on the job row
+    heavy = {
+        'transcript': transcript,
+        'transcript_segments': segments,
+        'sentiment_series': results['sentiment']['series'],
+        'entities': results['entities'],
+        'speakers': results.get('diarize')
+    }
+    return heavy, {'sentiment_score': sentiment['compound'], 'sentiment_summary': sentiment}
+
+def keep_lease(app, job_id, worker_id, stop_event):
+    """Renew a job's lease until stop_event is set"""
+    lease_seconds = app.config['PROCESSING_LEASE_SECONDS']
+    with app.app_context():
+        while not stop_event.wait(lease_seconds / 3):
+            try:
+                if not job_queue.heartbeat(job_id, worker_id, lease_seconds):
+                    logger.warning(f"Worker {worker_id} lost the lease on job {job_id}")
+                    return
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Heartbeat failed for job {job_id}: {e}")
+
+def run_claimed_job(app, job, worker_id):
+    config = app.config
+    if job.attempts > config['PROCESSING_MAX_ATTEMPTS']:
+        # Reclaimed after its worker died too many times; do not crash-loop on it
+        job_queue.fail(job.id, worker_id, job.processing_error or 'Worker lost the job repeatedly',
+                       job.attempts, config['PROCESSING_MAX_ATTEMPTS'])
+        return
 
-        status_dict[file.id] = {
-            'status': 'completed',
-            'progress': 100,
-            'completed_at': datetime.utcnow().isoformat(),
-            'results': {
-                'transcript': transcript,
-                'sentiment': sentiment,
-                'entities': entities,
-                'speakers': speakers
-            }
-        }
+    stop_event = threading.Event()
+    heartbeat_thread = threading.Thread(
+        target=keep_lease,
+        args=(app, job.id, worker_id, stop_event),
+        name=f'heartbeat_{job.id}',
+        daemon=True
+    )
+    heartbeat_thread.start()
+    try:
+        results, columns = process_file_task(job, partial(job_queue.set_progress, job.id, worker_id))
+        if job_queue.complete(job.id, worker_id, results, **columns):
+            search_index.index_file(job.file_id, config['SEARCH_BACKEND'])
     except Exception as e:
-        status_dict[file.id] = {
-            'status': 'failed',
-            'error': str(e),
-            'failed_at': datetime.utcnow().isoformat()
-        }
-
-def process_queue(user_queue, status_dict):
-    while True:
-        try:
-            file, batch_id = user_queue.get(timeout=1)
-            process_file_task(file, status_dict, batch_id)
-            user_queue.task_done()
-        except queue.Empty:
-            time.sleep(1)
-        except Exception as e:
-            print(f"Error in queue processing: {e}")
-            time.sleep(1)
+        db.session.rollback()
+        logger.error(f"Error processing file {job.file_id}: {e}")
+        job_queue.fail(job.id, worker_id, e, job.attempts,
+                       config['PROCESSING_MAX_ATTEMPTS'],
+                       config['PROCESSING_RETRY_BASE_SECONDS'])
+    finally:
+        stop_event.set()
+        heartbeat_thread.join()
+
+def process_queue(app, worker_id, stop_event=None):
+    """Drain the shared job queue; safe to run in any number of threads or processes"""
+    with app.app_context():
+        while stop_event is None or not stop_event.is_set():
+            try:
+                # Rate-limited, so checking on every pass is cheap and a busy queue still prunes
+                events.prune(app.config['EVENTS_RETENTION_SECONDS'])
+                job = job_queue.claim(worker_id, app.config['PROCESSING_LEASE_SECONDS'],
+                                      app.config['SCHEDULER_MAX_RUNNING'],
+                                      app.config['SCHEDULER_MAX_RUNNING_PER_USER'])
+                if job is None:
+                    time.sleep(app.config['PROCESSING_POLL_INTERVAL'])
+                    continue
+                run_claimed_job(app, job, worker_id)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error in queue processing: {e}")
+                time.sleep(1)
+            finally:
+                db.session.remove()
+
+def ensure_workers(app):
+    """Start this process's in-process queue workers once"""
+    global _workers_started
+    with _workers_lock:
+        if _workers_started:
+            return
+        configure_pools(app)
+        for index in range(app.config['PROCESSING_INLINE_WORKERS']):
+            worker_id = make_worker_id(index)
+            thread = threading.Thread(
+                target=process_queue,
+                args=(app, worker_id),
+                name=f'processor_{index}',
+                daemon=True
+            )
+            thread.start()
+            _worker_threads.append(thread)
+        _workers_started = True
+
+@processing_bp.before_app_request
+def start_inline_workers():
+    if not _workers_started:
+        ensure_workers(current_app._get_current_object())
+
+# Columns the status endpoint needs; results are fetched separately
+STATUS_COLUMNS = (FileMetadata.file_id, FileMetadata.processing_status, FileMetadata.processing_progress,
+                  FileMetadata.processing_stages, FileMetadata.attempts, FileMetadata.batch_id,
+                  FileMetadata.queued_at, FileMetadata.processing_started_at,
+                  FileMetadata.processing_completed_at, FileMetadata.processing_error,
+                  FileMetadata.estimated_cost)
+
+def results_url(file_id):
+    return url_for('processing.get_processing_results', file_id=file_id)
+
+def serialize_job(metadata):
+    """Small status summary; completed jobs link to their results instead of embedding them"""
+    status = {
+        'status': metadata.processing_status,
+        'progress': metadata.processing_progress or 0,
+        'stages': metadata.processing_stages or {},
+        'attempts': metadata.attempts,
+        'batch_id': metadata.batch_id,
+        'estimated_seconds': metadata.estimated_cost
+    }
+    if metadata.queued_at:
+        status['queued_at'] = metadata.queued_at.isoformat()
+    if metadata.processing_started_at:
+        status['started_at'] = metadata.processing_started_at.isoformat()
+    if metadata.processing_status == job_queue.COMPLETED:
+        status['completed_at'] = metadata.processing_completed_at.isoformat()
+        status['results_url'] = results_url(metadata.file_id)
+    elif metadata.processing_status == job_queue.FAILED:
+        status['error'] = metadata.processing_error
+        status['failed_at'] = metadata.processing_completed_at.isoformat()
+    elif metadata.processing_error:
+        # Queued again for a retry after a failed attempt
+        status['last_error'] = metadata.processing_error
+    return status
+
+def serialize_results(metadata, fields=result_store.HEAVY_FIELDS):
+    """Requested heavy results; transcript segments are paged separately by time range"""
+    results = result_store.load(metadata, fields)
+    serialized = {field: results[field] for field in fields if field != 'sentiment_series'}
+    serialized['sentiment'] = dict(metadata.sentiment_summary or {'compound': metadata.sentiment_score})
+    if 'sentiment_series' in fields:
+        serialized['sentiment']['series'] = results['sentiment_series'] or []
+    serialized['summary'] = metadata.result_summary or {}
+    serialized['segments_url'] = url_for('processing.get_transcript_segments', file_id=metadata.file_id)
+    return serialized
+
+def event_payload(file_id, data):
+    payload = dict(data, file_id=file_id)
+    if data.get('status') == job_queue.COMPLETED:
+        payload['results_url'] = results_url(file_id)
+    return payload
+
+def format_sse(event_id, file_id, data):
+    return f"id: {event_id}\nevent: job\ndata: {json.dumps(event_payload(file_id, data))}\n\n"
+
+def _stream_start():
+    # Resume after the last event the client saw, otherwise only send new events
+    after = request.headers.get('Last-Event-ID') or request.args.get('after')
+    return int(after) if after and after.isdigit() else events.latest_id()
+
+def init_websocket(app):
+    """Serve the event stream over a WebSocket as well when flask-sock is installed"""
+    try:
+        from flask_sock import Sock
+    except ImportError:
+        return False
+    sock = Sock(app)
+
+    @sock.route('/api/process/ws')
+    def stream_events_ws(ws):
+        if not current_user.is_authenticated:
+            ws.close(reason=1008, message='Login required')
+            return
+        user_id = current_user.id
+        after_id = _stream_start()
+        for event in events.subscribe(user_id, after_id, app.config['EVENTS_POLL_INTERVAL']):
+            if event is not None:
+                ws.send(json.dumps(dict(event_payload(event[1], event[2]), id=event[0])))
+    return True
 
 @processing_bp.route('/api/process/batch', methods=['POST'])
 @login_required
 def process_batch():
+    config = current_app.config
     file_ids = request.json.get('file_ids', [])
     if not file_ids:
         return jsonify({'error': 'No files specified'}), 400
+    if not all(isinstance(file_id, int) for file_id in file_ids):
+        return jsonify({'error': 'file_ids must be integers'}), 400
+    priority = request.json.get('priority', 'normal')
+    if priority not in job_queue.PRIORITIES:
+        return jsonify({'error': f"priority must be one of {', '.join(job_queue.PRIORITIES)}"}), 400
 
-    batch_id = str(uuid.uuid4())
-    user_queue, status_dict = get_user_queue()
-    
-    # Start processing thread if not already running
-    if not any(t.name == f'processor_{current_user.id}' for t in threading.enumerate()):
-        processor_thread = threading.Thread(
-            target=process_queue,
-            args=(user_queue, status_dict),
-            name=f'processor_{current_user.id}',
-            daemon=True
-        )
-        processor_thread.start()
+    # Backpressure: refuse work the queues cannot take instead of growing them without bound
+    retry_after = job_queue.admission_delay(
+        current_user.id, len(set(file_ids)),
+        config['SCHEDULER_MAX_QUEUED_PER_USER'], config['SCHEDULER_MAX_QUEUED'],
+        config['SCHEDULER_MAX_RUNNING_PER_USER'] or config['PROCESSING_POOL_SIZE']
+    )
+    if retry_after is not None:
+        db.session.rollback()
+        response = jsonify({'error': 'Processing queue is full, retry later', 'retry_after': retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
 
     # Queue files for processing
-    queued_files = []
-    for file_id in file_ids:
-        file = File.query.get(file_id)
-        if file and file.user_id == current_user.id:
-            user_queue.put((file, batch_id))
-            status_dict[file.id] = {
-                'status': 'queued',
-                'queued_at': datetime.utcnow().isoformat()
-            }
-            queued_files.append(file_id)
+    try:
+        batch, queued_files, skipped_files = job_queue.enqueue_batch(
+            current_user.id, file_ids, config['SCHEDULER_COST_WEIGHT'], job_queue.PRIORITIES[priority])
+        db.session.commit()
+    except job_queue.EnqueueConflictError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to queue files: {str(e)}'}), 500
 
     return jsonify({
         'message': f'Queued {len(queued_files)} files for processing',
-        'queued_files': queued_files
+        'batch_id': batch.id,
+        'batch_url': url_for('processing.get_batch_status', batch_id=batch.id),
+        'queued_files': queued_files,
+        # Already queued or processing in an earlier batch; left as they are
+        'skipped_files': skipped_files
     })
 
+@processing_bp.route('/api/process/batch/<batch_id>', methods=['GET'])
+@login_required
+def get_batch_status(batch_id):
+    batch = db.session.get(ProcessingBatch, batch_id)
+    if not batch or batch.user_id != current_user.id:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(job_queue.batch_counts(batch))
+
 @processing_bp.route('/api/process/status', methods=['GET'])
 @login_required
 def get_processing_status():
-    _, status_dict = get_user_queue()
-    return jsonify(status_dict)
+    jobs = (FileMetadata.query
+            .options(load_only(*STATUS_COLUMNS))
+            .join(File, FileMetadata.file_id == File.id)
+            .filter(File.user_id == current_user.id,
+                    FileMetadata.processing_status.isnot(None))
+            .all())
+    return jsonify({job.file_id: serialize_job(job) for job in jobs})
+
+def completed_job(file_id):
+    """The user's completed job for a file, or an error response"""
+    metadata = (FileMetadata.query
+                .join(File, FileMetadata.file_id == File.id)
+                .filter(FileMetadata.file_id == file_id, File.user_id == current_user.id)
+                .first())
+    if not metadata:
+        return None, (jsonify({'error': 'File not found'}), 404)
+    if metadata.processing_status != job_queue.COMPLETED:
+        return None, (jsonify({'error': 'Results not ready', 'status': metadata.processing_status}), 409)
+    return metadata, None
+
+@processing_bp.route('/api/process/results/<int:file_id>', methods=['GET'])
+@login_required
+def get_processing_results(file_id):
+    """Results of a completed job; ?fields=transcript,entities,speakers,sentiment_series selects parts"""
+    metadata, error = completed_job(file_id)
+    if error:
+        return error
+    fields = tuple(field.strip() for field in request.args.get('fields', '').split(',') if field.strip())
+    unknown = set(fields) - set(result_store.HEAVY_FIELDS)
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(sorted(unknown))}, "
+                                 f"expected {', '.join(result_store.HEAVY_FIELDS)}"}), 400
+    return jsonify(serialize_results(metadata, fields or result_store.HEAVY_FIELDS))
+
+@processing_bp.route('/api/process/results/<int:file_id>/segments', methods=['GET'])
+@login_required
+def get_transcript_segments(file_id):
+    """Transcript segments overlapping ?start= to ?end= seconds (both optional)"""
+    metadata, error = completed_job(file_id)
+    if error:
+        return error
+    try:
+        start, end = (float(request.args[name]) if request.args.get(name) else None for name in ('start', 'end'))
+    except ValueError:
+        return jsonify({'error': 'start and end must be numbers of seconds'}), 400
+    return jsonify({
+        'start': start,
+        'end': end,
+        'segments': result_store.load_segments(metadata, start, end)
+    })
+
+@processing_bp.route('/api/process/events', methods=['GET'])
+@login_required
+def stream_events():
+    """Server-Sent Events stream of the user's job changes.
+
+    Each event is a small delta (status, progress, stage states, and a
+    results_url once completed). The stream ends after EVENTS_STREAM_SECONDS;
+    EventSource reconnects with Last-Event-ID and resumes where it left off.
+    """
+    user_id = current_user.id
+    after_id = _stream_start()
+    config = current_app.config
+
+    def generate():
+        yield f"retry: {config['EVENTS_RETRY_MS']}\n\n"
+        for event in events.subscribe(user_id, after_id, config['EVENTS_POLL_INTERVAL'],
+                                      config['EVENTS_HEARTBEAT_SECONDS'], config['EVENTS_STREAM_SECONDS']):
+            yield ': keepalive\n\n' if event is None else format_sse(*event)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@processing_bp.cli.command('migrate-results')
+def migrate_results_command():
+    """Move inline results of earlier jobs into the result store (flask processing migrate-results)"""
+    moved = result_store.migrate_inline_results()
+    print(f"Moved results of {moved} jobs")
@@ -0,0 +1,38 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_login import login_required, current_user
+from models import File, db
+from utils.search_index import SearchError, search, reindex_all
+
+search_bp = Blueprint('search', __name__)
+
+@search_bp.route('/api/search', methods=['GET'])
+@login_required
+def search_files():
+    """Ranked full-text search over the user's transcripts and entities.
+
+    Query parameters: q, label (comma separated entity labels, all required),
+    limit and offset. Snippets are HTML: transcript text is escaped and
+    matches are wrapped in <mark>.
+    """
+    labels = [label.strip() for label in request.args.get('label', '').split(',') if label.strip()]
+    try:
+        limit = int(request.args.get('limit', 20))
+        offset = int(request.args.get('offset', 0))
+        results = search(current_user.id, request.args.get('q', ''), labels, limit, offset,
+                         current_app.config['SEARCH_BACKEND'])
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    except SearchError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Indexes can briefly lag deletions; only return files that still exist
+    names = dict(db.session.query(File.id, File.filename)
+                 .filter(File.id.in_([r['file_id'] for r in results]), File.user_id == current_user.id)
+                 .all()) if results else {}
+    return jsonify({'results': [dict(r, filename=names[r['file_id']]) for r in results if r['file_id'] in names]})
+
+@search_bp.cli.command('reindex')
+def reindex_command():
+    """Index every processed file (flask search reindex)"""
+    count = reindex_all(current_app.config['SEARCH_BACKEND'])
+    print(f"Indexed {count} files")
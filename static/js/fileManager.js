@@ -3,46 +3,212 @@ document.addEventListener('DOMContentLoaded', function() {
     const filesList = document.getElementById('filesList');
     const processingModal = new bootstrap.Modal(document.getElementById('processingModal'));
 
-    function loadFiles() {
-        fetch('/api/files')
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
+    const typeFilter = document.getElementById('typeFilter');
+    const sortOrder = document.getElementById('sortOrder');
+    const PAGE_SIZE = 50;
+    let nextCursor = null;
+
+    const STATUS_BADGES = {
+        queued: ['bg-secondary', 'Queued'],
+        processing: ['bg-primary', 'Processing'],
+        completed: ['bg-success', 'Completed'],
+        failed: ['bg-danger', 'Failed']
+    };
+
+    function statusBadge(processing) {
+        const [style, label] = (processing && STATUS_BADGES[processing.status]) || ['bg-light text-dark', 'Not processed'];
+        return `<span class="status-badge badge ${style}">${label}</span>`;
+    }
+
+    // Loads one page at a time; append continues from the last page's cursor
+    function loadFiles(append = false) {
+        const [sort, order] = sortOrder.value.split(':');
+        const params = new URLSearchParams({limit: PAGE_SIZE, sort, order, include_status: 'true'});
+        if (typeFilter.value) params.set('type', typeFilter.value);
+        if (append && nextCursor) params.set('cursor', nextCursor);
+
+        fetch(`/api/files?${params}`)
             .then(response => response.json())
-            .then(files => {
-                filesList.innerHTML = files.map(file => `
+            .then(page => {
+                const rows = page.files.map(file => `
                     <tr>
+                        <td>
+                            <div class="form-check">
+                                <input class="form-check-input file-checkbox" type="checkbox" value="${file.id}">
+                            </div>
+                        </td>
                         <td>${file.filename}</td>
                         <td>${file.filetype}</td>
                         <td>${formatFileSize(file.size)}</td>
                         <td>${new Date(file.created_at).toLocaleString()}</td>
+                        <td>${statusBadge(file.processing)}</td>
                         <td>
                             <button class="btn btn-sm btn-info" onclick="processFile(${file.id})">
                                 <i data-feather="play"></i>
                             </button>
+                            ${AUDIO_TYPES.includes(file.filetype) ? `
+                            <button class="btn btn-sm btn-secondary" onclick="playFile(this, ${file.id}, '${file.filetype}')">
+                                <i data-feather="headphones"></i>
+                            </button>` : ''}
+                            <a class="btn btn-sm btn-secondary" href="/api/files/${file.id}/content?download=1">
+                                <i data-feather="download"></i>
+                            </a>
                             <button class="btn btn-sm btn-danger" onclick="deleteFile(${file.id})">
                                 <i data-feather="trash-2"></i>
                             </button>
                         </td>
                     </tr>
                 `).join('');
+                if (append) {
+                    filesList.insertAdjacentHTML('beforeend', rows);
+                } else {
+                    filesList.innerHTML = rows;
+                }
+                nextCursor = page.next_cursor;
+                loadMoreBtn.classList.toggle('d-none', !nextCursor);
                 feather.replace();
             });
     }
 
+    loadMoreBtn.addEventListener('click', () => loadFiles(true));
+    typeFilter.addEventListener('change', () => loadFiles());
+    sortOrder.addEventListener('change', () => loadFiles());
+
+    const CHUNK_SIZE = 5 * 1024 * 1024;
+    const PARALLEL_CHUNKS = 4;
+    // Files are hashed one chunk-sized slice at a time, so memory stays flat; the
+    // limit bounds the delay before the upload starts (roughly 2s at this size)
+    const MAX_PREHASH_SIZE = 128 * 1024 * 1024;
+
+    function uploadIdFor(file) {
+        // Stable per file so an interrupted upload can be resumed after a reload
+        return `${file.name}-${file.size}-${file.lastModified}`.replace(/[^A-Za-z0-9_.-]/g, '_');
+    }
+
+    async function fetchUploadStatus(uploadId) {
+        const response = await fetch(`/api/files/upload-status/${encodeURIComponent(uploadId)}`);
+        if (response.status === 404) return null;
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error || 'Could not read upload status');
+        return data;
+    }
+
+    async function sha256Hex(file) {
+        const hash = new Sha256();
+        for (let start = 0; start < file.size; start += CHUNK_SIZE) {
+            hash.update(new Uint8Array(await file.slice(start, start + CHUNK_SIZE).arrayBuffer()));
+        }
+        return hash.hexDigest();
+    }
+
+    async function tryDeduplicatedUpload(file) {
+        if (file.size > MAX_PREHASH_SIZE) return null;
+        const response = await fetch('/api/files/upload-check', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                sha256: await sha256Hex(file),
+                filename: file.name,
+                fileSize: file.size
+            })
+        });
+        if (!response.ok) return null;
+        const data = await response.json();
+        return data.status === 'complete' ? data.file : null;
+    }
+
+    async function sendChunk(file, uploadId, chunkNumber, totalChunks) {
+        const start = chunkNumber * CHUNK_SIZE;
+        // The raw slice is the request body; the server writes it straight at its offset
+        const params = new URLSearchParams({
+            filename: file.name,
+            totalChunks,
+            fileSize: file.size,
+            chunkSize: CHUNK_SIZE
+        });
+        const url = `/api/files/upload/${encodeURIComponent(uploadId)}/${chunkNumber}?${params}`;
+
+        for (let attempt = 0; ; attempt++) {
+            try {
+                const response = await fetch(url, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/octet-stream' },
+                    body: file.slice(start, Math.min(start + CHUNK_SIZE, file.size))
+                });
+                const data = await response.json();
+                // Another chunk already completed the set and triggered assembly
+                if (response.ok || data.status === 'finalizing') return data;
+                throw new Error(data.error || 'Chunk upload failed');
+            } catch (error) {
+                if (attempt >= 3) throw error;
+                await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+            }
+        }
+    }
+
+    async function discardUpload(uploadId) {
+        const response = await fetch(`/api/files/upload/${encodeURIComponent(uploadId)}`, { method: 'DELETE' });
+        if (!response.ok && response.status !== 404) {
+            const data = await response.json();
+            throw new Error(data.error || 'Could not restart upload');
+        }
+    }
+
+    async function waitForAssembly(uploadId) {
+        for (;;) {
+            const state = await fetchUploadStatus(uploadId);
+            if (!state) throw new Error('Upload expired, please upload the file again');
+            if (state.status === 'complete' || state.status === 'failed') {
+                // The outcome has been read; free the server-side temp dir so the
+                // same file can be uploaded again later
+                discardUpload(uploadId).catch(() => {});
+                if (state.status === 'failed') throw new Error(state.error || 'Upload failed');
+                return state.file;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
     async function uploadFile(file) {
-        const formData = new FormData();
-        formData.append('file', file);
-        
-        // Create progress bar
         const progressBar = createProgressBar(file.name);
-        
+        const uploadId = uploadIdFor(file);
+        const totalChunks = Math.max(1, Math.ceil(file.size / CHUNK_SIZE));
+
         try {
-            const response = await fetch('/api/files', {
-                method: 'POST',
-                body: formData
+            if (await tryDeduplicatedUpload(file)) {
+                showToast('File already stored, upload skipped', 'success');
+                loadFiles();
+                return;
+            }
+
+            // Ask the server which chunks it already has and only send the rest
+            let existing = await fetchUploadStatus(uploadId);
+            if (existing && (existing.status === 'complete' || existing.status === 'failed')) {
+                // Left over from an earlier attempt at the same file; start over
+                await discardUpload(uploadId);
+                existing = null;
+            }
+            let pending = [...Array(totalChunks).keys()];
+            if (existing && existing.missingChunks) {
+                pending = existing.missingChunks;
+            } else if (existing) {
+                // Already assembling
+                pending = [];
+            }
+            let done = totalChunks - pending.length;
+            updateProgress(progressBar, Math.round(done / totalChunks * 100));
+
+            const workers = Array.from({ length: Math.min(PARALLEL_CHUNKS, pending.length) }, async () => {
+                while (pending.length) {
+                    await sendChunk(file, uploadId, pending.shift(), totalChunks);
+                    done++;
+                    updateProgress(progressBar, Math.round(done / totalChunks * 100));
+                }
             });
-            
-            const data = await response.json();
-            if (!response.ok) throw new Error(data.error || 'Upload failed');
-            
+            await Promise.all(workers);
+
+            await waitForAssembly(uploadId);
             showToast('File uploaded successfully', 'success');
             loadFiles();
         } catch (error) {
@@ -52,6 +218,35 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    async function handleFiles(files) {
+        for (const file of Array.from(files)) {
+            await uploadFile(file);
+        }
+    }
+
+    function createProgressBar(filename) {
+        const progressWrapper = document.createElement('div');
+        progressWrapper.className = 'progress-wrapper';
+        progressWrapper.innerHTML = `
+            <div class="d-flex justify-content-between">
+                <small>${filename}</small>
+                <small class="progress-percentage">0%</small>
+            </div>
+            <div class="progress">
+                <div class="progress-bar" role="progressbar" style="width: 0%"></div>
+            </div>
+        `;
+        document.getElementById('individualProgress').appendChild(progressWrapper);
+        return progressWrapper;
+    }
+
+    function updateProgress(progressWrapper, percentage) {
+        const progressBar = progressWrapper.querySelector('.progress-bar');
+        const progressText = progressWrapper.querySelector('.progress-percentage');
+        progressBar.style.width = `${percentage}%`;
+        progressText.textContent = `${percentage}%`;
+    }
+
     uploadForm.addEventListener('submit', async function(e) {
         e.preventDefault();
         const fileInput = document.getElementById('fileInput');
@@ -61,55 +256,8 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        handleFiles(fileInput.files);
-        
-function createProgressBar(filename) {
-    const progressWrapper = document.createElement('div');
-    progressWrapper.className = 'progress-wrapper';
-    progressWrapper.innerHTML = `
-        <div class="d-flex justify-content-between">
-            <small>${filename}</small>
-            <small class="progress-percentage">0%</small>
-        </div>
-        <div class="progress">
-            <div class="progress-bar" role="progressbar" style="width: 0%"></div>
-        </div>
-    `;
-    document.getElementById('uploadProgress').appendChild(progressWrapper);
-    return progressWrapper;
-}
-
-function updateProgress(progressWrapper, percentage) {
-    const progressBar = progressWrapper.querySelector('.progress-bar');
-    const progressText = progressWrapper.querySelector('.progress-percentage');
-    progressBar.style.width = `${percentage}%`;
-    progressText.textContent = `${percentage}%`;
-}
-        // Show loading state
-        submitButton.disabled = true;
-        submitButton.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Uploading...';
-        
-        try {
-            const response = await fetch('/api/files', {
-                method: 'POST',
-                body: formData
-            });
-            
-            const data = await response.json();
-            
-            if (!response.ok) {
-                throw new Error(data.error || 'Upload failed');
-            }
-            
-            showToast('File uploaded successfully', 'success');
-            loadFiles();
-            fileInput.value = '';
-        } catch (error) {
-            showToast(error.message, 'danger');
-        } finally {
-            submitButton.disabled = false;
-            submitButton.innerHTML = originalButtonText;
-        }
+        await handleFiles(fileInput.files);
+        fileInput.value = '';
     });
 
     window.processFile = function(fileId) {
@@ -126,13 +274,41 @@ function updateProgress(progressWrapper, percentage) {
         });
     };
 
+    const AUDIO_TYPES = ['wav', 'mp3', 'amr'];
+
+    // Plays through the content endpoint: the browser fetches byte ranges as it
+    // buffers and seeks, so long recordings never have to be downloaded first
+    window.playFile = function(button, fileId, filetype) {
+        const row = button.closest('tr');
+        const next = row.nextElementSibling;
+        if (next && next.classList.contains('player-row')) {
+            next.querySelector('audio').pause();
+            next.remove();
+            return;
+        }
+        // Browsers cannot play AMR, so use the WAV decoded during processing
+        const variant = filetype === 'amr' ? '?variant=wav' : '';
+        row.insertAdjacentHTML('afterend', `
+            <tr class="player-row">
+                <td colspan="7">
+                    <audio class="w-100" controls autoplay preload="metadata" src="/api/files/${fileId}/content${variant}"></audio>
+                </td>
+            </tr>
+        `);
+        row.nextElementSibling.querySelector('audio').addEventListener('error', () => {
+            showToast(variant ? 'Process the file first to play it' : 'Could not play this file', 'warning');
+        });
+    };
+
     window.deleteFile = function(fileId) {
         if (confirm('Are you sure you want to delete this file?')) {
             fetch(`/api/files/${fileId}`, {
                 method: 'DELETE'
             })
-            .then(response => response.json())
-            .then(() => loadFiles());
+            .then(response => response.json().then(data => {
+                if (!response.ok) showToast(data.error || 'Delete failed', 'danger');
+                loadFiles();
+            }));
         }
     };
 
@@ -171,6 +347,65 @@ function updateProgress(progressWrapper, percentage) {
         processBatchBtn.disabled = selectedFiles.size === 0;
     }
     
+    // Follow a batch through the server's event stream; only small deltas are
+    // sent, full results are fetched from results_url when needed
+    function watchBatch(fileIds, progressBar, onDone) {
+        const pending = new Set(fileIds);
+        const total = pending.size;
+        let source = null;
+        let pollTimer = null;
+        if (total === 0) {
+            onDone();
+            return;
+        }
+
+        function applyStatus(fileId, status) {
+            if (!pending.has(fileId)) return;
+            const statusBadge = document.querySelector(`tr:has(input[value="${fileId}"]) .status-badge`);
+            if (status.status === 'completed' || status.status === 'failed') {
+                pending.delete(fileId);
+            }
+            if (statusBadge) {
+                if (status.status === 'completed') {
+                    statusBadge.className = 'status-badge badge bg-success';
+                    statusBadge.textContent = 'Completed';
+                } else if (status.status === 'failed') {
+                    statusBadge.className = 'status-badge badge bg-danger';
+                    statusBadge.textContent = 'Failed';
+                } else if (status.status === 'processing') {
+                    statusBadge.className = 'status-badge badge bg-primary';
+                    statusBadge.textContent = `Processing ${status.progress || 0}%`;
+                }
+            }
+            progressBar.style.width = `${((total - pending.size) / total) * 100}%`;
+            if (pending.size === 0) {
+                if (source) source.close();
+                if (pollTimer) clearInterval(pollTimer);
+                onDone();
+            }
+        }
+
+        // Catch up on anything that changed before the stream was (re)connected
+        async function syncStatus() {
+            const statusResponse = await fetch('/api/process/status');
+            const statusData = await statusResponse.json();
+            Array.from(pending).forEach(fileId => {
+                if (statusData[fileId]) applyStatus(fileId, statusData[fileId]);
+            });
+        }
+
+        if (window.EventSource) {
+            source = new EventSource('/api/process/events');
+            source.addEventListener('job', event => {
+                const data = JSON.parse(event.data);
+                applyStatus(data.file_id, data);
+            });
+            source.onopen = () => syncStatus();
+        } else {
+            pollTimer = setInterval(syncStatus, 2000);
+        }
+    }
+
     processBatchBtn.addEventListener('click', async function() {
         if (selectedFiles.size === 0) return;
         
@@ -190,52 +425,25 @@ function updateProgress(progressWrapper, percentage) {
                 })
             });
             
+            if (response.status === 429) {
+                const retryAfter = response.headers.get('Retry-After');
+                throw new Error(`Processing queue is full, try again in ${retryAfter || 'a few'} seconds`);
+            }
             if (!response.ok) throw new Error('Failed to start batch processing');
             
             const result = await response.json();
-            showToast(`Started processing ${result.queued_files.length} files`, 'info');
+            const skipped = result.skipped_files.length ? `, ${result.skipped_files.length} already in progress` : '';
+            showToast(`Started processing ${result.queued_files.length} files${skipped}`, 'info');
             
-            // Start polling for status
-            const statusInterval = setInterval(async () => {
-                const statusResponse = await fetch('/api/process/status');
-                const statusData = await statusResponse.json();
-                
-                let completed = 0;
-                let total = selectedFiles.size;
-                
-                result.queued_files.forEach(fileId => {
-                    const status = statusData[fileId];
-                    if (status) {
-                        const statusBadge = document.querySelector(`tr:has(input[value="${fileId}"]) .status-badge`);
-                        if (status.status === 'completed') {
-                            statusBadge.className = 'status-badge badge bg-success';
-                            statusBadge.textContent = 'Completed';
-                            completed++;
-                        } else if (status.status === 'failed') {
-                            statusBadge.className = 'status-badge badge bg-danger';
-                            statusBadge.textContent = 'Failed';
-                            completed++;
-                        } else if (status.status === 'processing') {
-                            statusBadge.className = 'status-badge badge bg-primary';
-                            statusBadge.textContent = 'Processing';
-                        }
-                    }
-                });
-                
-                const progress = (completed / total) * 100;
-                progressBar.style.width = `${progress}%`;
-                
-                if (completed === total) {
-                    clearInterval(statusInterval);
-                    showToast('Batch processing completed', 'success');
-                    setTimeout(() => {
-                        batchProgress.classList.add('d-none');
-                        selectedFiles.clear();
-                        selectAllCheckbox.checked = false;
-                        updateProcessBatchButton();
-                    }, 2000);
-                }
-            }, 2000);
+            watchBatch(result.queued_files, progressBar, () => {
+                showToast('Batch processing completed', 'success');
+                setTimeout(() => {
+                    batchProgress.classList.add('d-none');
+                    selectedFiles.clear();
+                    selectAllCheckbox.checked = false;
+                    updateProcessBatchButton();
+                }, 2000);
+            });
             
         } catch (error) {
             showToast(error.message, 'danger');
@@ -0,0 +1,153 @@
+import os
+import time
+import hashlib
+import logging
+import importlib.util
+import threading
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+class ASRError(Exception):
+    """Custom exception for speech recognition errors"""
+    pass
+
+class TransientASRError(ASRError):
+    """A failure worth retrying, such as a network or rate-limit error"""
+    pass
+
+class RecognizerBackend(ABC):
+    """Speech recognizer used by transcribe_segments.
+
+    Backends declare their concurrency so the scheduler can size pools:
+    max_concurrency is how many segments of one file may be recognized at
+    once (threads), and worker_processes is how many processes the
+    transcription pool should run for this backend. batch_size is how many
+    segments are handed to transcribe_batch at a time.
+    """
+    name = None
+    max_concurrency = 1
+    worker_processes = 1
+    batch_size = 1
+
+    def __init__(self, **options):
+        self.options = options
+
+    @property
+    def version(self):
+        """Identifies the model/engine; part of result cache keys"""
+        return self.name
+
+    @abstractmethod
+    def transcribe(self, frame_data, sample_rate, sample_width):
+        """Return the text for one segment of PCM audio ('' when nothing was said)"""
+
+    def transcribe_batch(self, segments):
+        """Recognize several (frame_data, sample_rate, sample_width) segments in one call"""
+        return [self.transcribe(*segment) for segment in segments]
+
+class GoogleBackend(RecognizerBackend):
+    """Google Web Speech API via SpeechRecognition; network bound, so many threads"""
+    name = 'google'
+    max_concurrency = 8
+    worker_processes = 2
+
+    def transcribe(self, frame_data, sample_rate, sample_width):
+        import speech_recognition as sr
+        audio = sr.AudioData(frame_data, sample_rate, sample_width)
+        try:
+            return sr.Recognizer().recognize_google(audio, language=self.options.get('language', 'en-US'))
+        except sr.UnknownValueError:
+            return ''
+        except sr.RequestError as e:
+            raise TransientASRError(str(e))
+
+class LocalBackend(RecognizerBackend):
+    """Offline recognition with no network round-trip.
+
+    Runs CMU PocketSphinx through SpeechRecognition; pocketsphinx is an
+    optional dependency (the local-asr extra). The decoder is CPU bound, so
+    it takes one segment at a time per process and scales by running one
+    transcription process per core. PocketSphinx has no batch decoding:
+    batch_size only groups segments into one pool task to cut per-task
+    overhead, and the segments in it are still decoded one after another.
+    """
+    name = 'local'
+    max_concurrency = 1
+    worker_processes = os.cpu_count() or 1
+    batch_size = 8
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        # Checked up front so a missing engine fails with an install hint, not a decode error per segment
+        if importlib.util.find_spec('pocketsphinx') is None:
+            raise ASRError("ASR_BACKEND=local needs PocketSphinx, which is not installed; "
+                           "install it with: pip install 'pocketsphinx>=5.0.0' (or the local-asr extra)")
+
+    @property
+    def version(self):
+        try:
+            from importlib.metadata import version
+            return f"{self.name}:pocketsphinx-{version('pocketsphinx')}"
+        except Exception:
+            return self.name
+
+    def transcribe(self, frame_data, sample_rate, sample_width):
+        return self.transcribe_batch([(frame_data, sample_rate, sample_width)])[0]
+
+    def transcribe_batch(self, segments):
+        # Sequential: recognize_sphinx decodes a single utterance per call
+        import speech_recognition as sr
+        recognizer = sr.Recognizer()
+        texts = []
+        for frame_data, sample_rate, sample_width in segments:
+            audio = sr.AudioData(frame_data, sample_rate, sample_width)
+            try:
+                texts.append(recognizer.recognize_sphinx(audio, language=self.options.get('language', 'en-US')))
+            except sr.UnknownValueError:
+                texts.append('')
+            except sr.RequestError as e:
+                # Missing pocketsphinx or language data: retrying will not help
+                raise ASRError(str(e))
+        return texts
+
+class FakeBackend(RecognizerBackend):
+    """Deterministic stand-in for load tests and local development.
+
+    Produces roughly two words per second of audio, chosen from a hash of the
+    samples, so the same audio always yields the same text. An optional
+    latency (seconds of delay per second of audio) simulates a real engine.
+    """
+    name = 'fake'
+    max_concurrency = 32
+    worker_processes = 1
+    WORDS = ('alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel',
+             'india', 'juliet', 'kilo', 'lima', 'mike', 'november', 'oscar', 'papa')
+
+    def transcribe(self, frame_data, sample_rate, sample_width):
+        seconds = len(frame_data) / float(sample_rate * sample_width)
+        latency = float(self.options.get('latency', 0))
+        if latency:
+            time.sleep(seconds * latency)
+        digest = hashlib.sha256(frame_data).digest()
+        count = max(1, int(seconds * 2))
+        return ' '.join(self.WORDS[digest[i % len(digest)] % len(self.WORDS)] for i in range(count))
+
+BACKENDS = {backend.name: backend for backend in (GoogleBackend, LocalBackend, FakeBackend)}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+def backend_class(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ASRError(f"Unknown ASR backend '{name}', expected one of {sorted(BACKENDS)}")
+
+def get_backend(name, **options):
+    """Backend instance for this process, created once per (name, options)"""
+    key = (name, tuple(sorted(options.items())))
+    with _instances_lock:
+        if key not in _instances:
+            _instances[key] = backend_class(name)(**options)
+        return _instances[key]
@@ -0,0 +1,164 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import subprocess
+import wave
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Canonical decoded form shared by every audio stage
+SAMPLE_RATE = 16000
+CHANNELS = 1
+SAMPLE_WIDTH = 2
+
+DEFAULT_CACHE_DIR = os.path.join(os.getcwd(), 'uploads', 'cache', 'audio')
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024 * 1024  # 5GB
+PIN_SUFFIX = '.pin'
+# Pins left behind by a crashed worker stop protecting their entry after this long
+PIN_MAX_AGE_SECONDS = 24 * 3600
+
+class AudioCacheError(Exception):
+    """Custom exception for audio cache errors"""
+    pass
+
+def cache_key(file_path, content_hash=None):
+    """Content hash when known, otherwise path + size + mtime"""
+    if content_hash:
+        return content_hash
+    stat = os.stat(file_path)
+    ident = f'{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return hashlib.sha256(ident.encode()).hexdigest()
+
+def is_canonical_wav(file_path):
+    """True if file_path already is mono 16kHz 16-bit PCM and needs no decode"""
+    if not file_path.lower().endswith('.wav'):
+        return False
+    try:
+        with wave.open(file_path, 'rb') as w:
+            return (w.getnchannels() == CHANNELS and w.getframerate() == SAMPLE_RATE
+                    and w.getsampwidth() == SAMPLE_WIDTH)
+    except (wave.Error, EOFError, OSError):
+        return False
+
+def _decode_ffmpeg(ffmpeg, src, dst):
+    # ffmpeg streams the conversion, so memory stays flat regardless of duration
+    subprocess.run(
+        [ffmpeg, '-nostdin', '-v', 'error', '-y', '-i', src,
+         '-ac', str(CHANNELS), '-ar', str(SAMPLE_RATE), '-sample_fmt', 's16',
+         '-f', 'wav', dst],
+        check=True, capture_output=True
+    )
+
+def _decode_pydub(src, dst):
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(src)
+    audio = audio.set_channels(CHANNELS).set_frame_rate(SAMPLE_RATE).set_sample_width(SAMPLE_WIDTH)
+    audio.export(dst, format='wav')
+
+@contextmanager
+def pinned(file_path, content_hash=None, cache_dir=None):
+    """Keep the cached WAV of file_path from being evicted while the block runs.
+
+    A job's decode stage returns the cached path and its other stages open it
+    later, possibly in other processes, so the pin is a marker file next to
+    the entry rather than in-process state.
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    try:
+        key = cache_key(file_path, content_hash)
+    except FileNotFoundError:
+        # Nothing will be decoded; the stages report the missing file
+        yield
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    pin_path = os.path.join(cache_dir, f'{key}.{uuid.uuid4().hex}{PIN_SUFFIX}')
+    open(pin_path, 'w').close()
+    try:
+        yield
+    finally:
+        try:
+            os.remove(pin_path)
+        except FileNotFoundError:
+            pass
+
+def evict(cache_dir, max_bytes, keep=None):
+    """Drop least recently used entries until the cache fits in max_bytes; pinned entries are kept"""
+    entries = []
+    pins = set()
+    total = 0
+    stale_before = time.time() - PIN_MAX_AGE_SECONDS
+    for entry in os.scandir(cache_dir):
+        if not entry.is_file():
+            continue
+        if entry.name.endswith(PIN_SUFFIX):
+            try:
+                if entry.stat().st_mtime < stale_before:
+                    os.remove(entry.path)
+                else:
+                    pins.add(entry.name.split('.', 1)[0])
+            except FileNotFoundError:
+                pass
+            continue
+        if not entry.name.endswith('.wav'):
+            continue
+        stat = entry.stat()
+        entries.append((stat.st_mtime, entry.path, stat.st_size))
+        total += stat.st_size
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep or os.path.basename(path)[:-len('.wav')] in pins:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+    return total
+
+def cached_wav(file_path, content_hash=None, cache_dir=None):
+    """Path of the canonical WAV for file_path if one already exists, otherwise None; never decodes"""
+    if is_canonical_wav(file_path):
+        return file_path
+    path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, f'{cache_key(file_path, content_hash)}.wav')
+    return path if os.path.exists(path) else None
+
+def get_normalized_wav(file_path, content_hash=None, cache_dir=None, max_bytes=None):
+    """Return the cached mono 16kHz 16-bit WAV for file_path, decoding at most once.
+
+    Hits refresh the entry's mtime, which is what eviction orders by.
+    """
+    if not os.path.exists(file_path):
+        raise AudioCacheError(f"File not found: {file_path}")
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+
+    path = os.path.join(cache_dir, f'{cache_key(file_path, content_hash)}.wav')
+    try:
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg:
+            _decode_ffmpeg(ffmpeg, file_path, tmp_path)
+        else:
+            _decode_pydub(file_path, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        stderr = getattr(e, 'stderr', None)
+        detail = stderr.decode(errors='replace').strip() if stderr else str(e)
+        raise AudioCacheError(f"Failed to decode {os.path.basename(file_path)}: {detail}")
+
+    evict(cache_dir, max_bytes, keep=path)
+    return path
@@ -0,0 +1,193 @@
+import numpy as np
+from functools import lru_cache
+
+# Standard short-time analysis settings for speech at 16kHz
+FRAME_SECONDS = 0.025
+HOP_SECONDS = 0.010
+N_FFT = 512
+N_MELS = 40
+N_MFCC = 13
+# Frames processed per vectorised block; bounds the working set for long files
+BLOCK_FRAMES = 8192
+
+def _hz_to_mel(hz):
+    return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+def _mel_to_hz(mel):
+    return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+@lru_cache(maxsize=8)
+def mel_filterbank(sample_rate, n_fft=N_FFT, n_mels=N_MELS):
+    """(n_mels, n_fft // 2 + 1) triangular mel filterbank"""
+    bins = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    edges = _mel_to_hz(np.linspace(_hz_to_mel(0.0), _hz_to_mel(sample_rate / 2.0), n_mels + 2))
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins[None, :] - lower) / np.maximum(center - lower, 1e-9)
+    falling = (upper - bins[None, :]) / np.maximum(upper - center, 1e-9)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+@lru_cache(maxsize=8)
+def dct_matrix(n_in=N_MELS, n_out=N_MFCC):
+    """Orthonormal DCT-II basis used to turn log-mel energies into MFCCs"""
+    n = np.arange(n_in)
+    basis = np.cos(np.pi / n_in * (n[None, :] + 0.5) * np.arange(n_out)[:, None])
+    basis *= np.sqrt(2.0 / n_in)
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+def frame_params(sample_rate):
+    frame_length = int(round(FRAME_SECONDS * sample_rate))
+    hop_length = int(round(HOP_SECONDS * sample_rate))
+    return frame_length, max(hop_length, 1)
+
+def extract_features(reader, n_mfcc=N_MFCC):
+    """Compute MFCCs and per-frame log energy for a WavReader.
+
+    Frames are processed in fixed-size blocks of strided views over the
+    memory-mapped samples, so memory grows only with the (small) feature
+    matrix, never with the raw audio.
+    Returns (mfcc[n_frames, n_mfcc], log_energy[n_frames], hop_seconds).
+    """
+    frame_length, hop_length = frame_params(reader.sample_rate)
+    n_fft = max(N_FFT, 1 << (frame_length - 1).bit_length())
+    window = np.hanning(frame_length).astype(np.float32)
+    fbank = mel_filterbank(reader.sample_rate, n_fft)
+    dct = dct_matrix(fbank.shape[0], n_mfcc)
+    scale = float(2 ** (8 * reader.sample_width - 1))
+
+    mfcc_blocks = []
+    energy_blocks = []
+    for _, frames in reader.iter_windows(frame_length, hop_length, BLOCK_FRAMES):
+        block = frames.astype(np.float32) / scale
+        block -= block.mean(axis=1, keepdims=True)
+        energy_blocks.append(10.0 * np.log10(np.mean(block ** 2, axis=1) + 1e-10))
+        power = np.abs(np.fft.rfft(block * window, n=n_fft, axis=1)) ** 2
+        log_mel = np.log(power.astype(np.float32) @ fbank.T + 1e-10)
+        mfcc_blocks.append(log_mel @ dct.T)
+
+    if not mfcc_blocks:
+        return np.zeros((0, n_mfcc), np.float32), np.zeros(0, np.float32), hop_length / reader.sample_rate
+    return (np.concatenate(mfcc_blocks).astype(np.float32),
+            np.concatenate(energy_blocks).astype(np.float32),
+            hop_length / reader.sample_rate)
+
+def frame_energy(reader):
+    """Per-frame log energy only; the cheap path for segmentation.
+
+    Returns (log_energy[n_frames], hop_seconds).
+    """
+    frame_length, hop_length = frame_params(reader.sample_rate)
+    scale = float(2 ** (8 * reader.sample_width - 1))
+    blocks = []
+    for _, frames in reader.iter_windows(frame_length, hop_length, BLOCK_FRAMES):
+        block = frames.astype(np.float32) / scale
+        blocks.append(10.0 * np.log10(np.var(block, axis=1) + 1e-10))
+    energy = np.concatenate(blocks).astype(np.float32) if blocks else np.zeros(0, np.float32)
+    return energy, hop_length / reader.sample_rate
+
+def detect_voice(log_energy, margin_db=12.0, floor_db=-55.0, smooth_frames=15):
+    """Energy-based voice activity detection.
+
+    A frame is voiced when it is margin_db above the noise floor (estimated as a
+    low percentile of frame energy) and above an absolute floor. The decision
+    is smoothed with a moving average so short dips inside words do not split
+    speech into fragments.
+    """
+    if len(log_energy) == 0:
+        return np.zeros(0, dtype=bool)
+    threshold = max(np.percentile(log_energy, 10) + margin_db, floor_db)
+    voiced = (log_energy > threshold).astype(np.float32)
+    if smooth_frames > 1:
+        kernel = np.ones(smooth_frames, dtype=np.float32) / smooth_frames
+        voiced = np.convolve(voiced, kernel, mode='same')
+    return voiced >= 0.5
+
+def voiced_runs(voiced):
+    """(start, end) frame index pairs of contiguous voiced runs, end exclusive"""
+    padded = np.concatenate(([False], voiced, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return edges.reshape(-1, 2)
+
+def split_speech(voiced, hop_seconds, max_seconds=30.0, max_gap_seconds=2.0, pad_seconds=0.2):
+    """Group voiced runs into (start, end) second ranges no longer than max_seconds.
+
+    Consecutive runs are packed into one segment while it stays under
+    max_seconds and the silence between them is at most max_gap_seconds, so
+    cuts fall in pauses and long silences are skipped. Speech longer than
+    max_seconds without any pause is split hard.
+    """
+    segments = []
+    max_frames = max(int(max_seconds / hop_seconds), 1)
+    max_gap = int(max_gap_seconds / hop_seconds)
+    pad = int(pad_seconds / hop_seconds)
+    current = None
+    for start, end in voiced_runs(voiced):
+        start, end = int(start), int(end)
+        if current is not None and start - current[1] <= max_gap and end - current[0] <= max_frames:
+            current[1] = end
+            continue
+        if current is not None:
+            segments.append(current)
+        # A single run longer than the limit is cut into max-length pieces
+        while end - start > max_frames:
+            segments.append([start, start + max_frames])
+            start += max_frames
+        current = [start, end]
+    if current is not None:
+        segments.append(current)
+    total = len(voiced)
+    return [(max(a - pad, 0) * hop_seconds, min(b + pad, total) * hop_seconds) for a, b in segments]
+
+def pool_voiced(features, voiced, pool_frames=25):
+    """Average voiced frames over fixed blocks to get one embedding per block.
+
+    Blocks with less than half their frames voiced are skipped. Returns
+    (embeddings[n, 2 * dim], block_start_frames[n]); each embedding holds the
+    mean and standard deviation of the block's voiced frames.
+    """
+    n_blocks = len(features) // pool_frames
+    if n_blocks == 0:
+        return np.zeros((0, features.shape[1] * 2), np.float32), np.zeros(0, dtype=np.int64)
+    usable = n_blocks * pool_frames
+    blocks = features[:usable].reshape(n_blocks, pool_frames, -1)
+    mask = voiced[:usable].reshape(n_blocks, pool_frames)
+    counts = mask.sum(axis=1)
+    keep = counts >= pool_frames // 2
+
+    weights = mask[keep][:, :, None].astype(np.float32)
+    kept = blocks[keep]
+    mean = (kept * weights).sum(axis=1) / counts[keep][:, None]
+    var = (((kept - mean[:, None, :]) ** 2) * weights).sum(axis=1) / counts[keep][:, None]
+    embeddings = np.hstack([mean, np.sqrt(var)]).astype(np.float32)
+    return embeddings, np.flatnonzero(keep) * pool_frames
+
+def standardize(features):
+    """Zero-mean, unit-variance columns so no coefficient dominates distances"""
+    std = features.std(axis=0)
+    return (features - features.mean(axis=0)) / np.where(std > 0, std, 1.0)
+
+def labels_to_segments(labels, block_starts, block_frames, hop_seconds, max_gap_seconds=0.5):
+    """Merge consecutive same-speaker blocks into {'speaker_N': [{'start', 'end'}]}.
+
+    Blocks labelled -1 (noise) are dropped. Same-speaker blocks separated by at
+    most max_gap_seconds are joined into one segment.
+    """
+    labels = np.asarray(labels)
+    keep = labels != -1
+    labels, block_starts = labels[keep], np.asarray(block_starts)[keep]
+    speakers = {}
+    if len(labels) == 0:
+        return speakers
+
+    starts = block_starts * hop_seconds
+    ends = (block_starts + block_frames) * hop_seconds
+    # A new segment starts where the speaker changes or the gap is too long
+    breaks = np.flatnonzero((labels[1:] != labels[:-1]) | (starts[1:] - ends[:-1] > max_gap_seconds)) + 1
+    first = np.concatenate(([0], breaks))
+    last = np.concatenate((breaks, [len(labels)])) - 1
+    for a, b in zip(first, last):
+        speakers.setdefault(f'speaker_{int(labels[a])}', []).append({
+            'start': round(float(starts[a]), 2),
+            'end': round(float(ends[b]), 2)
+        })
+    return speakers
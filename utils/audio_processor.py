@@ -1,89 +1,160 @@
-import speech_recognition as sr
-from pydub import AudioSegment
-import numpy as np
-from sklearn.cluster import DBSCAN
 import os
+import time
+import random
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from utils.audio_cache import get_normalized_wav, is_canonical_wav
+from utils.wav_reader import WavReader
+from utils.audio_features import (extract_features, frame_energy, detect_voice, split_speech, pool_voiced,
+                                  standardize, labels_to_segments)
+from utils.asr_backends import get_backend, TransientASRError
+from utils.speaker_clustering import cluster_speakers, DEFAULT_MAX_SPEAKERS, DEFAULT_SAMPLE_SIZE
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Diarization: 25 x 10ms frames = 250ms per clustered block
+POOL_FRAMES = 25
+MIN_VOICED_BLOCKS = 8
+
+# Transcription: segments are cut at silences and recognized in parallel
+SEGMENT_SECONDS = 30
+TRANSCRIPTION_CONCURRENCY = 4
+TRANSCRIPTION_RETRIES = 3
+DEFAULT_ASR_BACKEND = 'google'
+# Bump when a change to this module alters transcription or diarization output,
+# so cached results are recomputed (see utils/result_cache.py)
+TRANSCRIBE_VERSION = 1
+DIARIZE_VERSION = 1
+
 class AudioProcessingError(Exception):
     """Custom exception for audio processing errors"""
     pass
 
-def convert_to_wav(file_path):
-    """Convert audio file to WAV format"""
+def convert_to_wav(file_path, content_hash=None, cache_dir=None, max_bytes=None):
+    """Decode audio file to the cached canonical WAV (mono, 16kHz, 16-bit)"""
     try:
-        if not os.path.exists(file_path):
-            raise AudioProcessingError(f"File not found: {file_path}")
-            
-        audio = AudioSegment.from_file(file_path)
-        wav_path = file_path.rsplit('.', 1)[0] + '.wav'
-        audio.export(wav_path, format='wav')
-        return wav_path
+        return get_normalized_wav(file_path, content_hash, cache_dir, max_bytes)
     except Exception as e:
         logger.error(f"Error converting audio file: {str(e)}")
         raise AudioProcessingError(f"Failed to convert audio file: {str(e)}")
 
-def transcribe_audio(file_path):
-    """Transcribe audio file to text"""
+def prepare_wav(file_path, content_hash=None, cache_dir=None, max_bytes=None):
+    """Return a canonical WAV path for file_path, decoding at most once across stages"""
+    if not os.path.exists(file_path):
+        raise AudioProcessingError(f"File not found: {file_path}")
+    if is_canonical_wav(file_path):
+        return file_path
+    return convert_to_wav(file_path, content_hash, cache_dir, max_bytes)
+
+def _with_retries(call, retries):
+    """Run call(), retrying transient recognizer errors with jittered backoff"""
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except TransientASRError:
+            if attempt == retries:
+                raise
+            time.sleep(min(2 ** attempt, 30) * random.uniform(0.5, 1.0))
+
+def transcribe_segments(file_path, max_segment_seconds=SEGMENT_SECONDS, concurrency=TRANSCRIPTION_CONCURRENCY,
+                        retries=TRANSCRIPTION_RETRIES, backend=DEFAULT_ASR_BACKEND, backend_options=None):
+    """Transcribe audio file segment by segment.
+
+    Audio is split at silences into segments of at most max_segment_seconds,
+    which are recognized in parallel by the chosen backend (see
+    utils/asr_backends.py), up to the backend's own concurrency limit. A
+    segment that still fails after its retries is reported with its error
+    instead of failing the whole file.
+    Returns {'text': str, 'segments': [{'start', 'end', 'text'[, 'error']}]}.
+    """
     try:
         if not os.path.exists(file_path):
             raise AudioProcessingError(f"File not found: {file_path}")
             
-        if not file_path.endswith('.wav'):
-            file_path = convert_to_wav(file_path)
+        file_path = prepare_wav(file_path)
+        recognizer = get_backend(backend, **(backend_options or {}))
             
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(file_path) as source:
-            audio = recognizer.record(source)
-            
-        try:
-            transcript = recognizer.recognize_google(audio)
-            if not transcript:
+        with WavReader(file_path) as reader:
+            log_energy, hop_seconds = frame_energy(reader)
+            ranges = split_speech(detect_voice(log_energy), hop_seconds, max_segment_seconds)
+            if not ranges:
                 raise AudioProcessingError("No speech detected in audio")
-            return transcript
-        except sr.UnknownValueError:
+                
+            def audio_for(bounds):
+                start, end = bounds
+                samples = reader.channel()[int(start * reader.sample_rate):int(end * reader.sample_rate)]
+                return samples.tobytes(), reader.sample_rate, reader.sample_width
+                
+            def recognize_one(bounds):
+                segment = {'start': round(bounds[0], 2), 'end': round(bounds[1], 2)}
+                try:
+                    segment['text'] = _with_retries(lambda: recognizer.transcribe(*audio_for(bounds)), retries)
+                except Exception as e:
+                    logger.warning(f"Segment {bounds[0]:.1f}-{bounds[1]:.1f}s failed: {str(e)}")
+                    segment.update(text='', error=str(e))
+                return segment
+                
+            def recognize_batch(batch):
+                if len(batch) == 1:
+                    return [recognize_one(batch[0])]
+                try:
+                    texts = _with_retries(lambda: recognizer.transcribe_batch([audio_for(b) for b in batch]), retries)
+                except Exception as e:
+                    # Fall back to segment by segment so one bad segment cannot sink the batch
+                    logger.warning(f"Batch of {len(batch)} segments failed, retrying individually: {str(e)}")
+                    return [recognize_one(bounds) for bounds in batch]
+                return [{'start': round(a, 2), 'end': round(b, 2), 'text': text}
+                        for (a, b), text in zip(batch, texts)]
+                
+            size = max(recognizer.batch_size, 1)
+            batches = [ranges[i:i + size] for i in range(0, len(ranges), size)]
+            workers = max(min(concurrency, recognizer.max_concurrency), 1)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                segments = [segment for batch in pool.map(recognize_batch, batches) for segment in batch]
+                
+        if all('error' in segment for segment in segments):
+            raise AudioProcessingError(f"Speech recognition service error: {segments[0]['error']}")
+        transcript = ' '.join(segment['text'] for segment in segments if segment['text'])
+        if not transcript:
             raise AudioProcessingError("Speech recognition could not understand the audio")
-        except sr.RequestError as e:
-            raise AudioProcessingError(f"Speech recognition service error: {str(e)}")
-            
+        return {'text': transcript, 'segments': segments}
+        
     except Exception as e:
         logger.error(f"Error transcribing audio: {str(e)}")
         raise AudioProcessingError(f"Failed to transcribe audio: {str(e)}")
 
-def diarize_speakers(file_path):
-    """Identify different speakers in audio file"""
+def transcribe_audio(file_path):
+    """Transcribe audio file to text"""
+    return transcribe_segments(file_path)['text']
+
+def diarize_speakers(file_path, method=None, max_speakers=DEFAULT_MAX_SPEAKERS,
+                     sample_size=DEFAULT_SAMPLE_SIZE):
+    """Identify different speakers in audio file.
+
+    method selects the clustering backend (see utils/speaker_clustering.py).
+    Returns {'speaker_N': [{'start': seconds, 'end': seconds}, ...]}.
+    """
     try:
         if not os.path.exists(file_path):
             raise AudioProcessingError(f"File not found: {file_path}")
             
-        if not file_path.endswith('.wav'):
-            file_path = convert_to_wav(file_path)
+        file_path = prepare_wav(file_path)
             
-        audio = AudioSegment.from_wav(file_path)
-        samples = np.array(audio.get_array_of_samples())
-        
-        if len(samples) < 1024:
-            raise AudioProcessingError("Audio file too short for speaker diarization")
+        with WavReader(file_path) as reader:
+            mfcc, log_energy, hop_seconds = extract_features(reader)
             
-        # Simple clustering-based diarization
-        features = np.array([samples[i:i+1024] for i in range(0, len(samples), 1024)])
-        clustering = DBSCAN(eps=0.5, min_samples=5).fit(features)
-        
-        # Validate clustering results
-        unique_labels = set(clustering.labels_)
-        if len(unique_labels) <= 1:
+        # Only voiced audio is clustered, pooled into short blocks of frames
+        voiced = detect_voice(log_energy)
+        embeddings, block_starts = pool_voiced(mfcc, voiced, POOL_FRAMES)
+        if len(embeddings) < MIN_VOICED_BLOCKS:
+            raise AudioProcessingError("Not enough speech for speaker diarization")
+            
+        labels = cluster_speakers(standardize(embeddings), method, max_speakers, sample_size)
+        if len(set(labels) - {-1}) <= 1:
             logger.warning("Could not identify distinct speakers")
-            return {'speaker_1': [0]}
             
-        speakers = {'speaker_' + str(i): [] for i in unique_labels if i != -1}
-        for i, label in enumerate(clustering.labels_):
-            if label != -1:
-                speakers['speaker_' + str(label)].append(i * 1024 / audio.frame_rate)
-                
-        return speakers
+        return labels_to_segments(labels, block_starts, POOL_FRAMES, hop_seconds)
         
     except Exception as e:
         logger.error(f"Error in speaker diarization: {str(e)}")
@@ -0,0 +1,78 @@
+import os
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+HASH_BUFFER_SIZE = 1024 * 1024
+BLOB_DIRNAME = 'blobs'
+
+class BlobStoreError(Exception):
+    """Custom exception for blob store errors"""
+    pass
+
+def new_hasher():
+    return hashlib.sha256()
+
+def is_valid_digest(digest):
+    return isinstance(digest, str) and len(digest) == 64 and all(c in '0123456789abcdef' for c in digest)
+
+def hash_file(path, hasher=None):
+    """Feed a file into hasher in bounded buffers and return the hasher"""
+    hasher = hasher or new_hasher()
+    buf = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher
+
+def blob_path(upload_folder, digest, ext=''):
+    """Location of a blob: blobs/<2 hex>/<2 hex>/<digest>[.ext]
+
+    The extension is kept so tools that sniff formats by name (pydub/ffmpeg,
+    the WAV fast path in the audio processor) keep working on stored blobs.
+    """
+    if not is_valid_digest(digest):
+        raise BlobStoreError(f"Invalid content hash: {digest}")
+    name = f'{digest}.{ext}' if ext else digest
+    return os.path.join(upload_folder, BLOB_DIRNAME, digest[:2], digest[2:4], name)
+
+def blob_exists(upload_folder, digest, ext=''):
+    return os.path.exists(blob_path(upload_folder, digest, ext))
+
+def store_blob(upload_folder, src_path, digest, ext=''):
+    """Move src_path into the blob store, or drop it if the blob is already present.
+
+    Returns (path, created). Uses link() so two uploads of the same content
+    racing each other both end up pointing at one complete blob.
+    """
+    path = blob_path(upload_folder, digest, ext)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.link(src_path, path)
+        created = True
+    except FileExistsError:
+        created = False
+    except OSError:
+        # Filesystems without hard links: fall back to rename unless the blob exists
+        if os.path.exists(path):
+            created = False
+        else:
+            os.replace(src_path, path)
+            return path, True
+    os.remove(src_path)
+    return path, created
+
+def release_blob(path, remaining_references):
+    """Delete a blob once no File rows point at it any more"""
+    if remaining_references > 0:
+        return False
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    return True
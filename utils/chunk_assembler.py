@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import shutil
+import threading
+import logging
+from utils.blob_store import new_hasher, hash_file
+from utils.upload_manifest import data_path, take_file_hash, forget_file_hash
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bound for the user-space copy fallback; the kernel paths never buffer in Python
+COPY_BUFFER_SIZE = 1024 * 1024
+STATE_FILENAME = 'state.json'
+ASSEMBLED_FILENAME = 'assembled'
+FINAL_STATES = ('complete', 'failed')
+DEFAULT_UPLOAD_MAX_AGE_SECONDS = 24 * 3600
+# Pruning walks the whole temp folder, so each process runs it at most this often
+PRUNE_INTERVAL_SECONDS = 300
+_last_prune = 0
+
+class AssemblyError(Exception):
+    """Custom exception for chunk assembly errors"""
+    pass
+
+def chunk_path(temp_dir, chunk_number):
+    return os.path.join(temp_dir, f'chunk_{chunk_number}')
+
+def write_state(temp_dir, **state):
+    """Atomically replace the upload state file so readers never see a partial write"""
+    tmp_path = os.path.join(temp_dir, f'.{STATE_FILENAME}.{threading.get_ident()}')
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, os.path.join(temp_dir, STATE_FILENAME))
+
+def read_state(temp_dir):
+    try:
+        with open(os.path.join(temp_dir, STATE_FILENAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _copy_range(src_fd, dst_fd, length, dst_offset):
+    """Copy length bytes from the start of src_fd to dst_fd at dst_offset.
+
+    Prefers copy_file_range (no user-space copy, reflinks on CoW filesystems),
+    then sendfile, then a bounded-buffer pread/pwrite loop.
+    """
+    src_offset = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while src_offset < length:
+                copied = os.copy_file_range(src_fd, dst_fd, length - src_offset,
+                                            src_offset, dst_offset + src_offset)
+                if copied == 0:
+                    break
+                src_offset += copied
+            if src_offset == length:
+                return
+        except OSError as e:
+            logger.debug(f"copy_file_range unavailable, falling back: {str(e)}")
+
+    if hasattr(os, 'sendfile'):
+        try:
+            os.lseek(dst_fd, dst_offset + src_offset, os.SEEK_SET)
+            while src_offset < length:
+                sent = os.sendfile(dst_fd, src_fd, src_offset, length - src_offset)
+                if sent == 0:
+                    break
+                src_offset += sent
+            if src_offset == length:
+                return
+        except OSError as e:
+            logger.debug(f"sendfile unavailable, falling back: {str(e)}")
+
+    while src_offset < length:
+        data = os.pread(src_fd, min(COPY_BUFFER_SIZE, length - src_offset), src_offset)
+        if not data:
+            raise AssemblyError(f"Unexpected end of chunk data at offset {src_offset}")
+        os.pwrite(dst_fd, data, dst_offset + src_offset)
+        src_offset += len(data)
+
+def assemble_chunks(temp_dir, total_chunks, final_filepath, hasher=None):
+    """Concatenate chunk_0..chunk_{n-1} into final_filepath without loading chunks into memory.
+
+    When a hasher is given it is fed each chunk in order, so the content hash of
+    the whole file is available without a second pass over the assembled output.
+    """
+    sizes = []
+    for i in range(total_chunks):
+        path = chunk_path(temp_dir, i)
+        if not os.path.exists(path):
+            raise AssemblyError(f"Missing chunk {i} of {total_chunks}")
+        sizes.append(os.path.getsize(path))
+    total_size = sum(sizes)
+
+    dst_fd = os.open(final_filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        # Reserve the full extent up front so the copies below never extend the file
+        if total_size and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(dst_fd, 0, total_size)
+            except OSError:
+                os.ftruncate(dst_fd, total_size)
+
+        offset = 0
+        for i, size in enumerate(sizes):
+            src_fd = os.open(chunk_path(temp_dir, i), os.O_RDONLY)
+            try:
+                _copy_range(src_fd, dst_fd, size, offset)
+            finally:
+                os.close(src_fd)
+            if hasher is not None:
+                # The chunk was just read by the copy, so this is served from page cache
+                hash_file(chunk_path(temp_dir, i), hasher)
+            offset += size
+        os.ftruncate(dst_fd, total_size)
+    except Exception:
+        os.close(dst_fd)
+        os.remove(final_filepath)
+        raise
+    os.close(dst_fd)
+    return total_size
+
+def remove_chunks(temp_dir):
+    """Remove chunk data but keep the state file so clients can still poll the outcome"""
+    for name in os.listdir(temp_dir):
+        if name == STATE_FILENAME:
+            continue
+        path = os.path.join(temp_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+def discard_upload(temp_dir):
+    """Remove an upload's temp dir, e.g. once its outcome was read or to restart it.
+
+    Returns False while the upload is being assembled, since the assembler
+    thread still owns its files.
+    """
+    state = read_state(temp_dir)
+    if state is not None and state.get('status') not in FINAL_STATES:
+        return False
+    forget_file_hash(temp_dir)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    return True
+
+def _last_activity(temp_dir):
+    latest = os.path.getmtime(temp_dir)
+    for entry in os.scandir(temp_dir):
+        try:
+            latest = max(latest, entry.stat(follow_symlinks=False).st_mtime)
+        except FileNotFoundError:
+            continue
+    return latest
+
+def prune_uploads(temp_root, max_age_seconds=DEFAULT_UPLOAD_MAX_AGE_SECONDS):
+    """Remove upload temp dirs untouched for max_age_seconds, at most once per PRUNE_INTERVAL_SECONDS.
+
+    Covers abandoned uploads as well as finished ones whose outcome was never
+    collected, and assemblies whose process died before writing a final state.
+    """
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < PRUNE_INTERVAL_SECONDS:
+        return 0
+    _last_prune = now
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    try:
+        entries = list(os.scandir(temp_root))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if not entry.is_dir(follow_symlinks=False) or _last_activity(entry.path) >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        forget_file_hash(entry.path)
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed += 1
+    if removed:
+        logger.info(f"Pruned {removed} abandoned uploads")
+    return removed
+
+def _finalize(app, temp_dir, total_chunks, on_complete, in_place):
+    with app.app_context():
+        try:
+            if in_place:
+                # The chunks were written at their offsets as they arrived and
+                # normally hashed on the way in; only an upload this process did
+                # not see from its first chunk needs a full read here
+                assembled_path = data_path(temp_dir)
+                content_hash = take_file_hash(temp_dir, total_chunks) or hash_file(assembled_path).hexdigest()
+            else:
+                assembled_path = os.path.join(temp_dir, ASSEMBLED_FILENAME)
+                # Normally hashed while the chunks arrived; otherwise while copying them
+                content_hash = take_file_hash(temp_dir, total_chunks)
+                hasher = new_hasher() if content_hash is None else None
+                assemble_chunks(temp_dir, total_chunks, assembled_path, hasher)
+                content_hash = content_hash or hasher.hexdigest()
+            file_info = on_complete(assembled_path, content_hash)
+            remove_chunks(temp_dir)
+            write_state(temp_dir, status='complete', file=file_info)
+        except Exception as e:
+            logger.error(f"Error assembling upload {os.path.basename(temp_dir)}: {str(e)}")
+            # The chunks are not reused: a retry discards this upload and starts over
+            forget_file_hash(temp_dir)
+            try:
+                remove_chunks(temp_dir)
+            except OSError as cleanup_error:
+                logger.warning(f"Could not remove chunks of {os.path.basename(temp_dir)}: {cleanup_error}")
+            write_state(temp_dir, status='failed', error=str(e))
+
+def start_assembly(app, temp_dir, total_chunks, on_complete, in_place=False):
+    """Assemble an upload on a background thread.
+
+    on_complete(assembled_path, content_hash) runs inside an app context once the
+    bytes are in place. It takes ownership of assembled_path and must return a
+    JSON-serialisable description of the stored file. in_place uploads already
+    wrote their chunks into the data file, so only the content hash is computed.
+    """
+    write_state(temp_dir, status='assembling')
+    thread = threading.Thread(
+        target=_finalize,
+        args=(app, temp_dir, total_chunks, on_complete, in_place),
+        name=f'assembler_{os.path.basename(temp_dir)}',
+        daemon=True
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,105 @@
+# Processing cost estimates used to order the job queue.
+#
+# A stage's runtime is modelled as a rate times the size of its input: seconds
+# per second of audio for audio files (from the probed duration), seconds per
+# KB for text files. The defaults below are deliberately rough; calibrate()
+# replaces them with the median rate seen in recently completed jobs, so the
+# estimates follow the configured ASR backend and the hardware.
+#
+# The queue is ordered by schedule_key = queued time + weight * estimated cost:
+# shortest job first among jobs queued at about the same time, while a long
+# job only ever yields to work queued up to weight * cost seconds after it,
+# so it cannot starve.
+import time
+import logging
+import threading
+from datetime import datetime
+from statistics import median
+from models import File, FileMetadata, db
+
+logger = logging.getLogger(__name__)
+
+AUDIO_TYPES = ('wav', 'mp3', 'amr')
+DEFAULT_RATES = {
+    'audio': {'decode': 0.02, 'transcribe': 0.5, 'diarize': 0.1, 'sentiment': 0.005, 'entities': 0.01},
+    'text': {'read_text': 0.0005, 'sentiment': 0.002, 'entities': 0.02}
+}
+# Without a probed duration, audio length is guessed from typical bitrates
+BYTES_PER_SECOND = {'wav': 32000, 'mp3': 16000, 'amr': 1600}
+DEFAULT_COST_WEIGHT = 1.0
+CALIBRATION_SAMPLE = 200
+CALIBRATION_INTERVAL_SECONDS = 300
+# Observations needed before a measured rate replaces the default
+CALIBRATION_MIN_SAMPLES = 5
+EPOCH = datetime(1970, 1, 1)
+
+_rates = None
+_calibrated_at = 0
+_lock = threading.Lock()
+
+def kind_of(filetype):
+    return 'audio' if filetype in AUDIO_TYPES else 'text'
+
+def work_units(filetype, size, duration_seconds=None):
+    """Input size a stage rate applies to: audio seconds, or KB of text"""
+    if kind_of(filetype) == 'audio':
+        if duration_seconds:
+            return duration_seconds
+        return (size or 0) / BYTES_PER_SECOND.get(filetype, BYTES_PER_SECOND['wav'])
+    return (size or 0) / 1024
+
+def calibrate():
+    """Median observed rate per (kind, stage) over recently completed jobs.
+
+    Cached and stage reports with no duration are ignored, and a rate needs
+    CALIBRATION_MIN_SAMPLES observations, otherwise the default is kept.
+    """
+    rows = (db.session.query(File.filetype, File.size, File.duration_seconds, FileMetadata.processing_stages)
+            .join(FileMetadata, FileMetadata.file_id == File.id)
+            .filter(FileMetadata.processing_status == 'completed', FileMetadata.processing_stages.isnot(None))
+            .order_by(FileMetadata.processing_completed_at.desc())
+            .limit(CALIBRATION_SAMPLE)
+            .all())
+    observed = {}
+    for filetype, size, duration_seconds, stages in rows:
+        units = work_units(filetype, size, duration_seconds)
+        if units <= 0:
+            continue
+        for stage, report in (stages or {}).items():
+            if report.get('status') == 'completed' and report.get('duration') is not None:
+                observed.setdefault((kind_of(filetype), stage), []).append(report['duration'] / units)
+    rates = {kind: dict(defaults) for kind, defaults in DEFAULT_RATES.items()}
+    for (kind, stage), samples in observed.items():
+        if len(samples) >= CALIBRATION_MIN_SAMPLES and stage in rates[kind]:
+            rates[kind][stage] = median(samples)
+    return rates
+
+def current_rates():
+    """Calibrated rates, refreshed at most every CALIBRATION_INTERVAL_SECONDS per process"""
+    global _rates, _calibrated_at
+    now = time.monotonic()
+    if _rates is not None and now - _calibrated_at < CALIBRATION_INTERVAL_SECONDS:
+        return _rates
+    with _lock:
+        if _rates is None or now - _calibrated_at >= CALIBRATION_INTERVAL_SECONDS:
+            try:
+                _rates = calibrate()
+            except Exception as e:
+                logger.warning(f"Cost calibration failed, using default rates: {e}")
+                _rates = _rates or DEFAULT_RATES
+            _calibrated_at = now
+    return _rates
+
+def estimate_stages(filetype, size, duration_seconds=None, rates=None):
+    """Predicted seconds per pipeline stage"""
+    rates = (rates or current_rates())[kind_of(filetype)]
+    units = work_units(filetype, size, duration_seconds)
+    return {stage: round(rate * units, 3) for stage, rate in rates.items()}
+
+def estimate(filetype, size, duration_seconds=None, rates=None):
+    """Predicted total processing seconds of a file, summed over its stages"""
+    return round(sum(estimate_stages(filetype, size, duration_seconds, rates).values()), 3)
+
+def schedule_key(queued_at, cost, weight=DEFAULT_COST_WEIGHT):
+    """Claim order of a job: its queue time in epoch seconds, pushed back by weight * cost"""
+    return (queued_at - EPOCH).total_seconds() + weight * (cost or 0)
@@ -0,0 +1,90 @@
+# Cross-process processing events for the progress stream.
+#
+# Job state changes are appended to the processing_event table in the same
+# transaction as the change itself, so any worker process can publish and any
+# web process can stream them to its clients. Subscribers read events after
+# the last id they have seen; old events are pruned after a retention period.
+import time
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from models import File, FileMetadata, ProcessingEvent, db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_SECONDS = 3600
+# Pruning is a table-wide delete, so each process runs it at most this often
+PRUNE_INTERVAL_SECONDS = 60
+_last_prune = 0
+
+def publish(job_id, status, **data):
+    """Add an event for a job to the current session; the caller commits it"""
+    data['status'] = status
+    db.session.add(ProcessingEvent(job_id=job_id, data=data))
+
+def publish_many(job_ids, status, **data):
+    """Add the same event for many jobs with one bulk insert"""
+    data['status'] = status
+    if job_ids:
+        db.session.execute(insert(ProcessingEvent), [{'job_id': job_id, 'data': data, 'created_at': datetime.utcnow()}
+                                                     for job_id in job_ids])
+
+def stage_statuses(stages):
+    """Compact {stage: status} form of a pipeline report for events"""
+    return {name: report['status'] for name, report in (stages or {}).items()}
+
+def latest_id():
+    return db.session.query(db.func.max(ProcessingEvent.id)).scalar() or 0
+
+def read_events(user_id, after_id, limit=500):
+    """A user's events newer than after_id, oldest first, as (id, file_id, data)"""
+    return (db.session.query(ProcessingEvent.id, FileMetadata.file_id, ProcessingEvent.data)
+            .join(FileMetadata, ProcessingEvent.job_id == FileMetadata.id)
+            .join(File, FileMetadata.file_id == File.id)
+            .filter(ProcessingEvent.id > after_id, File.user_id == user_id)
+            .order_by(ProcessingEvent.id)
+            .limit(limit)
+            .all())
+
+def subscribe(user_id, after_id, poll_interval=0.5, heartbeat_seconds=15, max_seconds=None):
+    """Yield (id, file_id, data) events as they arrive, or None as a keepalive.
+
+    The database connection is returned to the pool between polls, so an
+    idle subscriber holds no connection.
+    """
+    started = last_sent = time.monotonic()
+    while max_seconds is None or time.monotonic() - started < max_seconds:
+        try:
+            events = read_events(user_id, after_id)
+        finally:
+            db.session.remove()
+        for event in events:
+            after_id = event[0]
+            yield event
+        now = time.monotonic()
+        if events:
+            last_sent = now
+        elif now - last_sent >= heartbeat_seconds:
+            last_sent = now
+            yield None
+        if not events:
+            time.sleep(poll_interval)
+
+def remove(job_ids):
+    """Delete the events of deleted jobs; the caller commits"""
+    if job_ids:
+        ProcessingEvent.query.filter(ProcessingEvent.job_id.in_(job_ids)).delete(synchronize_session=False)
+
+def prune(retention_seconds=DEFAULT_RETENTION_SECONDS):
+    """Delete events older than the retention period, at most once a minute per process"""
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < PRUNE_INTERVAL_SECONDS:
+        return 0
+    _last_prune = now
+    cutoff = datetime.utcnow() - timedelta(seconds=retention_seconds)
+    deleted = ProcessingEvent.query.filter(ProcessingEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    if deleted:
+        logger.info(f"Pruned {deleted} processing events")
+    return deleted
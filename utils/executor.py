@@ -0,0 +1,107 @@
+import os
+import logging
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL = 'default'
+
+# Named process pools, created lazily; sizes come from configure()
+_executors = {}
+_executor_lock = threading.Lock()
+_pool_sizes = {}
+_pool_warm_up = {}
+
+def default_pool_size():
+    return os.cpu_count() or 1
+
+def _init_worker(warm_models):
+    """Import the stage modules and load the given models once per pool process"""
+    import utils.audio_processor  # noqa: F401
+    import utils.text_processor  # noqa: F401
+    from utils import model_registry
+    model_registry.warm_up(warm_models)
+    logger.info(f"Processing pool worker {os.getpid()} ready")
+
+def configure(pool_size, name=DEFAULT_POOL, warm_up=()):
+    """Set a pool's size before it is first created (0 runs its stages inline).
+
+    warm_up names registry models each pool process loads when it starts,
+    so the first job does not pay for them.
+    """
+    _pool_sizes[name] = pool_size
+    _pool_warm_up[name] = tuple(warm_up)
+
+def get_executor(name=DEFAULT_POOL):
+    with _executor_lock:
+        if name not in _executors:
+            size = _pool_sizes.get(name, default_pool_size())
+            if size <= 0:
+                return None
+            # spawn keeps pool processes independent of the web server's threads and sockets
+            _executors[name] = ProcessPoolExecutor(
+                max_workers=size,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(_pool_warm_up.get(name, ()),)
+            )
+        return _executors[name]
+
+def _reset_executor(name, broken):
+    with _executor_lock:
+        if _executors.get(name) is broken:
+            del _executors[name]
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def _run_inline(fn, *args, **kwargs):
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def submit_to(name, fn, *args, **kwargs):
+    """Schedule a CPU-bound stage on the named process pool and return a Future"""
+    executor = get_executor(name)
+    if executor is None:
+        return _run_inline(fn, *args, **kwargs)
+    try:
+        return executor.submit(fn, *args, **kwargs)
+    except BrokenProcessPool:
+        _reset_executor(name, executor)
+        return get_executor(name).submit(fn, *args, **kwargs)
+
+def submit(fn, *args, **kwargs):
+    return submit_to(DEFAULT_POOL, fn, *args, **kwargs)
+
+def submitter(name):
+    """submit() bound to one pool, for stages that need their own sizing"""
+    return partial(submit_to, name)
+
+def run(fn, *args, **kwargs):
+    """Run a stage on the default process pool and wait for its result.
+
+    A pool process dying mid-task (e.g. killed for memory) breaks the whole pool;
+    it is replaced so later jobs keep running, and the error surfaces to the job
+    queue which retries the job.
+    """
+    executor = get_executor()
+    if executor is None:
+        return fn(*args, **kwargs)
+    try:
+        return executor.submit(fn, *args, **kwargs).result()
+    except BrokenProcessPool:
+        _reset_executor(DEFAULT_POOL, executor)
+        raise
+
+def shutdown():
+    with _executor_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
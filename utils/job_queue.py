@@ -0,0 +1,514 @@
+# Durable processing queue stored in the file_metadata table.
+#
+# Every FileMetadata row doubles as a job. Workers in any process claim jobs
+# atomically, hold them under a lease they renew with heartbeats, and either
+# complete them or hand them back for a retry with exponential backoff. A job
+# whose worker died is reclaimed once its lease expires. Each state change is
+# also published to the event log (utils/events.py) in the same transaction.
+#
+# Claims are fair across users: the highest priority class with runnable work
+# is served first, and within it the user with the lowest virtual time, which
+# each claim advances by the job's estimated cost divided by the user's weight
+# (weighted fair queuing). That user's jobs are taken in schedule_key order,
+# shortest predicted job first with aging (see utils/cost_model.py). Optional
+# caps bound running jobs globally and per user, and admission_delay() tells
+# the web tier when the queues are too full to accept more work.
+import math
+import uuid
+import random
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, insert, select, update
+from models import File, FileMetadata, ProcessingBatch, User, db
+from utils import cost_model, events, result_store
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+PROCESSING = 'processing'
+COMPLETED = 'completed'
+FAILED = 'failed'
+STATUSES = (QUEUED, PROCESSING, COMPLETED, FAILED)
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BASE_SECONDS = 30
+MAX_RETRY_DELAY_SECONDS = 3600
+# Attempts before giving up on a contended claim
+CLAIM_RETRIES = 5
+# Batch priority classes; a higher class is always served first
+PRIORITIES = {'low': 0, 'normal': 1, 'high': 2}
+NORMAL_PRIORITY = PRIORITIES['normal']
+# Virtual time charged at least this much per job, so jobs without an estimate still rotate users
+MIN_CHARGE_SECONDS = 1.0
+MIN_RETRY_AFTER_SECONDS = 5
+MAX_RETRY_AFTER_SECONDS = 3600
+
+def _claimable(now):
+    return or_(
+        and_(FileMetadata.processing_status == QUEUED,
+             or_(FileMetadata.run_after.is_(None), FileMetadata.run_after <= now)),
+        and_(FileMetadata.processing_status == PROCESSING,
+             FileMetadata.lease_expires_at < now)
+    )
+
+# Bound on IN-list sizes so large batches stay within database parameter limits
+BULK_CHUNK = 500
+
+def _chunks(items, size=BULK_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _batch_of(job_id):
+    return select(FileMetadata.batch_id).where(FileMetadata.id == job_id).scalar_subquery()
+
+def _move_counter(job_id, old_status, new_status):
+    """Move one job between its batch's status counters, in the caller's transaction"""
+    if old_status == new_status:
+        return
+    old_column, new_column = getattr(ProcessingBatch, old_status), getattr(ProcessingBatch, new_status)
+    db.session.execute(
+        update(ProcessingBatch)
+        .where(ProcessingBatch.id == _batch_of(job_id))
+        .values({old_column: old_column - 1, new_column: new_column + 1})
+        .execution_options(synchronize_session=False)
+    )
+
+def _queued_values(batch_id, now, user_id, priority=NORMAL_PRIORITY):
+    return {
+        'batch_id': batch_id,
+        'user_id': user_id,
+        'priority': priority,
+        'processing_status': QUEUED,
+        'processing_progress': 0,
+        'processing_stages': None,
+        'processing_error': None,
+        'processing_started_at': None,
+        'processing_completed_at': None,
+        'attempts': 0,
+        'queued_at': now,
+        'run_after': now,
+        'locked_by': None,
+        'lease_expires_at': None
+    }
+
+def _schedule_values(file, now, cost_weight):
+    cost = cost_model.estimate(file.filetype, file.size, file.duration_seconds)
+    return {'estimated_cost': cost, 'schedule_key': cost_model.schedule_key(now, cost, cost_weight)}
+
+def _active(user_id):
+    return (select(FileMetadata.id)
+            .where(FileMetadata.user_id == user_id, FileMetadata.processing_status.in_((QUEUED, PROCESSING)))
+            .exists())
+
+def _catch_up(user_id):
+    """Move a user returning from idle up to the lowest virtual time among active users.
+
+    Without this, credit saved while the user had nothing queued would let
+    them claim a burst of jobs ahead of everyone else.
+    """
+    floor = (db.session.query(db.func.min(User.scheduler_vtime))
+             .filter(User.id != user_id, _active(User.id))
+             .scalar())
+    if floor is None:
+        return
+    db.session.execute(update(User)
+                       .where(User.id == user_id, User.scheduler_vtime < floor, ~_active(user_id))
+                       .values(scheduler_vtime=floor)
+                       .execution_options(synchronize_session=False))
+
+def _charge(user_id, cost):
+    """Advance a user's virtual time by a claimed job's cost over the user's weight"""
+    weight = db.func.coalesce(db.func.nullif(User.scheduler_weight, 0), 1)
+    db.session.execute(update(User)
+                       .where(User.id == user_id)
+                       .values(scheduler_vtime=User.scheduler_vtime + max(cost or 0, MIN_CHARGE_SECONDS) / weight)
+                       .execution_options(synchronize_session=False))
+
+def admission_delay(user_id, new_jobs, max_queued_per_user=0, max_queued=0, slots=1):
+    """None if new_jobs more jobs fit in the queues, else a Retry-After in seconds.
+
+    Limits of 0 are unlimited. The delay is the predicted time for enough of
+    the queued work to drain, spread over slots concurrently running jobs.
+    """
+    for limit, scope in ((max_queued_per_user, FileMetadata.user_id == user_id), (max_queued, True)):
+        if not limit:
+            continue
+        queued, backlog = (db.session.query(db.func.count(), db.func.coalesce(db.func.sum(FileMetadata.estimated_cost), 0))
+                           .filter(scope, FileMetadata.processing_status == QUEUED)
+                           .one())
+        overflow = queued + new_jobs - limit
+        if overflow > 0:
+            average = backlog / queued if queued else MIN_CHARGE_SECONDS
+            delay = math.ceil(min(overflow, queued or 1) * average / max(slots, 1))
+            return min(max(delay, MIN_RETRY_AFTER_SECONDS), MAX_RETRY_AFTER_SECONDS)
+    return None
+
+class EnqueueConflictError(Exception):
+    """Another request queued some of the same files at the same time"""
+    pass
+
+def _resettable():
+    # Queued and running jobs are never reset: a running job's worker would lose its lease
+    return or_(FileMetadata.processing_status.is_(None), FileMetadata.processing_status.notin_((QUEUED, PROCESSING)))
+
+def _latest_jobs(file_ids):
+    """{file_id: id of its newest job row}; listings and search also read the newest row"""
+    return dict(db.session.query(FileMetadata.file_id, db.func.max(FileMetadata.id))
+                .filter(FileMetadata.file_id.in_(file_ids))
+                .group_by(FileMetadata.file_id)
+                .all())
+
+def enqueue_batch(user_id, file_ids, cost_weight=cost_model.DEFAULT_COST_WEIGHT, priority=NORMAL_PRIORITY):
+    """Queue many files as one batch with set-based statements.
+
+    Ownership is checked with one IN query per chunk, existing metadata rows
+    are reset with one UPDATE and missing ones created with one bulk INSERT,
+    and jobs leaving an earlier batch are taken off its counters. Each job's
+    estimated cost and schedule key are written with one executemany per
+    chunk. Files whose job is already queued or processing are left in their
+    current batch. Returns the new ProcessingBatch, the list of file ids
+    actually queued and the list of those skipped as already active; the
+    caller commits. Raises EnqueueConflictError if a job became active while
+    the batch was being queued.
+    """
+    now = datetime.utcnow()
+    batch = ProcessingBatch(id=str(uuid.uuid4()), user_id=user_id, priority=priority)
+    db.session.add(batch)
+    _catch_up(user_id)
+    queued = []
+    skipped = []
+    for chunk in _chunks(list(dict.fromkeys(file_ids))):
+        files = {file.id: file for file in
+                 db.session.query(File.id, File.filetype, File.size, File.duration_seconds)
+                 .filter(File.id.in_(chunk), File.user_id == user_id)}
+        owned = [file_id for file_id in chunk if file_id in files]
+        if not owned:
+            continue
+        # One job row per file; older duplicates are left alone, but any of them being
+        # active keeps the file out of the batch
+        jobs = _latest_jobs(owned)
+        active = {file_id for (file_id,) in
+                  db.session.query(FileMetadata.file_id).distinct()
+                  .filter(FileMetadata.file_id.in_(owned), FileMetadata.processing_status.in_((QUEUED, PROCESSING)))}
+        if active:
+            skipped.extend(file_id for file_id in owned if file_id in active)
+            owned = [file_id for file_id in owned if file_id not in active]
+            jobs = {file_id: job_id for file_id, job_id in jobs.items() if file_id not in active}
+        if jobs:
+            previous = (db.session.query(FileMetadata.batch_id, FileMetadata.processing_status, db.func.count())
+                        .filter(FileMetadata.id.in_(jobs.values()), FileMetadata.batch_id.isnot(None),
+                                FileMetadata.processing_status.in_(STATUSES))
+                        .group_by(FileMetadata.batch_id, FileMetadata.processing_status)
+                        .all())
+            for old_batch, status, count in previous:
+                column = getattr(ProcessingBatch, status)
+                db.session.execute(update(ProcessingBatch).where(ProcessingBatch.id == old_batch)
+                                   .values({column: column - count, ProcessingBatch.total: ProcessingBatch.total - count})
+                                   .execution_options(synchronize_session=False))
+            result = db.session.execute(update(FileMetadata).where(FileMetadata.id.in_(jobs.values()), _resettable())
+                                        .values(**_queued_values(batch.id, now, user_id, priority))
+                                        .execution_options(synchronize_session=False))
+            if result.rowcount != len(jobs):
+                raise EnqueueConflictError("Some files were queued by another request, please retry")
+            # Per-row values as one executemany UPDATE by primary key
+            db.session.execute(update(FileMetadata),
+                               [dict(_schedule_values(files[file_id], now, cost_weight), id=job_id)
+                                for file_id, job_id in jobs.items()],
+                               execution_options={'synchronize_session': False})
+        missing = [file_id for file_id in owned if file_id not in jobs]
+        if missing:
+            db.session.execute(insert(FileMetadata),
+                               [dict(_queued_values(batch.id, now, user_id, priority), file_id=file_id,
+                                     **_schedule_values(files[file_id], now, cost_weight))
+                                for file_id in missing])
+        queued.extend(owned)
+
+    batch.total = batch.queued = len(queued)
+    db.session.flush()
+    job_ids = [job_id for chunk in _chunks(queued) for (job_id,) in
+               db.session.query(FileMetadata.id).filter(FileMetadata.batch_id == batch.id,
+                                                        FileMetadata.file_id.in_(chunk))]
+    events.publish_many(job_ids, QUEUED, progress=0)
+    return batch, queued, skipped
+
+def enqueue(file_id, batch_id=None, cost_weight=cost_model.DEFAULT_COST_WEIGHT):
+    """Queue a single file outside of any batch, reusing its newest metadata row if it has one.
+
+    A job that is already queued or processing is returned unchanged.
+    """
+    now = datetime.utcnow()
+    active = (FileMetadata.query
+              .filter(FileMetadata.file_id == file_id, FileMetadata.processing_status.in_((QUEUED, PROCESSING)))
+              .order_by(FileMetadata.id.desc())
+              .first())
+    if active:
+        return active
+    metadata = FileMetadata.query.filter_by(file_id=file_id).order_by(FileMetadata.id.desc()).first()
+    if not metadata:
+        metadata = FileMetadata(file_id=file_id)
+        db.session.add(metadata)
+    elif metadata.batch_id and metadata.processing_status in STATUSES:
+        column = getattr(ProcessingBatch, metadata.processing_status)
+        db.session.execute(update(ProcessingBatch).where(ProcessingBatch.id == metadata.batch_id)
+                           .values({column: column - 1, ProcessingBatch.total: ProcessingBatch.total - 1})
+                           .execution_options(synchronize_session=False))
+    file = db.session.get(File, file_id)
+    _catch_up(file.user_id)
+    values = dict(_queued_values(batch_id, now, file.user_id), **_schedule_values(file, now, cost_weight))
+    for key, value in values.items():
+        setattr(metadata, key, value)
+    db.session.flush()
+    events.publish(metadata.id, QUEUED, progress=0)
+    return metadata
+
+class JobRunningError(Exception):
+    """A job is being processed and cannot be removed"""
+    pass
+
+def remove_jobs(file_id):
+    """Delete every job of a file with its stored results and events, and take the jobs off
+    their batch counters; the caller commits.
+
+    Raises JobRunningError while one of them is processing, since its worker
+    would write results for a file that no longer exists; the caller then
+    rolls back. The delete itself skips processing rows, so a job claimed
+    concurrently is caught by the recheck instead of being pulled from under
+    its worker. Returns the deleted job ids.
+    """
+    jobs = (db.session.query(FileMetadata.id, FileMetadata.batch_id, FileMetadata.processing_status)
+            .filter(FileMetadata.file_id == file_id)
+            .all())
+    if any(status == PROCESSING for _, _, status in jobs):
+        raise JobRunningError(f"File {file_id} is being processed")
+    job_ids = [job_id for job_id, _, _ in jobs]
+    if not job_ids:
+        return []
+    deleted = (FileMetadata.query
+               .filter(FileMetadata.id.in_(job_ids),
+                       or_(FileMetadata.processing_status.is_(None), FileMetadata.processing_status != PROCESSING))
+               .delete(synchronize_session=False))
+    if deleted != len(job_ids):
+        raise JobRunningError(f"File {file_id} is being processed")
+    # Nothing references these by foreign key, so they are removed explicitly
+    result_store.remove(job_ids)
+    events.remove(job_ids)
+    counts = {}
+    for _, batch_id, status in jobs:
+        if batch_id and status in STATUSES:
+            counts[batch_id, status] = counts.get((batch_id, status), 0) + 1
+    for (batch_id, status), count in counts.items():
+        column = getattr(ProcessingBatch, status)
+        db.session.execute(update(ProcessingBatch).where(ProcessingBatch.id == batch_id)
+                           .values({column: column - count, ProcessingBatch.total: ProcessingBatch.total - count})
+                           .execution_options(synchronize_session=False))
+    return job_ids
+
+def batch_counts(batch):
+    """Aggregate progress of a batch from its counters"""
+    return {
+        'batch_id': batch.id,
+        'total': batch.total,
+        'queued': batch.queued,
+        'running': batch.processing,
+        'done': batch.completed,
+        'failed': batch.failed,
+        'priority': next((name for name, value in PRIORITIES.items() if value == batch.priority), batch.priority),
+        'finished': batch.completed + batch.failed >= batch.total,
+        'created_at': batch.created_at.isoformat() if batch.created_at else None
+    }
+
+def _running_counts(now):
+    """{user_id: jobs running under a live lease}"""
+    return dict(db.session.query(FileMetadata.user_id, db.func.count())
+                .filter(FileMetadata.processing_status == PROCESSING, FileMetadata.lease_expires_at >= now)
+                .group_by(FileMetadata.user_id)
+                .all())
+
+def _next_tenant(now, excluded):
+    """(priority, user_id) to serve next, or None when nothing is runnable.
+
+    One query: the distinct (priority, user) pairs among claimable jobs, read
+    from ix_file_metadata_tenant, joined to user for the virtual time. Users
+    with nothing runnable never enter it, so the cost follows the runnable
+    work rather than the number of registered users.
+    """
+    runnable = db.session.query(FileMetadata.priority, FileMetadata.user_id).filter(_claimable(now))
+    if excluded:
+        runnable = runnable.filter(FileMetadata.user_id.notin_(excluded))
+    runnable = runnable.distinct().subquery()
+    return (db.session.query(runnable.c.priority, runnable.c.user_id)
+            .join(User, User.id == runnable.c.user_id)
+            .order_by(runnable.c.priority.desc(), User.scheduler_vtime, User.id)
+            .first())
+
+def claim(worker_id, lease_seconds=DEFAULT_LEASE_SECONDS, max_running=0, max_running_per_user=0):
+    """Atomically take the next job under the fair-share policy, or return None if there is none.
+
+    Users at max_running_per_user running jobs are skipped, and nothing is
+    claimed while max_running jobs run in total (0 means no limit). Postgres
+    uses SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers never block
+    on each other. Other databases fall back to a conditional UPDATE that
+    only succeeds if the row is still claimable, retried on contention.
+    """
+    now = datetime.utcnow()
+    claim_values = {
+        'processing_status': PROCESSING,
+        'locked_by': worker_id,
+        'lease_expires_at': now + timedelta(seconds=lease_seconds),
+        'heartbeat_at': now,
+        'processing_started_at': now,
+        'attempts': FileMetadata.attempts + 1
+    }
+    running = _running_counts(now)
+    if max_running and sum(running.values()) >= max_running:
+        db.session.rollback()
+        return None
+    excluded = [user_id for user_id, count in running.items()
+                if max_running_per_user and user_id is not None and count >= max_running_per_user]
+
+    for _ in range(CLAIM_RETRIES):
+        tenant = _next_tenant(now, excluded)
+        if tenant is None:
+            db.session.rollback()
+            return None
+        priority, user_id = tenant
+        scope = (_claimable(now), FileMetadata.user_id == user_id, FileMetadata.priority == priority)
+
+        if db.engine.dialect.name == 'postgresql':
+            job = (FileMetadata.query
+                   .filter(*scope)
+                   .order_by(FileMetadata.schedule_key, FileMetadata.id)
+                   .with_for_update(skip_locked=True)
+                   .first())
+            if job is None:
+                # Every runnable job of this user is being claimed by other workers
+                excluded.append(user_id)
+                continue
+            # An expired lease is re-claimed from 'processing' and stays in that counter
+            _move_counter(job.id, job.processing_status, PROCESSING)
+            for key, value in claim_values.items():
+                setattr(job, key, value)
+            db.session.flush()
+            _charge(user_id, job.estimated_cost)
+            events.publish(job.id, PROCESSING, progress=0, attempts=job.attempts)
+            db.session.commit()
+            return job
+
+        row = (db.session.query(FileMetadata.id, FileMetadata.processing_status)
+               .filter(*scope)
+               .order_by(FileMetadata.schedule_key, FileMetadata.id)
+               .first())
+        if row is None:
+            excluded.append(user_id)
+            continue
+        candidate, previous_status = row
+        result = db.session.execute(
+            update(FileMetadata)
+            .where(FileMetadata.id == candidate, FileMetadata.processing_status == previous_status,
+                   _claimable(now))
+            .values(**claim_values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            _move_counter(candidate, previous_status, PROCESSING)
+            job = db.session.get(FileMetadata, candidate, populate_existing=True)
+            _charge(user_id, job.estimated_cost)
+            events.publish(job.id, PROCESSING, progress=0, attempts=job.attempts)
+            db.session.commit()
+            return job
+        db.session.commit()
+    db.session.rollback()
+    return None
+
+def _owned(job_id, worker_id):
+    return and_(FileMetadata.id == job_id,
+                FileMetadata.locked_by == worker_id,
+                FileMetadata.processing_status == PROCESSING)
+
+def heartbeat(job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Extend a job's lease; returns False if the worker no longer owns it"""
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(FileMetadata)
+        .where(_owned(job_id, worker_id))
+        .values(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def set_progress(job_id, worker_id, progress, stages=None):
+    values = {'processing_progress': progress}
+    if stages is not None:
+        values['processing_stages'] = stages
+    result = db.session.execute(
+        update(FileMetadata)
+        .where(_owned(job_id, worker_id))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 1:
+        events.publish(job_id, PROCESSING, progress=progress, stages=events.stage_statuses(stages))
+    db.session.commit()
+
+def complete(job_id, worker_id, results, **columns):
+    """Store results and mark the job completed if the worker still holds the lease.
+
+    Heavy results go to the result store in the same transaction; the job row
+    only gets their summary and the given summary columns.
+    """
+    result = db.session.execute(
+        update(FileMetadata)
+        .where(_owned(job_id, worker_id))
+        .values(processing_status=COMPLETED,
+                processing_progress=100,
+                processing_completed_at=datetime.utcnow(),
+                processing_error=None,
+                locked_by=None,
+                lease_expires_at=None,
+                result_summary=result_store.summarize(results),
+                # A job completed before the result store may still hold results inline
+                **result_store.clear_legacy_values(),
+                **columns)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 1:
+        result_store.save(job_id, results)
+        _move_counter(job_id, PROCESSING, COMPLETED)
+        events.publish(job_id, COMPLETED, progress=100)
+    db.session.commit()
+    if result.rowcount != 1:
+        logger.warning(f"Job {job_id} lost its lease before completing; result discarded")
+    return result.rowcount == 1
+
+def retry_delay(attempts, base_seconds=DEFAULT_RETRY_BASE_SECONDS):
+    """Exponential backoff with jitter so retried jobs do not stampede"""
+    delay = min(MAX_RETRY_DELAY_SECONDS, base_seconds * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+def fail(job_id, worker_id, error, attempts, max_attempts=DEFAULT_MAX_ATTEMPTS,
+         retry_base_seconds=DEFAULT_RETRY_BASE_SECONDS):
+    """Record a failed attempt: requeue with backoff, or fail permanently"""
+    now = datetime.utcnow()
+    if attempts < max_attempts:
+        values = {
+            'processing_status': QUEUED,
+            'run_after': now + timedelta(seconds=retry_delay(attempts, retry_base_seconds))
+        }
+    else:
+        values = {
+            'processing_status': FAILED,
+            'processing_completed_at': now
+        }
+    result = db.session.execute(
+        update(FileMetadata)
+        .where(_owned(job_id, worker_id))
+        .values(processing_error=str(error), locked_by=None, lease_expires_at=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 1:
+        _move_counter(job_id, PROCESSING, values['processing_status'])
+        events.publish(job_id, values['processing_status'], error=str(error), attempts=attempts)
+    db.session.commit()
+    return values['processing_status'] if result.rowcount == 1 else None
@@ -0,0 +1,127 @@
+import os
+import json
+import shutil
+import struct
+import logging
+import subprocess
+import wave
+
+logger = logging.getLogger(__name__)
+
+PROBE_TIMEOUT_SECONDS = 30
+PROBE_FIELDS = ('duration_seconds', 'sample_rate', 'channels', 'codec', 'bit_rate')
+
+# MPEG audio layer III bitrates (kbps) and sample rates by version
+_MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+}
+_MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+# AMR-NB frame sizes in bytes (header included) by frame type; each frame is 20ms
+_AMR_FRAME_SIZES = (13, 14, 16, 18, 20, 21, 27, 32, 6, 0, 0, 0, 0, 0, 0, 1)
+_AMR_MAGIC = b'#!AMR\n'
+
+def empty_probe():
+    return dict.fromkeys(PROBE_FIELDS)
+
+def _probe_ffprobe(ffprobe, path):
+    result = subprocess.run(
+        [ffprobe, '-v', 'error', '-select_streams', 'a:0', '-print_format', 'json',
+         '-show_entries', 'format=duration,bit_rate:stream=codec_name,sample_rate,channels', path],
+        check=True, capture_output=True, timeout=PROBE_TIMEOUT_SECONDS
+    )
+    data = json.loads(result.stdout or b'{}')
+    stream = (data.get('streams') or [{}])[0]
+    fmt = data.get('format') or {}
+    duration = fmt.get('duration')
+    return {
+        'duration_seconds': float(duration) if duration not in (None, 'N/A') else None,
+        'sample_rate': int(stream['sample_rate']) if stream.get('sample_rate') else None,
+        'channels': stream.get('channels'),
+        'codec': stream.get('codec_name'),
+        'bit_rate': int(fmt['bit_rate']) if fmt.get('bit_rate') not in (None, 'N/A') else None
+    }
+
+def _probe_wav(path):
+    with wave.open(path, 'rb') as w:
+        rate = w.getframerate()
+        return {
+            'duration_seconds': w.getnframes() / rate if rate else None,
+            'sample_rate': rate,
+            'channels': w.getnchannels(),
+            'codec': f'pcm_s{w.getsampwidth() * 8}le',
+            'bit_rate': rate * w.getnchannels() * w.getsampwidth() * 8
+        }
+
+def _probe_mp3(path):
+    """Header of the first frame; duration assumes a constant bitrate"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(10)
+        offset = 0
+        if head[:3] == b'ID3' and len(head) == 10:
+            # ID3v2 size is a 28-bit syncsafe integer
+            offset = 10 + ((head[6] & 0x7F) << 21 | (head[7] & 0x7F) << 14 | (head[8] & 0x7F) << 7 | (head[9] & 0x7F))
+        f.seek(offset)
+        data = f.read(64 * 1024)
+    for i in range(len(data) - 3):
+        if data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+            continue
+        header, = struct.unpack('>I', data[i:i + 4])
+        version = {3: 1, 2: 2, 0: 2.5}.get((header >> 19) & 0x3)
+        layer = (header >> 17) & 0x3
+        bitrate_index = (header >> 12) & 0xF
+        rate_index = (header >> 10) & 0x3
+        if version is None or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            continue
+        bit_rate = _MP3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+        return {
+            'duration_seconds': (size - offset - i) * 8 / bit_rate,
+            'sample_rate': _MP3_SAMPLE_RATES[version][rate_index],
+            'channels': 1 if (header >> 6) & 0x3 == 3 else 2,
+            'codec': 'mp3',
+            'bit_rate': bit_rate
+        }
+    return empty_probe()
+
+def _probe_amr(path):
+    """Frame type of the first frame; duration assumes every frame has that type"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(len(_AMR_MAGIC) + 1)
+    if not head.startswith(_AMR_MAGIC) or len(head) <= len(_AMR_MAGIC):
+        return empty_probe()
+    frame_size = _AMR_FRAME_SIZES[(head[len(_AMR_MAGIC)] >> 3) & 0x0F]
+    if not frame_size:
+        return empty_probe()
+    frames = (size - len(_AMR_MAGIC)) / frame_size
+    return {
+        'duration_seconds': frames * 0.02,
+        'sample_rate': 8000,
+        'channels': 1,
+        'codec': 'amr_nb',
+        'bit_rate': int(frame_size * 8 / 0.02)
+    }
+
+_FALLBACKS = {'wav': _probe_wav, 'mp3': _probe_mp3, 'amr': _probe_amr}
+
+def probe(path, filetype):
+    """Media description of an audio file as {field: value}, None for anything unknown.
+
+    Uses ffprobe when it is installed and falls back to reading the container
+    header. Only headers are read, so this is cheap enough to run at upload.
+    Non-audio files and unreadable media give all None; probing never raises.
+    """
+    if filetype not in _FALLBACKS:
+        return empty_probe()
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe:
+        try:
+            return _probe_ffprobe(ffprobe, path)
+        except (subprocess.SubprocessError, OSError, ValueError, KeyError) as e:
+            logger.debug(f"ffprobe failed for {os.path.basename(path)}, reading the header instead: {e}")
+    try:
+        return _FALLBACKS[filetype](path)
+    except (wave.Error, EOFError, OSError, struct.error, ValueError) as e:
+        logger.warning(f"Could not probe {os.path.basename(path)}: {e}")
+        return empty_probe()
@@ -0,0 +1,76 @@
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Coalesce single-item calls from concurrent jobs into one batch call.
+
+    submit(fn, item) has the same shape as executor.submit, so a batcher can be
+    a Stage's submit: each job's stage hands in one item and gets a Future
+    back, and items arriving within max_wait seconds of each other (up to
+    max_batch of them) are passed together to batch_fn via the pool's submit.
+    batch_fn(items, *batch_args) must return one result per item, in order.
+    """
+    def __init__(self, batch_fn, submit, max_batch=32, max_wait=0.05, batch_args=()):
+        self.batch_fn = batch_fn
+        self.pool_submit = submit
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batch_args = tuple(batch_args)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def submit(self, fn, item):
+        future = Future()
+        with self._lock:
+            self._pending.append((item, future))
+            if len(self._pending) >= self.max_batch:
+                batch = self._take()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.max_wait, self._flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if batch:
+            self._dispatch(batch)
+        return future
+
+    def _take(self):
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            batch_future = self.pool_submit(self.batch_fn, items, *self.batch_args)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        logger.debug(f"Dispatched a batch of {len(items)} to {self.batch_fn.__name__}")
+
+        def distribute(done):
+            try:
+                results = done.result()
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                return
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+        batch_future.add_done_callback(distribute)
@@ -0,0 +1,70 @@
+import sys
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Heavy libraries the web tier must never import; only pool and worker
+# processes load them, on first use. See check_import_budget.
+HEAVY_MODULES = ('sklearn', 'spacy', 'pydub')
+
+_loaders = {}
+_models = {}
+_lock = threading.Lock()
+
+def register(name, loader):
+    """Register a zero-argument loader for a model; nothing is loaded yet"""
+    _loaders[name] = loader
+
+def get(name):
+    """Return the named model, loading it once per process on first use"""
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock:
+        if name not in _models:
+            if name not in _loaders:
+                raise KeyError(f"No model registered as '{name}', expected one of {sorted(_loaders)}")
+            started = time.monotonic()
+            _models[name] = _loaders[name]()
+            logger.info(f"Loaded model '{name}' in {time.monotonic() - started:.2f}s")
+        return _models[name]
+
+def loaded():
+    return sorted(_models)
+
+def warm_up(names=None):
+    """Load models ahead of the first job, e.g. from a pool initializer.
+
+    Failures are logged rather than raised so a missing model only fails the
+    jobs that need it.
+    """
+    for name in (names if names is not None else list(_loaders)):
+        try:
+            get(name)
+        except Exception as e:
+            logger.error(f"Warm-up of model '{name}' failed: {e}")
+
+def heavy_imports(modules=HEAVY_MODULES):
+    """Heavy top-level packages already imported by this process"""
+    return [name for name in modules if name in sys.modules]
+
+def check_import_budget(app, started):
+    """Log (or raise, with IMPORT_BUDGET_STRICT) when app startup went over budget.
+
+    started is the time.monotonic() value taken before the web tier was imported.
+    """
+    elapsed = time.monotonic() - started
+    problems = []
+    heavy = heavy_imports()
+    if heavy:
+        problems.append(f"web tier imported {', '.join(heavy)}")
+    if elapsed > app.config['IMPORT_BUDGET_SECONDS']:
+        problems.append(f"startup took {elapsed:.2f}s (budget {app.config['IMPORT_BUDGET_SECONDS']}s)")
+    if not problems:
+        return
+    message = 'Import budget exceeded: ' + '; '.join(problems)
+    if app.config['IMPORT_BUDGET_STRICT']:
+        raise RuntimeError(message)
+    logger.warning(message)
@@ -0,0 +1,161 @@
+import time
+import logging
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, wait
+from utils.result_cache import cache_key
+
+logger = logging.getLogger(__name__)
+
+class PipelineError(Exception):
+    """Raised when a pipeline stage fails; carries the failing stage's name"""
+    def __init__(self, stage, error):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+
+class Stage:
+    """One node of a per-file processing graph.
+
+    fn is called with the results of the stages named in inputs, in order, so
+    an artifact such as the decoded audio is produced once and shared by every
+    stage that lists it. An input written 'stage.key' passes result['key'] of a
+    stage that returns a dict. weight is the stage's share of the overall progress.
+    submit, when given, replaces the pipeline's default submit for this stage
+    so it can run on a differently sized pool.
+
+    version makes the stage's result cacheable: it must change whenever the
+    model or config that produces the result does. Stages without a version
+    are never cached and must be pure functions of the file's content.
+    cache_if(result) can veto caching a particular (e.g. partial) result.
+    """
+    def __init__(self, name, fn, inputs=(), args=(), weight=1, submit=None, version=None, cache_if=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.args = tuple(args)
+        self.weight = weight
+        self.submit = submit
+        self.version = version
+        self.cache_if = cache_if
+
+def _stage_of(ref):
+    return ref.split('.', 1)[0]
+
+def _resolve(results, ref):
+    name, _, key = ref.partition('.')
+    return results[name][key] if key else results[name]
+
+def _validate(stages):
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate stage names in pipeline: {names}")
+    for stage in stages:
+        unknown = [ref for ref in stage.inputs if _stage_of(ref) not in names]
+        if unknown:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {unknown}")
+
+def _cache_keys(stages, content_hash):
+    """Cache key per versioned stage; a key covers the versions of every upstream stage"""
+    by_name = {stage.name: stage for stage in stages}
+    lineage = {}
+
+    def version_of(stage):
+        if stage.name not in lineage:
+            upstream = [version_of(by_name[_stage_of(ref)]) for ref in stage.inputs]
+            lineage[stage.name] = '|'.join([stage.version or ''] + upstream)
+        return lineage[stage.name]
+
+    return {stage.name: cache_key(content_hash, stage.name, version_of(stage))
+            for stage in stages if stage.version is not None}
+
+def _needed(stages, cached):
+    """Names of stages that must run.
+
+    Those are the uncached results (versioned stages and final stages) plus
+    every uncached stage they depend on; an intermediate such as the decoded
+    audio is skipped when everything built on it is cached.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    consumed = {_stage_of(ref) for stage in stages for ref in stage.inputs}
+    needed = set()
+    todo = [stage.name for stage in stages
+            if stage.name not in cached and (stage.version is not None or stage.name not in consumed)]
+    while todo:
+        name = todo.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        todo.extend(_stage_of(ref) for ref in by_name[name].inputs if _stage_of(ref) not in cached)
+    return needed
+
+def run_pipeline(stages, submit, on_update=None, cache=None, content_hash=None):
+    """Run a stage graph, starting each stage as soon as its inputs are ready.
+
+    submit(fn, *args) must return a concurrent.futures.Future. on_update(progress,
+    report) is called whenever a stage starts or finishes, with the weighted
+    percentage complete and a per-stage report of status and timings. Returns a
+    dict of stage name -> result.
+
+    With a cache (see utils/result_cache.py) and the file's content_hash,
+    versioned stages are looked up before anything runs; cached results are
+    reused, stages only feeding cached stages are skipped, and new results
+    are stored.
+    """
+    _validate(stages)
+    total_weight = sum(stage.weight for stage in stages) or 1
+    results = {}
+    report = {stage.name: {'status': 'pending'} for stage in stages}
+    running = {}
+    done_weight = 0
+
+    keys = _cache_keys(stages, content_hash) if cache is not None and content_hash else {}
+    for name, key in keys.items():
+        value = cache.get(key)
+        if value is not None:
+            results[name] = value
+    needed = _needed(stages, results)
+    pending = [stage for stage in stages if stage.name in needed]
+    for stage in stages:
+        if stage.name not in needed:
+            report[stage.name] = {'status': 'cached' if stage.name in results else 'skipped'}
+            done_weight += stage.weight
+    if results:
+        logger.info(f"Reusing cached results for stages {sorted(results)}")
+
+    def notify():
+        if on_update is not None:
+            on_update(int(done_weight * 100 / total_weight), report)
+
+    try:
+        while pending or running:
+            for stage in [s for s in pending if all(_stage_of(ref) in results for ref in s.inputs)]:
+                pending.remove(stage)
+                args = [_resolve(results, ref) for ref in stage.inputs] + list(stage.args)
+                running[(stage.submit or submit)(stage.fn, *args)] = (stage, time.monotonic())
+                report[stage.name] = {'status': 'running', 'started_at': datetime.utcnow().isoformat()}
+            notify()
+
+            if not running:
+                # Nothing runnable and nothing in flight means a dependency cycle
+                raise ValueError(f"Pipeline cannot make progress: {[s.name for s in pending]}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, started = running.pop(future)
+                duration = round(time.monotonic() - started, 3)
+                try:
+                    results[stage.name] = future.result()
+                except Exception as e:
+                    report[stage.name].update(status='failed', duration=duration)
+                    notify()
+                    raise PipelineError(stage.name, e) from e
+                report[stage.name].update(status='completed', duration=duration)
+                if stage.name in keys and (stage.cache_if is None or stage.cache_if(results[stage.name])):
+                    cache.put(keys[stage.name], results[stage.name])
+                done_weight += stage.weight
+                logger.info(f"Stage {stage.name} finished in {duration}s")
+        notify()
+    finally:
+        for future in running:
+            future.cancel()
+    return results
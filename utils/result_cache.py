@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.getcwd(), 'uploads', 'cache', 'results')
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600
+# Eviction scans the whole cache, so it runs at most this often per process
+EVICT_INTERVAL_SECONDS = 60
+
+def package_version(name):
+    """Installed version of a distribution, read from metadata without importing it"""
+    try:
+        from importlib.metadata import version
+        return version(name)
+    except Exception:
+        return 'none'
+
+def cache_key(content_hash, stage, version):
+    return hashlib.sha256(f'{content_hash}:{stage}:{version}'.encode()).hexdigest()
+
+class ResultCache:
+    """Persistent per-stage results shared by every process using cache_dir.
+
+    Entries are JSON files named by cache_key(content hash, stage, version),
+    so a new model or config version simply misses and the stale entries age
+    out. A hit refreshes the entry's mtime, which eviction treats as its last
+    use: entries unused for max_age seconds are dropped, then the least
+    recently used until the cache fits in max_bytes.
+    """
+    def __init__(self, cache_dir=None, max_bytes=None, max_age=None):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_age = DEFAULT_MAX_AGE_SECONDS if max_age is None else max_age
+        self._last_evict = 0
+        self._evict_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json')
+
+    def get(self, key):
+        """Cached result, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                value = json.load(f)
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable result cache entry {path}: {e}")
+            return None
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            # A cache write failure must never fail the job
+            logger.warning(f"Could not cache result {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._maybe_evict()
+
+    def _maybe_evict(self):
+        now = time.monotonic()
+        if now - self._last_evict < EVICT_INTERVAL_SECONDS or not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_evict = now
+            self.evict()
+        finally:
+            self._evict_lock.release()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones over max_bytes"""
+        cutoff = time.time() - self.max_age
+        entries = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime < cutoff:
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+                total += stat.st_size
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+        return total
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,183 @@
+# Heavy processing results, stored compressed outside file_metadata.
+#
+# file_metadata keeps only small summary columns, which status, listing and
+# queue queries read. The transcript, entities, speakers and sentiment series
+# of a completed job are one compressed JSON document in processing_result,
+# loaded only when results are requested. Timed transcript segments are split
+# into transcript_page rows of SEGMENT_PAGE_SECONDS each, so a client can
+# fetch the time range it is showing without the rest of a long recording.
+#
+# zstd is used when the zstandard package is installed, gzip otherwise. The
+# codec is stored with every row, so switching later never breaks reads.
+import gzip
+import json
+import logging
+from sqlalchemy import insert
+from models import FileMetadata, ProcessingResult, TranscriptPage, db
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+HEAVY_FIELDS = ('transcript', 'entities', 'speakers', 'sentiment_series')
+# file_metadata columns that held results before the result store
+LEGACY_FIELDS = ('transcript', 'transcript_segments', 'entities', 'speakers', 'sentiment_series')
+SEGMENT_PAGE_SECONDS = 300
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+# Legacy jobs migrated per transaction by migrate_inline_results
+MIGRATE_BATCH = 200
+
+class ResultStoreError(Exception):
+    """Custom exception for result store errors"""
+    pass
+
+def default_codec():
+    return 'zstd' if zstandard is not None else 'gzip'
+
+def compress(value, codec=None):
+    """(codec, bytes) for a JSON-serialisable value"""
+    codec = codec or default_codec()
+    raw = json.dumps(value, separators=(',', ':')).encode()
+    if codec == 'zstd':
+        return codec, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if codec == 'gzip':
+        # mtime=0 keeps the output deterministic for identical results
+        return codec, gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ResultStoreError(f"Unknown result codec '{codec}'")
+
+def decompress(codec, data):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ResultStoreError("Results were stored with zstd; install the zstandard package to read them")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == 'gzip':
+        raw = gzip.decompress(data)
+    else:
+        raise ResultStoreError(f"Unknown result codec '{codec}'")
+    return json.loads(raw)
+
+def summarize(results):
+    """Small description of a job's results, kept in file_metadata.result_summary"""
+    segments = results.get('transcript_segments') or []
+    return {
+        'transcript_chars': len(results.get('transcript') or ''),
+        'segments': len(segments),
+        'duration': max((segment['end'] for segment in segments), default=None),
+        'entities': len(results.get('entities') or []),
+        'speakers': len(results.get('speakers') or {})
+    }
+
+def _pages(segments):
+    """Group segments by the window their start time falls in"""
+    pages = {}
+    for segment in segments:
+        pages.setdefault(int(segment['start'] // SEGMENT_PAGE_SECONDS), []).append(segment)
+    return sorted(pages.items())
+
+def save(job_id, results):
+    """Replace a job's stored results; the caller commits"""
+    remove([job_id])
+    codec, payload = compress({field: results.get(field) for field in HEAVY_FIELDS})
+    db.session.add(ProcessingResult(job_id=job_id, codec=codec, payload=payload, size=len(payload)))
+    rows = []
+    for page, segments in _pages(results.get('transcript_segments') or []):
+        page_codec, data = compress(segments)
+        rows.append({
+            'job_id': job_id,
+            'page': page,
+            'start_time': segments[0]['start'],
+            'end_time': max(segment['end'] for segment in segments),
+            'segment_count': len(segments),
+            'codec': page_codec,
+            'data': data
+        })
+    if rows:
+        db.session.execute(insert(TranscriptPage), rows)
+
+def remove(job_ids):
+    """Delete stored results for jobs; the caller commits"""
+    if not job_ids:
+        return
+    ProcessingResult.query.filter(ProcessingResult.job_id.in_(job_ids)).delete(synchronize_session=False)
+    TranscriptPage.query.filter(TranscriptPage.job_id.in_(job_ids)).delete(synchronize_session=False)
+
+def _legacy(metadata, fields):
+    # Jobs completed before the result store keep their results inline
+    return {field: getattr(metadata, field) for field in fields}
+
+def load_many(jobs, fields=HEAVY_FIELDS):
+    """{job id: {field: value}} for FileMetadata rows, with one query for the stored results"""
+    jobs = list(jobs)
+    rows = (db.session.query(ProcessingResult.job_id, ProcessingResult.codec, ProcessingResult.payload)
+            .filter(ProcessingResult.job_id.in_([job.id for job in jobs]))
+            .all()) if jobs else []
+    stored = {job_id: decompress(codec, payload) for job_id, codec, payload in rows}
+    return {job.id: ({field: stored[job.id].get(field) for field in fields} if job.id in stored
+                     else _legacy(job, fields))
+            for job in jobs}
+
+def load(job, fields=HEAVY_FIELDS):
+    """{field: value} of a job's heavy results"""
+    return load_many([job], fields)[job.id]
+
+def load_segments(job, start=None, end=None):
+    """Transcript segments overlapping [start, end] seconds, in time order.
+
+    Only the pages covering the range are read and decompressed.
+    """
+    query = TranscriptPage.query.filter(TranscriptPage.job_id == job.id)
+    if start is not None:
+        query = query.filter(TranscriptPage.end_time >= start)
+    if end is not None:
+        query = query.filter(TranscriptPage.start_time <= end)
+    pages = query.order_by(TranscriptPage.page).all()
+    if pages:
+        segments = [segment for page in pages for segment in decompress(page.codec, page.data)]
+    elif db.session.query(ProcessingResult.job_id).filter_by(job_id=job.id).first():
+        # Stored, but nothing in this range
+        segments = []
+    else:
+        segments = job.transcript_segments or []
+    return [segment for segment in segments
+            if (start is None or segment['end'] >= start) and (end is None or segment['start'] <= end)]
+
+def clear_legacy_values():
+    """Column values that clear a job's inline results, as SQL NULL rather than a JSON null"""
+    return {field: db.null() for field in LEGACY_FIELDS}
+
+def migrate_inline_results(batch_size=MIGRATE_BATCH):
+    """Move results of jobs completed before the result store out of file_metadata.
+
+    A job that already has stored results was processed again since; its
+    inline results are stale and only cleared.
+    """
+    legacy_columns = [getattr(FileMetadata, field) for field in LEGACY_FIELDS]
+    moved = 0
+    while True:
+        jobs = (FileMetadata.query
+                .options(*[db.undefer(column) for column in legacy_columns])
+                .filter(FileMetadata.processing_status == 'completed',
+                        db.or_(*[column.isnot(None) for column in legacy_columns]))
+                .order_by(FileMetadata.id)
+                .limit(batch_size)
+                .all())
+        if not jobs:
+            return moved
+        stored = {job_id for (job_id,) in (db.session.query(ProcessingResult.job_id)
+                                            .filter(ProcessingResult.job_id.in_([job.id for job in jobs])))}
+        for job in jobs:
+            if job.id not in stored:
+                results = {field: getattr(job, field) for field in HEAVY_FIELDS}
+                results['transcript_segments'] = job.transcript_segments
+                save(job.id, results)
+                job.result_summary = summarize(results)
+            # SQL NULL rather than a JSON null, so the job no longer matches
+            for field, value in clear_legacy_values().items():
+                setattr(job, field, value)
+        db.session.commit()
+        moved += len(jobs)
+        logger.info(f"Moved results of {moved} jobs into the result store")
@@ -0,0 +1,365 @@
+# Full-text search over processed transcripts and entities.
+#
+# Three interchangeable backends, chosen by SEARCH_BACKEND ('auto' picks the
+# first that fits the database):
+#   postgres  tsvector column on search_document with a GIN index
+#   fts5      SQLite FTS5 virtual table search_fts
+#   memory    in-process inverted index with BM25 ranking, rebuilt from the
+#             database and refreshed incrementally; for databases with neither
+# Documents are (re)indexed when a job completes and removed with their file.
+import re
+import html
+import math
+import logging
+import threading
+from collections import Counter, defaultdict
+from sqlalchemy import text
+from models import File, FileMetadata, SearchDocument, db
+from utils import result_store
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('postgres', 'fts5', 'memory')
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+SNIPPET_WORDS = 12
+# Jobs whose results the memory backend decompresses per query while refreshing
+REFRESH_CHUNK = 500
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+_LABEL = re.compile(r'^[A-Z_]+$')
+
+class SearchError(Exception):
+    """Custom exception for search errors"""
+    pass
+
+def tokenize(value):
+    return _TOKEN.findall((value or '').lower())
+
+def _entity_text(entities):
+    return ' '.join(entity.get('text', '') for entity in entities or ())
+
+def _entity_labels(entities):
+    return sorted({entity['label'] for entity in entities or () if entity.get('label')})
+
+def _check_labels(labels):
+    for label in labels:
+        if not _LABEL.match(label):
+            raise SearchError(f"Invalid entity label '{label}'")
+
+def _fts5_available():
+    try:
+        db.session.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts5_probe USING fts5(x)"))
+        db.session.execute(text("DROP TABLE IF EXISTS temp._fts5_probe"))
+        return True
+    except Exception:
+        db.session.rollback()
+        return False
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend(name='auto'):
+    """The search backend for this process, created once"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            dialect = db.engine.dialect.name
+            if name == 'auto':
+                if dialect == 'postgresql':
+                    name = 'postgres'
+                elif dialect == 'sqlite' and _fts5_available():
+                    name = 'fts5'
+                else:
+                    name = 'memory'
+            if name not in BACKENDS:
+                raise SearchError(f"Unknown search backend '{name}', expected one of {BACKENDS}")
+            _backend = {'postgres': PostgresBackend, 'fts5': FTS5Backend, 'memory': MemoryBackend}[name]()
+            _backend.ensure_schema()
+            logger.info(f"Search backend: {name}")
+        return _backend
+
+def _load_document(file_id):
+    """(user_id, transcript, entities) for a completed file, or None"""
+    row = (db.session.query(File.user_id, FileMetadata)
+           .join(FileMetadata, FileMetadata.file_id == File.id)
+           .filter(File.id == file_id, FileMetadata.processing_status == 'completed')
+           .order_by(FileMetadata.id.desc())
+           .first())
+    if row is None:
+        return None
+    user_id, job = row
+    results = result_store.load(job, ('transcript', 'entities'))
+    return user_id, results['transcript'], results['entities']
+
+def _transcripts(file_ids):
+    """{file_id: transcript} of the latest completed job of each file, for snippets"""
+    jobs = {}
+    for job in (FileMetadata.query
+                .filter(FileMetadata.file_id.in_(file_ids), FileMetadata.processing_status == 'completed')
+                .order_by(FileMetadata.id)):
+        jobs[job.file_id] = job
+    loaded = result_store.load_many(jobs.values(), ('transcript',))
+    return {file_id: loaded[job.id]['transcript'] for file_id, job in jobs.items()}
+
+class PostgresBackend:
+    name = 'postgres'
+
+    def ensure_schema(self):
+        # Table and GIN index come from migration 012
+        pass
+
+    def index(self, file_id):
+        row = _load_document(file_id)
+        if row is None:
+            return self.remove(file_id)
+        user_id, transcript, entities = row
+        labels = _entity_labels(entities)
+        # Entity names rank above the surrounding transcript words
+        db.session.execute(text("""
+            INSERT INTO search_document (file_id, user_id, entity_labels, document, updated_at)
+            VALUES (:file_id, :user_id, :labels,
+                    setweight(to_tsvector('english', :entities), 'A') ||
+                    setweight(to_tsvector('english', :transcript), 'B'),
+                    now())
+            ON CONFLICT (file_id) DO UPDATE SET
+                user_id = EXCLUDED.user_id, entity_labels = EXCLUDED.entity_labels,
+                document = EXCLUDED.document, updated_at = EXCLUDED.updated_at
+        """), {'file_id': file_id, 'user_id': user_id, 'labels': f" {' '.join(labels)} ",
+               'entities': _entity_text(entities), 'transcript': transcript or ''})
+        db.session.commit()
+
+    def remove(self, file_id):
+        SearchDocument.query.filter_by(file_id=file_id).delete()
+        db.session.commit()
+
+    def search(self, user_id, query, labels=(), limit=DEFAULT_LIMIT, offset=0):
+        label_filter = ''.join(f" AND d.entity_labels LIKE :label{i}" for i in range(len(labels)))
+        params = {'user_id': user_id, 'query': query, 'limit': limit, 'offset': offset}
+        params.update({f'label{i}': f'% {label} %' for i, label in enumerate(labels)})
+        # Rank over the GIN index; snippets are only built for the returned page
+        rows = db.session.execute(text(f"""
+            SELECT d.file_id, ts_rank_cd(d.document, q.query) AS rank
+            FROM search_document d, websearch_to_tsquery('english', :query) q(query)
+            WHERE d.document @@ q.query AND d.user_id = :user_id{label_filter}
+            ORDER BY rank DESC, d.file_id DESC
+            LIMIT :limit OFFSET :offset
+        """), params).all()
+        # Transcripts are compressed in the result store, so they are highlighted here
+        transcripts = _transcripts([file_id for file_id, _ in rows]) if rows else {}
+        terms = set(tokenize(query))
+        return [{'file_id': file_id, 'rank': float(rank), 'snippet': snippet(transcripts.get(file_id), terms)}
+                for file_id, rank in rows]
+
+def _fts5_query(query):
+    """Quote each term so user input cannot inject FTS5 syntax; terms are ANDed"""
+    terms = tokenize(query)
+    if not terms:
+        raise SearchError('Query has no searchable terms')
+    return ' '.join(f'"{term}"' for term in terms)
+
+class FTS5Backend:
+    name = 'fts5'
+
+    def ensure_schema(self):
+        # The rowid is the file id, so updates and deletes are point lookups
+        db.session.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+                user_id UNINDEXED, labels, entities, transcript,
+                tokenize = 'porter unicode61'
+            )
+        """))
+        db.session.commit()
+
+    def index(self, file_id):
+        row = _load_document(file_id)
+        db.session.execute(text("DELETE FROM search_fts WHERE rowid = :file_id"), {'file_id': file_id})
+        if row is not None:
+            user_id, transcript, entities = row
+            db.session.execute(text("""
+                INSERT INTO search_fts (rowid, user_id, labels, entities, transcript)
+                VALUES (:file_id, :user_id, :labels, :entities, :transcript)
+            """), {'file_id': file_id, 'user_id': user_id, 'labels': ' '.join(_entity_labels(entities)),
+                   'entities': _entity_text(entities), 'transcript': transcript or ''})
+        db.session.commit()
+
+    def remove(self, file_id):
+        db.session.execute(text("DELETE FROM search_fts WHERE rowid = :file_id"), {'file_id': file_id})
+        db.session.commit()
+
+    def search(self, user_id, query, labels=(), limit=DEFAULT_LIMIT, offset=0):
+        match = '{entities transcript} : (' + _fts5_query(query) + ')'
+        for label in labels:
+            match += f' AND labels : "{label}"'
+        # bm25 weights follow the column order; entity matches count five times
+        rows = db.session.execute(text(f"""
+            SELECT rowid, bm25(search_fts, 0, 0, 5.0, 1.0) AS rank, transcript
+            FROM search_fts
+            WHERE search_fts MATCH :match AND user_id = :user_id
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        """), {'match': match, 'user_id': user_id, 'limit': limit, 'offset': offset}).all()
+        # bm25() is lower-is-better; report higher-is-better like the other backends.
+        # FTS5's snippet() would not escape the transcript, so it is highlighted here
+        terms = set(tokenize(query))
+        return [{'file_id': int(file_id), 'rank': -float(rank), 'snippet': snippet(transcript, terms)}
+                for file_id, rank, transcript in rows]
+
+class MemoryBackend:
+    """Inverted index held in this process.
+
+    Built from the database on first use; each search first picks up files
+    completed since the last refresh, so documents indexed by other processes
+    appear too. Ranking is BM25 with entity terms weighted up.
+    """
+    name = 'memory'
+    K1 = 1.2
+    B = 0.75
+    ENTITY_WEIGHT = 5
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}
+        self.doc_length = {}
+        self.doc_user = {}
+        self.doc_labels = {}
+        self.total_length = 0
+        self.watermark = None
+        self.lock = threading.RLock()
+
+    def ensure_schema(self):
+        pass
+
+    def _add(self, file_id, user_id, transcript, entities):
+        counts = Counter(tokenize(transcript))
+        for term in tokenize(_entity_text(entities)):
+            counts[term] += self.ENTITY_WEIGHT
+        self._drop(file_id)
+        for term, count in counts.items():
+            self.postings[term][file_id] = count
+        length = sum(counts.values())
+        self.doc_terms[file_id] = list(counts)
+        self.doc_length[file_id] = length
+        self.doc_user[file_id] = user_id
+        self.doc_labels[file_id] = set(_entity_labels(entities))
+        self.total_length += length
+
+    def _drop(self, file_id):
+        for term in self.doc_terms.pop(file_id, ()):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(file_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.doc_length.pop(file_id, 0)
+        self.doc_user.pop(file_id, None)
+        self.doc_labels.pop(file_id, None)
+
+    def refresh(self):
+        """Index files completed since the last refresh"""
+        query = (db.session.query(File.user_id, FileMetadata)
+                 .join(FileMetadata, FileMetadata.file_id == File.id)
+                 .filter(FileMetadata.processing_status == 'completed'))
+        with self.lock:
+            if self.watermark is not None:
+                # >= so rows sharing the watermark's timestamp are not missed; re-adding is idempotent
+                query = query.filter(FileMetadata.processing_completed_at >= self.watermark)
+            rows = query.order_by(FileMetadata.id).all()
+            # Heavy results are loaded per chunk of jobs, one query each
+            for chunk in range(0, len(rows), REFRESH_CHUNK):
+                page = rows[chunk:chunk + REFRESH_CHUNK]
+                loaded = result_store.load_many([job for _, job in page], ('transcript', 'entities'))
+                for user_id, job in page:
+                    results = loaded[job.id]
+                    self._add(job.file_id, user_id, results['transcript'], results['entities'])
+                    completed_at = job.processing_completed_at
+                    if completed_at and (self.watermark is None or completed_at > self.watermark):
+                        self.watermark = completed_at
+
+    def index(self, file_id):
+        row = _load_document(file_id)
+        with self.lock:
+            if row is None:
+                self._drop(file_id)
+            else:
+                self._add(file_id, *row)
+
+    def remove(self, file_id):
+        with self.lock:
+            self._drop(file_id)
+
+    def search(self, user_id, query, labels=(), limit=DEFAULT_LIMIT, offset=0):
+        terms = set(tokenize(query))
+        if not terms:
+            raise SearchError('Query has no searchable terms')
+        self.refresh()
+        with self.lock:
+            n_docs = len(self.doc_length) or 1
+            avg_length = self.total_length / n_docs or 1
+            # All terms must match; start from the rarest term's postings
+            postings = sorted((self.postings.get(term, {}) for term in terms), key=len)
+            candidates = [file_id for file_id in postings[0]
+                          if self.doc_user.get(file_id) == user_id
+                          and all(file_id in p for p in postings[1:])
+                          and self.doc_labels.get(file_id, set()).issuperset(labels)]
+            scores = []
+            for file_id in candidates:
+                score = 0.0
+                norm = self.K1 * (1 - self.B + self.B * self.doc_length[file_id] / avg_length)
+                for p in postings:
+                    tf = p[file_id]
+                    idf = math.log(1 + (n_docs - len(p) + 0.5) / (len(p) + 0.5))
+                    score += idf * tf * (self.K1 + 1) / (tf + norm)
+                scores.append((score, file_id))
+        scores.sort(reverse=True)
+        page = scores[offset:offset + limit]
+        transcripts = _transcripts([file_id for _, file_id in page]) if page else {}
+        return [{'file_id': file_id, 'rank': round(score, 4), 'snippet': snippet(transcripts.get(file_id), terms)}
+                for score, file_id in page]
+
+def snippet(transcript, terms, words=SNIPPET_WORDS):
+    """HTML for a window of words around the first matching term, matches wrapped in <mark>.
+
+    Transcripts of text files are user-supplied, so every word is escaped.
+    """
+    tokens = (transcript or '').split()
+    lowered = [' '.join(tokenize(token)) for token in tokens]
+    hit = next((i for i, token in enumerate(lowered) if token in terms), 0)
+    start = max(hit - words // 2, 0)
+    window = [html.escape(token) for token in tokens[start:start + words]]
+    marked = [f'<mark>{token}</mark>' if lowered[start + i] in terms else token for i, token in enumerate(window)]
+    return ('…' if start > 0 else '') + ' '.join(marked) + ('…' if start + words < len(tokens) else '')
+
+def index_file(file_id, backend='auto'):
+    """(Re)index one file after processing; search problems never fail the job"""
+    try:
+        get_backend(backend).index(file_id)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Could not index file {file_id} for search: {e}")
+
+def discard_document(file_id):
+    """Delete a file's stored search document in the caller's transaction, whatever the backend"""
+    SearchDocument.query.filter_by(file_id=file_id).delete(synchronize_session=False)
+
+def remove_file(file_id, backend='auto'):
+    try:
+        get_backend(backend).remove(file_id)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Could not remove file {file_id} from the search index: {e}")
+
+def search(user_id, query, labels=(), limit=DEFAULT_LIMIT, offset=0, backend='auto'):
+    """Ranked matches for a user's query as [{'file_id', 'rank', 'snippet'}]"""
+    if not (query or '').strip():
+        raise SearchError('Query is required')
+    labels = [label.upper() for label in labels]
+    _check_labels(labels)
+    return get_backend(backend).search(user_id, query, labels, min(max(limit, 1), MAX_LIMIT), max(offset, 0))
+
+def reindex_all(backend='auto'):
+    """Index every completed file, e.g. after enabling search on an existing database"""
+    file_ids = [file_id for (file_id,) in
+                db.session.query(FileMetadata.file_id).filter(FileMetadata.processing_status == 'completed')]
+    for file_id in file_ids:
+        index_file(file_id, backend)
+    return len(file_ids)
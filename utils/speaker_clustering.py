@@ -0,0 +1,142 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 'sample' is the default: near-agglomerative quality at linear cost
+METHODS = ('segment', 'minibatch', 'sample', 'dbscan')
+DEFAULT_METHOD = 'sample'
+DEFAULT_MAX_SPEAKERS = 8
+# Points used for the quadratic parts (speaker-count estimate, agglomerative fit);
+# larger is more accurate, smaller is faster
+DEFAULT_SAMPLE_SIZE = 2000
+# Silhouette below this means one speaker explains the audio as well as several
+MIN_SILHOUETTE = 0.1
+ASSIGN_BLOCK = 65536
+
+class ClusteringError(Exception):
+    """Custom exception for speaker clustering errors"""
+    pass
+
+def _sample(embeddings, size, seed=0):
+    if len(embeddings) <= size:
+        return embeddings
+    rng = np.random.default_rng(seed)
+    return embeddings[np.sort(rng.choice(len(embeddings), size, replace=False))]
+
+def estimate_speaker_count(embeddings, max_speakers=DEFAULT_MAX_SPEAKERS, sample_size=DEFAULT_SAMPLE_SIZE):
+    """Pick the speaker count with the best silhouette score on a bounded sample"""
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    sample = _sample(embeddings, sample_size)
+    best_k, best_score = 1, MIN_SILHOUETTE
+    for k in range(2, min(max_speakers, len(sample) - 1) + 1):
+        labels = KMeans(n_clusters=k, n_init=3, random_state=0).fit_predict(sample)
+        if len(set(labels)) < 2:
+            continue
+        score = silhouette_score(sample, labels)
+        if score > best_score:
+            best_k, best_score = k, score
+    return best_k
+
+def assign_nearest(embeddings, centroids):
+    """Label every point with its nearest centroid, in bounded blocks"""
+    labels = np.empty(len(embeddings), dtype=np.int64)
+    c_sq = (centroids ** 2).sum(axis=1)
+    for start in range(0, len(embeddings), ASSIGN_BLOCK):
+        block = embeddings[start:start + ASSIGN_BLOCK]
+        # |x - c|^2 without the constant |x|^2 term
+        labels[start:start + ASSIGN_BLOCK] = np.argmin(c_sq[None, :] - 2.0 * block @ centroids.T, axis=1)
+    return labels
+
+def _centroids(embeddings, labels):
+    ids = np.unique(labels)
+    return np.stack([embeddings[labels == i].mean(axis=0) for i in ids])
+
+def change_points(embeddings, window=8, threshold=None):
+    """Split a sequence of embeddings where the mean of the next window differs
+    sharply from the previous one. Returns segment boundaries as index pairs.
+    """
+    n = len(embeddings)
+    if n < 2 * window:
+        return np.array([[0, n]])
+    cumsum = np.vstack([np.zeros((1, embeddings.shape[1])), np.cumsum(embeddings, axis=0)])
+    idx = np.arange(window, n - window + 1)
+    left = (cumsum[idx] - cumsum[idx - window]) / window
+    right = (cumsum[idx + window] - cumsum[idx]) / window
+    distance = np.linalg.norm(right - left, axis=1)
+    if threshold is None:
+        threshold = distance.mean() + distance.std()
+    # Local maxima above the threshold, at least one window apart
+    is_peak = (distance > threshold)
+    is_peak[1:-1] &= (distance[1:-1] >= distance[:-2]) & (distance[1:-1] >= distance[2:])
+    peaks = idx[is_peak]
+    boundaries = []
+    last = 0
+    for p in peaks:
+        if p - last >= window:
+            boundaries.append(p)
+            last = p
+    edges = np.concatenate(([0], boundaries, [n]))
+    return np.stack([edges[:-1], edges[1:]], axis=1)
+
+def cluster_segments(embeddings, n_speakers, window=8, sample_size=DEFAULT_SAMPLE_SIZE):
+    """Cluster change-point segments by their mean embedding, then expand to points"""
+    from sklearn.cluster import AgglomerativeClustering
+
+    segments = change_points(embeddings, window)
+    cumsum = np.vstack([np.zeros((1, embeddings.shape[1])), np.cumsum(embeddings, axis=0)])
+    lengths = segments[:, 1] - segments[:, 0]
+    seg_embeddings = (cumsum[segments[:, 1]] - cumsum[segments[:, 0]]) / lengths[:, None]
+    if len(segments) <= n_speakers:
+        seg_labels = np.arange(len(segments))
+    elif len(segments) > sample_size:
+        # Noisy input can produce many short segments; keep the cost bounded
+        seg_labels = cluster_sample(seg_embeddings, n_speakers, sample_size)
+    else:
+        seg_labels = AgglomerativeClustering(n_clusters=n_speakers, linkage='ward').fit_predict(seg_embeddings)
+    return np.repeat(seg_labels, lengths)
+
+def cluster_minibatch(embeddings, n_speakers):
+    from sklearn.cluster import MiniBatchKMeans
+    return MiniBatchKMeans(n_clusters=n_speakers, batch_size=1024, n_init=3,
+                           random_state=0).fit_predict(embeddings)
+
+def cluster_sample(embeddings, n_speakers, sample_size=DEFAULT_SAMPLE_SIZE):
+    """Agglomerative clustering on a sample, nearest-centroid assignment for the rest"""
+    from sklearn.cluster import AgglomerativeClustering
+
+    sample = _sample(embeddings, sample_size)
+    labels = AgglomerativeClustering(n_clusters=n_speakers, linkage='ward').fit_predict(sample)
+    return assign_nearest(embeddings, _centroids(sample, labels))
+
+def cluster_dbscan(embeddings, eps=3.0, min_samples=5):
+    # Quadratic in the worst case; only sensible for short recordings
+    from sklearn.cluster import DBSCAN
+    return DBSCAN(eps=eps, min_samples=min_samples).fit(embeddings).labels_
+
+def cluster_speakers(embeddings, method=DEFAULT_METHOD, max_speakers=DEFAULT_MAX_SPEAKERS,
+                     sample_size=DEFAULT_SAMPLE_SIZE):
+    """Assign a speaker label to each embedding using the chosen backend.
+
+    Every backend except 'dbscan' scales linearly in the number of embeddings;
+    sample_size bounds the quadratic work and is the accuracy/speed knob.
+    """
+    method = method or DEFAULT_METHOD
+    if method not in METHODS:
+        raise ClusteringError(f"Unknown diarization method '{method}', expected one of {METHODS}")
+    if len(embeddings) < 2:
+        return np.zeros(len(embeddings), dtype=np.int64)
+    if method == 'dbscan':
+        return cluster_dbscan(embeddings)
+
+    n_speakers = estimate_speaker_count(embeddings, max_speakers, sample_size)
+    logger.info(f"Estimated {n_speakers} speakers from {len(embeddings)} embeddings ({method})")
+    if n_speakers == 1:
+        return np.zeros(len(embeddings), dtype=np.int64)
+    if method == 'segment':
+        return cluster_segments(embeddings, n_speakers, sample_size=sample_size)
+    if method == 'minibatch':
+        return cluster_minibatch(embeddings, n_speakers)
+    return cluster_sample(embeddings, n_speakers, sample_size)
@@ -1,19 +1,58 @@
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-import spacy
+import re
+import logging
+from utils import model_registry
 
-nltk.download('vader_lexicon')
-sia = SentimentIntensityAnalyzer()
+logger = logging.getLogger(__name__)
 
-try:
-    nlp = spacy.load('en_core_web_sm')
-except OSError:
-    # Fallback to small pipeline if model is not available
-    nlp = spacy.blank('en')
+# nltk and spaCy are imported by the loaders below, on first use in the
+# process that runs the analysis, never when this module is imported
+
+def _load_sentiment():
+    import nltk
+    from nltk.sentiment import SentimentIntensityAnalyzer
+    try:
+        nltk.data.find('sentiment/vader_lexicon.zip')
+    except LookupError:
+        # Only download when the lexicon is not installed yet
+        nltk.download('vader_lexicon', quiet=True)
+    return SentimentIntensityAnalyzer()
+
+def _load_ner():
+    import spacy
+    try:
+        return spacy.load('en_core_web_sm')
+    except OSError:
+        # Fallback to small pipeline if model is not available
+        return spacy.blank('en')
+
+model_registry.register('sentiment', _load_sentiment)
+model_registry.register('ner', _load_ner)
+
+# Only these components feed the entity recognizer; tagging, parsing and
+# lemmatization are skipped during NER
+NER_PIPES = ('tok2vec', 'ner')
+NER_BATCH_SIZE = 64
+# Long texts are split into chunks of about this many characters so memory
+# stays flat and chunks of one document are batched like separate documents
+NER_CHUNK_CHARS = 20000
+_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n+')
+# A sentence: text up to and including terminal punctuation, or up to a line break
+_SENTENCE = re.compile(r'[^.!?\n]+(?:[.!?]+|$)', re.MULTILINE)
+# Plain text is reported as one series point per window of about this many characters
+SENTIMENT_WINDOW_CHARS = 2000
+SENTIMENT_KEYS = ('neg', 'neu', 'pos', 'compound')
+# Bump when a change to this module alters sentiment or entity output,
+# so cached results are recomputed (see utils/result_cache.py)
+SENTIMENT_VERSION = 1
+NER_VERSION = 1
+
+def read_text_file(file_path):
+    with open(file_path, 'r') as f:
+        return f.read()
 
 def analyze_sentiment(text):
     try:
-        return sia.polarity_scores(text)
+        return model_registry.get('sentiment').polarity_scores(text)
     except Exception as e:
         print(f"Error analyzing sentiment: {e}")
         return {
@@ -23,18 +62,160 @@ def analyze_sentiment(text):
             'compound': 0
         }
 
-def extract_entities(text):
+def iter_sentences(text, start=0, end=None):
+    """Yield (start, end) character spans of the sentences in text[start:end], lazily"""
+    for match in _SENTENCE.finditer(text, start, len(text) if end is None else end):
+        if match.group().strip():
+            yield match.start(), match.end()
+
+class SentimentAggregate:
+    """Running length-weighted means of VADER scores.
+
+    Each sentence counts in proportion to its word count, so a long passage
+    outweighs a one-word interjection. Only sums are kept, never the text.
+    """
+    def __init__(self):
+        self.weight = 0
+        self.sums = dict.fromkeys(SENTIMENT_KEYS, 0.0)
+        self.sentences = 0
+        self.min = None
+        self.max = None
+
+    def add(self, scores, weight):
+        self.weight += weight
+        self.sentences += 1
+        for key in SENTIMENT_KEYS:
+            self.sums[key] += scores[key] * weight
+        compound = scores['compound']
+        self.min = compound if self.min is None else min(self.min, compound)
+        self.max = compound if self.max is None else max(self.max, compound)
+
+    def merge(self, other):
+        if not other.sentences:
+            return
+        self.weight += other.weight
+        self.sentences += other.sentences
+        for key in SENTIMENT_KEYS:
+            self.sums[key] += other.sums[key]
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def summary(self):
+        means = {key: round(self.sums[key] / self.weight, 4) if self.weight else 0 for key in SENTIMENT_KEYS}
+        means.update(sentences=self.sentences, words=self.weight,
+                     min=self.min or 0, max=self.max or 0)
+        return means
+
+def _score_spans(analyzer, text, spans, aggregate):
+    for start, end in spans:
+        sentence = text[start:end]
+        aggregate.add(analyzer.polarity_scores(sentence), max(len(sentence.split()), 1))
+
+def _series_point(aggregate, start, end):
+    point = {'start': start, 'end': end}
+    point.update({key: value for key, value in aggregate.summary().items() if key in SENTIMENT_KEYS})
+    return point
+
+def sentiment_series_text(text, window_chars=SENTIMENT_WINDOW_CHARS):
+    """Sentence-level sentiment over plain text.
+
+    Sentences are scored as they are found and folded into windows of about
+    window_chars characters; the series holds one point per window, with
+    character offsets. Returns the length-weighted summary plus 'series'.
+    """
+    analyzer = model_registry.get('sentiment')
+    total = SentimentAggregate()
+    series = []
+    window, window_start, window_end = SentimentAggregate(), None, 0
+    for start, end in iter_sentences(text or ''):
+        if window_start is not None and end - window_start > window_chars:
+            series.append(_series_point(window, window_start, window_end))
+            total.merge(window)
+            window, window_start = SentimentAggregate(), None
+        if window_start is None:
+            window_start = start
+        _score_spans(analyzer, text, ((start, end),), window)
+        window_end = end
+    if window_start is not None:
+        series.append(_series_point(window, window_start, window_end))
+        total.merge(window)
+    result = total.summary()
+    result['series'] = series
+    return result
+
+def sentiment_series_segments(segments):
+    """Sentence-level sentiment over timed transcript segments.
+
+    Each segment's sentences are scored and the segment becomes one series
+    point with its start and end in seconds. Returns the length-weighted
+    summary plus 'series'.
+    """
+    analyzer = model_registry.get('sentiment')
+    total = SentimentAggregate()
+    series = []
+    for segment in segments or ():
+        text = segment.get('text') or ''
+        aggregate = SentimentAggregate()
+        _score_spans(analyzer, text, iter_sentences(text), aggregate)
+        if aggregate.sentences:
+            series.append(_series_point(aggregate, segment['start'], segment['end']))
+            total.merge(aggregate)
+    result = total.summary()
+    result['series'] = series
+    return result
+
+def chunk_text(text, max_chars=NER_CHUNK_CHARS):
+    """Yield (offset, chunk) pieces of at most about max_chars characters.
+
+    Cuts fall on sentence ends or newlines where possible, so an entity is
+    rarely split; a run with no boundary at all is cut on whitespace.
+    """
+    start = 0
+    while len(text) - start > max_chars:
+        window = text[start:start + max_chars]
+        cut = None
+        for match in _BOUNDARY.finditer(window, max_chars // 2):
+            cut = match.end()
+        if cut is None:
+            space = window.rfind(' ', max_chars // 2)
+            cut = space + 1 if space > 0 else max_chars
+        yield start, window[:cut]
+        start += cut
+    if start < len(text) or start == 0:
+        yield start, text[start:]
+
+def extract_entities_batch(texts, batch_size=NER_BATCH_SIZE, n_process=1):
+    """Named entities for many texts in one nlp.pipe pass.
+
+    Texts are streamed through the pipeline as chunks, with entity offsets
+    shifted back to positions in the original text. Returns one entity list
+    per text, in order. Any failure is raised for the whole batch.
+    """
+    results = [[] for _ in texts]
+
+    def chunks():
+        for index, text in enumerate(texts):
+            for offset, chunk in chunk_text(text or ''):
+                yield chunk, (index, offset)
+
     try:
-        doc = nlp(text)
-        entities = []
-        for ent in doc.ents:
-            entities.append({
-                'text': ent.text,
-                'label': ent.label_,
-                'start': ent.start_char,
-                'end': ent.end_char
-            })
-        return entities
+        nlp = model_registry.get('ner')
+        with nlp.select_pipes(enable=[name for name in NER_PIPES if name in nlp.pipe_names]):
+            for doc, (index, offset) in nlp.pipe(chunks(), as_tuples=True,
+                                                 batch_size=batch_size, n_process=n_process):
+                for ent in doc.ents:
+                    results[index].append({
+                        'text': ent.text,
+                        'label': ent.label_,
+                        'start': ent.start_char + offset,
+                        'end': ent.end_char + offset
+                    })
+        return results
     except Exception as e:
-        print(f"Error extracting entities: {e}")
-        return []
+        # Raised, not reported as "no entities": the stage fails and is retried
+        # by the queue instead of an empty result being cached under NER_VERSION
+        logger.error(f"Error extracting entities for {len(texts)} texts: {e}")
+        raise
+
+def extract_entities(text):
+    return extract_entities_batch([text])[0]
@@ -0,0 +1,364 @@
+import os
+import json
+import hashlib
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = 'manifest.json'
+ASSEMBLY_LOCK_FILENAME = '.assembly.lock'
+# In-place uploads write every chunk straight into this file at its offset
+DATA_FILENAME = 'data'
+RECEIVE_BUFFER_SIZE = 1024 * 1024
+# A running hash untouched this long belongs to an abandoned upload, or to one
+# another process finished; dropping it only costs a full read at assembly
+FILE_HASH_MAX_IDLE_SECONDS = 3600
+
+class ManifestError(Exception):
+    """Custom exception for upload manifest errors"""
+    pass
+
+class _FileHash:
+    """SHA-256 of an upload's chunks 0..next_chunk-1, kept in memory while the upload runs"""
+    def __init__(self, nonce):
+        # Nonce of the manifest this hash belongs to; an upload id can be
+        # reused once the previous upload under it was discarded
+        self.nonce = nonce
+        self.touched = time.monotonic()
+        self.hasher = hashlib.sha256()
+        self.next_chunk = 0
+        # Chunk whose bytes are currently fed to a copy of hasher as they stream in
+        self.streaming = None
+        # Set when a chunk could not be read back; the caller then hashes the assembled file
+        self.failed = False
+        self.lock = threading.Lock()
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+def _atomic_write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{id(data)}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _chunk_record_path(temp_dir, chunk_number):
+    return os.path.join(temp_dir, f'chunk_{chunk_number}.json')
+
+def data_path(temp_dir):
+    return os.path.join(temp_dir, DATA_FILENAME)
+
+def chunk_extent(manifest, chunk_number):
+    """(offset, length) of a chunk inside the file for an in-place upload"""
+    offset = chunk_number * manifest['chunk_size']
+    return offset, min(manifest['chunk_size'], manifest['file_size'] - offset)
+
+def open_manifest(temp_dir, filename, total_chunks, file_size, user_id, chunk_size=None):
+    """Create the manifest for an upload, or validate it against an existing one.
+
+    The first request to arrive wins; concurrent requests for the same upload
+    must agree on the file description or they are rejected. A chunk_size marks
+    an in-place upload, so the two upload modes can never mix.
+    """
+    os.makedirs(temp_dir, exist_ok=True)
+    path = os.path.join(temp_dir, MANIFEST_FILENAME)
+    manifest = {
+        'filename': filename,
+        'total_chunks': total_chunks,
+        'file_size': file_size,
+        'user_id': user_id,
+        'chunk_size': chunk_size,
+        'nonce': uuid.uuid4().hex,
+        'created_at': datetime.utcnow().isoformat()
+    }
+    # Write a private copy, then link it into place: link() fails if another
+    # request got there first and readers never see a half-written manifest
+    tmp_path = f'{path}.{os.getpid()}.{id(manifest)}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    try:
+        os.link(tmp_path, path)
+        return manifest
+    except FileExistsError:
+        existing = read_manifest(temp_dir)
+        if existing is None:
+            raise ManifestError("Upload manifest is unreadable")
+        for key in ('filename', 'total_chunks', 'file_size', 'user_id', 'chunk_size'):
+            if existing.get(key) != manifest[key]:
+                raise ManifestError(f"Chunk does not match upload manifest ({key})")
+        return existing
+    finally:
+        os.remove(tmp_path)
+
+def read_manifest(temp_dir):
+    try:
+        with open(os.path.join(temp_dir, MANIFEST_FILENAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _file_hash(temp_dir, nonce, create=False):
+    """The running hash of the upload whose manifest carries nonce.
+
+    A hash this process kept for an earlier upload under the same temp dir is
+    dropped rather than returned, and creating one also drops hashes that
+    have been idle for FILE_HASH_MAX_IDLE_SECONDS.
+    """
+    now = time.monotonic()
+    with _file_hashes_lock:
+        state = _file_hashes.get(temp_dir)
+        if state is not None and state.nonce != nonce:
+            del _file_hashes[temp_dir]
+            state = None
+        if state is None and create and nonce is not None:
+            for path, other in list(_file_hashes.items()):
+                if now - other.touched > FILE_HASH_MAX_IDLE_SECONDS:
+                    del _file_hashes[path]
+            state = _file_hashes[temp_dir] = _FileHash(nonce)
+        if state is not None:
+            state.touched = now
+        return state
+
+def _begin_inline_hash(temp_dir, manifest, chunk_number):
+    """Copy of the whole-file hasher to feed this chunk into while it streams, or None if it is not next"""
+    state = _file_hash(temp_dir, manifest.get('nonce'), create=True)
+    if state is None:
+        return None
+    with state.lock:
+        if state.failed or state.next_chunk != chunk_number or state.streaming is not None:
+            return None
+        state.streaming = chunk_number
+        return state.hasher.copy()
+
+def _abort_inline_hash(temp_dir, manifest, chunk_number, inline_hasher):
+    if inline_hasher is None:
+        return
+    state = _file_hash(temp_dir, manifest.get('nonce'))
+    if state is None:
+        return
+    with state.lock:
+        if state.streaming == chunk_number:
+            state.streaming = None
+
+def _hash_chunk_from_disk(temp_dir, manifest, chunk_number, hasher):
+    """Feed a recorded chunk into hasher; it was written moments ago, so this reads page cache"""
+    if manifest.get('chunk_size'):
+        offset, length = chunk_extent(manifest, chunk_number)
+        path = data_path(temp_dir)
+    else:
+        offset, length = 0, None
+        path = os.path.join(temp_dir, f'chunk_{chunk_number}')
+    with open(path, 'rb', buffering=0) as f:
+        f.seek(offset)
+        remaining = length
+        while remaining is None or remaining > 0:
+            data = f.read(RECEIVE_BUFFER_SIZE if remaining is None else min(RECEIVE_BUFFER_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            if remaining is not None:
+                remaining -= len(data)
+
+def _advance_file_hash(temp_dir, manifest, chunk_number, inline_hasher):
+    """Extend the whole-file hash past a chunk that was just recorded.
+
+    A chunk that was next in order was hashed while it streamed in, so its
+    bytes are only touched once. Chunks that arrived ahead of a gap are
+    hashed from disk as soon as the gap closes.
+    """
+    state = _file_hash(temp_dir, manifest.get('nonce'))
+    if state is None:
+        # Already taken by assembly
+        return
+    with state.lock:
+        if inline_hasher is not None and state.streaming == chunk_number:
+            state.streaming = None
+            if state.next_chunk == chunk_number:
+                state.hasher = inline_hasher
+                state.next_chunk += 1
+        try:
+            while (not state.failed and state.streaming != state.next_chunk
+                   and os.path.exists(_chunk_record_path(temp_dir, state.next_chunk))):
+                _hash_chunk_from_disk(temp_dir, manifest, state.next_chunk, state.hasher)
+                state.next_chunk += 1
+        except OSError as e:
+            logger.warning(f"Could not hash chunk {state.next_chunk} of {os.path.basename(temp_dir)}: {e}")
+            state.failed = True
+
+def take_file_hash(temp_dir, total_chunks):
+    """Hex SHA-256 of a complete upload as hashed during receipt, or None if it has to be computed.
+
+    None when this process did not see the upload from its first chunk in
+    order, e.g. after a restart; the caller then hashes the assembled file.
+    A hash kept for an earlier upload under the same temp dir never matches
+    the current manifest's nonce, so it is never returned.
+    """
+    manifest = read_manifest(temp_dir)
+    with _file_hashes_lock:
+        state = _file_hashes.pop(temp_dir, None)
+    if state is None or manifest is None or state.nonce != manifest.get('nonce'):
+        return None
+    with state.lock:
+        return state.hasher.hexdigest() if not state.failed and state.next_chunk == total_chunks else None
+
+def forget_file_hash(temp_dir):
+    with _file_hashes_lock:
+        _file_hashes.pop(temp_dir, None)
+
+def receive_chunk(temp_dir, chunk_number, stream, manifest, expected_checksum=None):
+    """Stream one chunk to disk, hashing it on the way, then record it in the manifest.
+
+    The chunk only becomes visible under its final name after it has been fully
+    written, so a dropped connection never leaves a truncated chunk behind.
+    """
+    final_path = os.path.join(temp_dir, f'chunk_{chunk_number}')
+    tmp_path = f'{final_path}.{os.getpid()}.{threading.get_ident()}.part'
+    digest = hashlib.sha256()
+    file_hasher = _begin_inline_hash(temp_dir, manifest, chunk_number)
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as out:
+            while True:
+                data = stream.read(RECEIVE_BUFFER_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+                if file_hasher is not None:
+                    file_hasher.update(data)
+                out.write(data)
+                size += len(data)
+    except Exception:
+        _abort_inline_hash(temp_dir, manifest, chunk_number, file_hasher)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    checksum = digest.hexdigest()
+    if expected_checksum and expected_checksum.lower() != checksum:
+        _abort_inline_hash(temp_dir, manifest, chunk_number, file_hasher)
+        os.remove(tmp_path)
+        raise ManifestError(f"Checksum mismatch for chunk {chunk_number}")
+
+    os.replace(tmp_path, final_path)
+    record = {'size': size, 'sha256': checksum}
+    _atomic_write_json(_chunk_record_path(temp_dir, chunk_number), record)
+    _advance_file_hash(temp_dir, manifest, chunk_number, file_hasher)
+    return record
+
+def _preallocate(fd, file_size):
+    # Only the first chunk to arrive pays for this; later ones see the full size
+    if os.fstat(fd).st_size >= file_size:
+        return
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, file_size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, file_size)
+
+def receive_chunk_at(temp_dir, chunk_number, stream, manifest, expected_checksum=None):
+    """Stream one chunk straight into the upload's data file at its offset, then record it.
+
+    The data file is preallocated to the full file size, so chunks can land in
+    any order and in parallel, and assembly has nothing left to copy. The chunk
+    record is only written once every byte is in place and the checksum
+    matched; a dropped or rejected chunk leaves no record and its range is
+    simply overwritten by the retry. A chunk that is next in file order is
+    also fed into the whole-file hash as it streams, so assembly does not
+    have to read the file again.
+    """
+    offset, length = chunk_extent(manifest, chunk_number)
+    digest = hashlib.sha256()
+    file_hasher = _begin_inline_hash(temp_dir, manifest, chunk_number)
+    size = 0
+    try:
+        fd = os.open(data_path(temp_dir), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            _preallocate(fd, manifest['file_size'])
+            while True:
+                # Read one byte past the chunk so an oversized body is detected
+                data = stream.read(min(RECEIVE_BUFFER_SIZE, length - size + 1))
+                if not data:
+                    break
+                if size + len(data) > length:
+                    raise ManifestError(f"Chunk {chunk_number} is larger than {length} bytes")
+                digest.update(data)
+                if file_hasher is not None:
+                    file_hasher.update(data)
+                view = memoryview(data)
+                while view:
+                    written = os.pwrite(fd, view, offset + size)
+                    view = view[written:]
+                    size += written
+        finally:
+            os.close(fd)
+
+        if size != length:
+            raise ManifestError(f"Chunk {chunk_number} is incomplete ({size} of {length} bytes)")
+        checksum = digest.hexdigest()
+        if expected_checksum and expected_checksum.lower() != checksum:
+            raise ManifestError(f"Checksum mismatch for chunk {chunk_number}")
+    except Exception:
+        _abort_inline_hash(temp_dir, manifest, chunk_number, file_hasher)
+        raise
+
+    record = {'size': size, 'sha256': checksum}
+    _atomic_write_json(_chunk_record_path(temp_dir, chunk_number), record)
+    _advance_file_hash(temp_dir, manifest, chunk_number, file_hasher)
+    return record
+
+def received_chunks(temp_dir):
+    """Return {chunk_number: {'size', 'sha256'}} for every chunk fully on disk"""
+    chunks = {}
+    try:
+        names = os.listdir(temp_dir)
+    except FileNotFoundError:
+        return chunks
+    for name in names:
+        if not (name.startswith('chunk_') and name.endswith('.json')):
+            continue
+        try:
+            chunk_number = int(name[len('chunk_'):-len('.json')])
+            with open(os.path.join(temp_dir, name)) as f:
+                chunks[chunk_number] = json.load(f)
+        except (ValueError, OSError):
+            continue
+    return chunks
+
+def missing_chunks(temp_dir, total_chunks):
+    received = received_chunks(temp_dir)
+    return [i for i in range(total_chunks) if i not in received]
+
+def claim_assembly(temp_dir):
+    """Return True for exactly one caller once all chunks are present"""
+    try:
+        fd = os.open(os.path.join(temp_dir, ASSEMBLY_LOCK_FILENAME),
+                     os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    return True
+
+def assembly_claimed(temp_dir):
+    return os.path.exists(os.path.join(temp_dir, ASSEMBLY_LOCK_FILENAME))
+
+def manifest_summary(temp_dir):
+    """Client-facing view of an upload, used to resume after a dropped connection"""
+    manifest = read_manifest(temp_dir)
+    if manifest is None:
+        return None
+    received = received_chunks(temp_dir)
+    return {
+        'filename': manifest['filename'],
+        'totalChunks': manifest['total_chunks'],
+        'fileSize': manifest['file_size'],
+        'receivedChunks': sorted(received),
+        'missingChunks': [i for i in range(manifest['total_chunks']) if i not in received],
+        'receivedBytes': sum(c['size'] for c in received.values()),
+        'chunks': {str(k): v for k, v in sorted(received.items())}
+    }
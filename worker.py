@@ -0,0 +1,22 @@
+import os
+import threading
+from app import create_app
+from routes.processing import process_queue, make_worker_id, configure_pools
+
+# Dedicated queue worker: `python worker.py`. Run as many of these as needed;
+# they all drain the same database-backed queue.
+app = create_app()
+
+if __name__ == "__main__":
+    configure_pools(app)
+    threads = []
+    for index in range(int(os.environ.get('WORKER_THREADS', max(app.config['PROCESSING_POOL_SIZE'], 1)))):
+        thread = threading.Thread(
+            target=process_queue,
+            args=(app, make_worker_id(index)),
+            name=f'processor_{index}'
+        )
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()